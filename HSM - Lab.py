@@ -9,6 +9,7 @@ sg.set_global_icon(icon=icon80)
 #################################################
 import re
 import pyperclip
+from lab_normalize import LAB_TERM_RULES, Normalizer, remap
 
 # Universal numeric patterns:
 # For hematology/chemistry values: 1 to 6 digits, optionally with a comma/dot and 1 to 3 decimals.
@@ -68,9 +69,13 @@ def extract_exam(label, lines):
     return ""
 
 
+# Urea rule from the shared table, abbreviated to "U" as this parser expects.
+normalize_chrome_terms = Normalizer(remap(LAB_TERM_RULES, {"Ureia": "U"}))
+
+
 def parse_lab_report_chrome(text):
     # Preprocess: Replace any occurrence of "Uréia" (or "Ureia") with "U"
-    text = re.sub(r"(?i)ur[eé]ia", "U", text)
+    text = normalize_chrome_terms(text)
 
     # Split text into nonempty, stripped lines.
     lines = [line.strip() for line in text.splitlines() if line.strip()]
@@ -1,17 +1,64 @@
+import time
+_STARTUP_T0 = time.perf_counter()
 import streamlit as st
 import re
+import sys
 import json
+import os
 import io
 import hashlib
+import importlib
+import math
+import datetime
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import nullcontext
 import streamlit.components.v1 as components
-from dateutil import parser as date_parser
-from PIL import Image
-from streamlit_paste_button import paste_image_button as pbutton
-import google.generativeai as genai 
-from google.api_core.exceptions import ResourceExhausted 
+_STARTUP_IMPORTS_MS = {"streamlit": (time.perf_counter() - _STARTUP_T0) * 1000}
+_STARTUP_T0 = time.perf_counter()
+from clipdoc_core import (ALERTA_CRITICO, PATTERNS, REFERENCE_RANGE_SETS, LabTrendStore, ParseCache, ParseProfile,
+                          anonimizar_texto, parse_lab_report, parse_lab_report_stream, parse_lab_report_structured)
+_STARTUP_IMPORTS_MS["clipdoc_core"] = (time.perf_counter() - _STARTUP_T0) * 1000
+from model_router import ModelRoute, ModelRouter
+from response_cache import ResponseCache
+
+# --- Dependências Opcionais (carregadas no primeiro uso) ---
+# Gemini, PIL e o botão de colar só são importados pela função que precisa deles,
+# então quem usa só a aba de exames não paga o custo de importação.
+OPTIONAL_DEPENDENCIES = ["google.generativeai", "google.api_core.exceptions", "PIL.Image",
+                         "streamlit_paste_button", "dateutil.parser"]
+
+@st.cache_resource(show_spinner=False)
+def get_import_costs():
+    """Import time (ms) per dependency for the whole process; the script itself re-runs on every interaction."""
+    return {"inicialização": OrderedDict(), "sob demanda": OrderedDict()}
+
+def lazy_import(module_name):
+    """Import `module_name` on first use, recording how long the import took."""
+    module = sys.modules.get(module_name)
+    if module is None:
+        t0 = time.perf_counter()
+        module = importlib.import_module(module_name)
+        get_import_costs()["sob demanda"][module_name] = (time.perf_counter() - t0) * 1000
+    return module
+
+def import_cost_report():
+    """Rows for the debug panel: eager imports of the first run, then each optional dependency."""
+    costs = get_import_costs()
+    rows = [{"modulo": name, "quando": "inicialização", "ms": round(ms, 1)}
+            for name, ms in costs["inicialização"].items()]
+    for name in OPTIONAL_DEPENDENCIES:
+        ms = costs["sob demanda"].get(name)
+        quando = "não carregado" if name not in sys.modules else "sob demanda" if ms is not None else "já carregado"
+        rows.append({"modulo": name, "quando": quando, "ms": round(ms, 1) if ms is not None else None})
+    return rows
 
 # --- Configuração da Página (DEVE SER O PRIMEIRO COMANDO STREAMLIT) ---
 st.set_page_config(page_title="ClipDoc", layout="wide")
+# Só a primeira execução do processo mede importações de verdade; nas seguintes os módulos já estão carregados.
+for _name, _ms in _STARTUP_IMPORTS_MS.items(): get_import_costs()["inicialização"].setdefault(_name, _ms)
 
 # ============================================================
 # CHANGE 1 + 5: Custom CSS Theme + Hide Streamlit defaults
@@ -322,61 +369,8 @@ div[data-testid="stButton"] > button[kind="primary"] {
 """, unsafe_allow_html=True)
 
 
-# --- Padrões Regex Globais ---
-NUM_PATTERN = r"([<>]{0,1}\d{1,6}(?:[,.]\d{1,3})?)"
-GAS_NUM_PATTERN = r"([<>]{0,1}-?\d{1,6}(?:[,.]\d{1,3})?)"
-
-# --- Configuração de Valores de Referência ---
-VALORES_REFERENCIA = {
-    "Hb": {"min": 13.0, "max": 17.0, "crit_low": 7.0, "crit_high": 20.0},
-    "Ht": {"min": 40.0, "max": 50.0, "crit_low": 20.0},
-    "VCM": {"min": 83.0, "max": 101.0},
-    "HCM": {"min": 27.0, "max": 32.0},
-    "CHCM": {"min": 31.0, "max": 35.0},
-    "RDW": {"min": 11.6, "max": 14.0},
-    "Leuco": {"min": 4000, "max": 10000, "crit_low": 1000, "crit_high": 30000},
-    "Plaq": {"min": 150000, "max": 450000, "crit_low": 20000, "crit_high": 1000000},
-    "PCR": {"max": 0.30, "crit_high": 100.0},
-    "U": {"min": 15, "max": 50},
-    "Cr": {"min": 0.50, "max": 1.30},
-    "eGFR": {"min": 90},
-    "K": {"min": 3.5, "max": 5.1, "crit_low": 2.5, "crit_high": 6.5},
-    "Na": {"min": 136, "max": 145, "crit_low": 120, "crit_high": 160},
-    "Mg": {"min": 1.8, "max": 2.4},
-    "CaI": {"min": 1.12, "max": 1.32},
-    "CaT": {"min": 8.6, "max": 10.0},
-    "P": {"min": 2.5, "max": 4.5},
-    "Cl": {"min": 98, "max": 107},
-    "Gli": {"min": 70, "max": 99, "crit_high": 400, "crit_low": 40},
-    "INR": {"min": 0.96, "max": 1.30, "crit_high": 5.0},
-    "TTPA_s": {"min": 27.80, "max": 38.60, "crit_high": 100.0},
-    "TTPA_R": {"min": 0.90, "max": 1.25, "crit_high": 3.0},
-    "TGO": {"min": 15, "max": 37},
-    "TGP": {"min": 6, "max": 45},
-    "GGT": {"max": 71}, 
-    "FA": {"max": 129}, 
-    "BT": {"min": 0.30, "max": 1.20},
-    "BD": {"max": 0.30},
-    "BI": {"min": 0.10, "max": 1.00},
-    "ALB": {"min": 3.5, "max": 5.2},
-    "AML": {"max": 100},
-    "LIP": {"max": 160},
-    "Vanco": {"min": 15.0, "max": 20.0, "crit_low": 10.0, "crit_high": 25.0},
-    "pH_gas": {"min": 7.35, "max": 7.45, "crit_low": 7.2, "crit_high": 7.6},
-    "pCO2_gas": {"min": 35.0, "max": 45.0, "crit_low": 20, "crit_high": 80},
-    "HCO3_gas": {"min": 21.0, "max": 28.0, "crit_low": 10, "crit_high": 40},
-    "BE_gas": {"min": -3.0, "max": 3.0},
-    "pO2_gas": {"min": 80.0, "max": 95.0, "crit_low": 40},
-    "SatO2_gas": {"min": 95.0, "max": 99.0, "crit_low": 88},
-    "Lac_gas": {"min": 4.5, "max": 20, "crit_high": 40},
-    "Lac": {"min": 4, "max": 20, "crit_high": 30.0},
-    "cCO2_gas": {"min": 23.0, "max": 29.0}
-}
-
-
 # --- Configuração da API Key do Gemini (Após st.set_page_config) ---
 GOOGLE_API_KEY = None
-gemini_model = None
 gemini_available = False
 api_key_source = None
 
@@ -393,671 +387,212 @@ if not GOOGLE_API_KEY:
         GOOGLE_API_KEY = GOOGLE_API_KEY_LOCAL_FALLBACK
         api_key_source = "local_code"
 
-if GOOGLE_API_KEY:
+# --- Backend do Modelo: SDK do Gemini ou substituto local para testes de carga offline ---
+# CLIPDOC_GEMINI_BACKEND=fake troca o SDK pelo fake_gemini (mesma superfície, sem rede nem chave).
+GEMINI_BACKEND = os.environ.get("CLIPDOC_GEMINI_BACKEND", "gemini")
+
+def load_gemini_backend():
+    """(sdk, exceptions) of the configured backend: google.generativeai + google.api_core.exceptions, or the fake."""
+    if GEMINI_BACKEND == "fake":
+        fake = lazy_import("fake_gemini")
+        return fake, fake.exceptions
+    if GEMINI_BACKEND != "gemini":
+        raise ValueError(f"CLIPDOC_GEMINI_BACKEND desconhecido: {GEMINI_BACKEND!r} (use 'gemini' ou 'fake').")
+    return lazy_import("google.generativeai"), lazy_import("google.api_core.exceptions")
+
+gemini_available = bool(GOOGLE_API_KEY) or GEMINI_BACKEND == "fake"
+GEMINI_MODEL_PRO, GEMINI_MODEL_FLASH = 'gemini-2.5-pro', 'gemini-2.5-flash'
+
+@st.cache_resource(show_spinner=False)
+def get_gemini_models():
+    """Configure the SDK and build the (pro, flash) models on the first AI request of the process."""
+    genai, _ = load_gemini_backend()
+    genai.configure(api_key=GOOGLE_API_KEY)
+    return genai.GenerativeModel(GEMINI_MODEL_PRO), genai.GenerativeModel(GEMINI_MODEL_FLASH)
+
+# Requisições por minuto de cada modelo (cota do projeto) e latência média a partir da qual
+# o pro deixa de ser a primeira opção; o flash continua como segunda rota.
+GEMINI_RPM = {GEMINI_MODEL_PRO: int(os.environ.get("GEMINI_RPM_PRO", 150)),
+              GEMINI_MODEL_FLASH: int(os.environ.get("GEMINI_RPM_FLASH", 1000))}
+GEMINI_PRO_LATENCY_BUDGET_S = 90.0
+# Menor contexto (tokens) aceito em cache explícito por modelo; abaixo disso a API recusa o cache.
+GEMINI_CACHE_MIN_TOKENS = {GEMINI_MODEL_PRO: 4096, GEMINI_MODEL_FLASH: 1024}
+
+@st.cache_resource(show_spinner=False)
+def get_model_router():
+    """Router over (pro, flash) shared by every session of the process, so quota and latency state is global."""
+    gemini_model_pro, gemini_model_flash = get_gemini_models()
+    _, exceptions = load_gemini_backend()
+    return ModelRouter(
+        [ModelRoute(GEMINI_MODEL_PRO, gemini_model_pro, GEMINI_RPM[GEMINI_MODEL_PRO],
+                    latency_budget_s=GEMINI_PRO_LATENCY_BUDGET_S),
+         ModelRoute(GEMINI_MODEL_FLASH, gemini_model_flash, GEMINI_RPM[GEMINI_MODEL_FLASH])],
+        quota_errors=(exceptions.ResourceExhausted,),
+        transient_errors=(exceptions.ServiceUnavailable, exceptions.DeadlineExceeded,
+                          exceptions.InternalServerError))
+
+class RespostaIA(str):
+    """Answer text that also records the model that served it and whether it came from the cache."""
+
+    def __new__(cls, texto, modelo=None, do_cache=False):
+        resposta = super().__new__(cls, texto)
+        resposta.modelo, resposta.do_cache = modelo, do_cache
+        return resposta
+
+# --- Instruções Fixas por Tarefa (registradas uma vez por processo) ---
+class PromptIA(str):
+    """Prompt of one task: as a str it is the full text (fixed instructions + patient data).
+
+    `dados` is only the patient-specific part, sent alone when the task's instructions
+    are already held by the model (context cache or system instruction).
+    """
+
+    def __new__(cls, tarefa, dados):
+        prompt = super().__new__(cls, INSTRUCOES_IA[tarefa] + dados)
+        prompt.tarefa, prompt.dados = tarefa, dados
+        return prompt
+
+# "cache": contexto em cache explícito, com system_instruction como alternativa; "system": só
+# system_instruction; "off": prompt completo em cada chamada, como antes.
+IA_CONTEXTO = os.environ.get("CLIPDOC_IA_CONTEXTO", "cache")
+IA_CONTEXTO_TTL_S = 3600
+
+class ContextosIA:
+    """Models that already carry a task's fixed instructions, one per (model, task), built on first use.
+
+    The preferred form is an explicit context cache (CachedContent): the instructions are
+    stored once and each call sends only the patient data. Instructions below the model's
+    minimum cacheable size (GEMINI_CACHE_MIN_TOKENS, checked with count_tokens before any
+    cache request) skip it for good; when the cache fails (e.g. a backend without caching)
+    or is skipped, the instructions go as `system_instruction` (still sent every call, but
+    as a stable prefix the API caches implicitly). If that fails too, `modelo()` returns
+    None and the full prompt is sent. Cached and failed entries are rebuilt before the
+    cache TTL ends, so a failed cache is retried later.
+    Building an entry calls the API, so it runs outside the lock: one caller per
+    (model, task) builds it while the others keep using the old entry, or wait for it.
+    """
+
+    def __init__(self, sdk, modo=IA_CONTEXTO, ttl_s=IA_CONTEXTO_TTL_S):
+        self.sdk, self.modo, self.ttl_s = sdk, modo, ttl_s
+        self._entradas = {}
+        self._pendentes = {}
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self.chamadas = OrderedDict()
+
+    def _motivo_sem_cache(self, base, tarefa, instrucoes):
+        """Why the instructions are too small for an explicit cache on `base`, or None if they fit."""
+        minimo = GEMINI_CACHE_MIN_TOKENS.get(base.model_name.rpartition("/")[2], max(GEMINI_CACHE_MIN_TOKENS.values()))
+        # Um token tem ao menos um caractere: texto mais curto que o mínimo nem precisa ser contado.
+        if len(instrucoes) < minimo: return f"{len(instrucoes)} caracteres, mínimo de {minimo} tokens"
+        chave = (base.model_name, tarefa)
+        if chave not in self._tokens: self._tokens[chave] = base.count_tokens(instrucoes).total_tokens
+        tokens = self._tokens[chave]
+        return None if tokens >= minimo else f"{tokens} tokens, mínimo de {minimo}"
+
+    def _criar(self, base, tarefa):
+        """(model or None, mode, error, whether to rebuild before the TTL) for one (model, task)."""
+        instrucoes = INSTRUCOES_IA[tarefa]
+        erro, renovar = None, False
+        if self.modo == "cache":
+            try:
+                motivo = self._motivo_sem_cache(base, tarefa, instrucoes)
+                if motivo is None:
+                    cache = self.sdk.caching.CachedContent.create(
+                        model=base.model_name, display_name=f"clipdoc-{tarefa}", system_instruction=instrucoes,
+                        ttl=datetime.timedelta(seconds=self.ttl_s))
+                    return self.sdk.GenerativeModel.from_cached_content(cached_content=cache), "cache", None, True
+                # Pequeno demais não muda enquanto as instruções forem as mesmas: vai direto para
+                # system_instruction, sem pedir o cache nem renovar a entrada.
+                erro = f"Instruções abaixo do tamanho mínimo de cache ({motivo})"
+            except Exception as e:
+                erro, renovar = f"{type(e).__name__}: {e}", True
+                print(f"LOG: Cache de contexto indisponível para {tarefa} em {base.model_name} ({erro}).")
+        if self.modo in ("cache", "system"):
+            try:
+                return (self.sdk.GenerativeModel(base.model_name, system_instruction=instrucoes), "system_instruction",
+                        erro, renovar)
+            except Exception as e:
+                erro, renovar = f"{type(e).__name__}: {e}", True
+        return None, "prompt completo", erro, renovar
+
+    def modelo(self, base, tarefa):
+        """Model to call for `tarefa` on the route `base`, or None to send the full prompt to `base`.
+
+        Blocks on the API only when this (model, task) has no entry yet; call it off the event loop.
+        """
+        chave = (base.model_name, tarefa)
+        with self._lock:
+            self.chamadas[chave] = self.chamadas.get(chave, 0) + 1
+            entrada = self._entradas.get(chave)
+            if entrada is not None and time.monotonic() < entrada["renovar_em"]: return entrada["modelo"]
+            pendente = self._pendentes.get(chave)
+            criar = pendente is None
+            if criar: pendente = self._pendentes[chave] = Future()
+        if not criar:
+            # Outra chamada já está criando: segue com a entrada antiga (ainda dentro do TTL) ou espera a nova.
+            return entrada["modelo"] if entrada is not None else pendente.result()
+        modelo, modo, erro, renovar = None, "prompt completo", None, True
+        try:
+            modelo, modo, erro, renovar = self._criar(base, tarefa)
+        finally:
+            # Renova com folga antes do TTL do cache (ou tenta de novo o que falhou); system_instruction
+            # escolhido por tamanho não expira.
+            with self._lock:
+                self._entradas[chave] = {"modelo": modelo, "modo": modo, "erro": erro,
+                                         "renovar_em": time.monotonic() + 0.9 * self.ttl_s if renovar else math.inf}
+                del self._pendentes[chave]
+            pendente.set_result(modelo)
+        return modelo
+
+    def stats(self):
+        agora = time.monotonic()
+        with self._lock:
+            return [{"modelo": modelo, "tarefa": tarefa, "modo": e["modo"], "chamadas": self.chamadas.get((modelo, tarefa), 0),
+                     "instrucoes_chars": len(INSTRUCOES_IA[tarefa]), "instrucoes_tokens": self._tokens.get((modelo, tarefa)),
+                     "renova_em_s": round(max(0.0, e["renovar_em"] - agora)) if e["renovar_em"] != math.inf else None,
+                     "erro": e["erro"]}
+                    for (modelo, tarefa), e in self._entradas.items()]
+
+@st.cache_resource(show_spinner=False)
+def get_contextos_ia():
+    sdk, _ = load_gemini_backend()
+    return ContextosIA(sdk)
+
+def preparar_chamada_ia(model, prompt_text, file_parts=None):
+    """(model, content) for one route: the task's instruction-carrying model with only the patient data, or `model` with the full prompt."""
+    tarefa = getattr(prompt_text, "tarefa", None)
+    modelo_tarefa = get_contextos_ia().modelo(model, tarefa) if tarefa and IA_CONTEXTO != "off" else None
+    if modelo_tarefa is None: return model, montar_conteudo_ia(str(prompt_text), file_parts)
+    return modelo_tarefa, montar_conteudo_ia(prompt_text.dados, file_parts)
+
+# --- Cache de Respostas da IA (SQLite local, compartilhado entre reruns, sessões e processos) ---
+# Cada backend tem seu arquivo, para respostas simuladas nunca aparecerem no uso real.
+IA_CACHE_PATH = os.environ.get("CLIPDOC_IA_CACHE") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache",
+    "ia_respostas.sqlite3" if GEMINI_BACKEND == "gemini" else f"ia_respostas_{GEMINI_BACKEND}.sqlite3")
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache():
     try:
-        genai.configure(api_key=GOOGLE_API_KEY)
-        gemini_model_pro = genai.GenerativeModel('gemini-2.5-pro')
-        gemini_model_flash = genai.GenerativeModel('gemini-2.5-flash')
-        gemini_available = True
+        return ResponseCache(IA_CACHE_PATH)
     except Exception as e:
-        st.session_state.gemini_config_error = f"Erro ao configurar a API do Gemini: {e}. Verifique sua chave de API."
-        gemini_available = False
-else:
-    gemini_available = False
-
-# --- Funções Auxiliares ---
-def clean_number_format(value_str):
-    if not value_str: return ""
-    s = str(value_str).strip().lstrip('<>')
-    if '.' in s and ',' in s:
-        s = s.replace('.', '').replace(',', '.')
-    elif ',' in s:
-        s = s.replace(',', '.')
-    return s
-
-def convert_to_float(cleaned_value_str):
-    if not cleaned_value_str: return None
-    try: return float(cleaned_value_str)
-    except ValueError: return None
-
-def format_value_with_alert(label, raw_value_str, key_ref, unit_suffix=""):
-    if raw_value_str == "" or raw_value_str is None: return ""
-    cleaned_value = clean_number_format(raw_value_str)
-    if not cleaned_value: return f"{label} {raw_value_str}"
-    
-    if key_ref == "eGFR" and '-' in cleaned_value:
-        parts = cleaned_value.split('-')
-        return f"{label} {parts[0]}-{parts[1]}"
-        
-    display_text = f"{label} {cleaned_value}{unit_suffix}"
-    
-    val_to_check = float(cleaned_value)
-    if unit_suffix == " mil":
-        val_to_check *= 1000
-
-    val_float = convert_to_float(str(val_to_check))
-    alert_suffix = ""
-    if val_float is not None and key_ref in VALORES_REFERENCIA:
-        ref = VALORES_REFERENCIA[key_ref]
-        crit_high, crit_low = ref.get("crit_high"), ref.get("crit_low")
-        max_val, min_val = ref.get("max"), ref.get("min")
-        
-        is_crit_high = crit_high is not None and val_float > crit_high
-        is_crit_low = crit_low is not None and val_float < crit_low
-        is_high = max_val is not None and val_float > max_val
-        is_low = min_val is not None and val_float < min_val
-        
-        if is_crit_high or is_crit_low:
-            alert_suffix = " (!)"
-        elif is_high or is_low:
-            alert_suffix = " *"
-            
-    return f"{display_text}{alert_suffix}"
-
-
-def extract_labeled_value(lines, labels_to_search, pattern_to_extract=NUM_PATTERN,
-                          search_window_lines=3, label_must_be_at_start=False,
-                          ignore_case=True, line_offset_for_value=0, require_unit=None):
-    if isinstance(labels_to_search, str): labels_to_search = [labels_to_search]
-    for i, current_line in enumerate(lines):
-        processed_line = current_line.lower() if ignore_case else current_line
-        for label in labels_to_search:
-            processed_label = label.lower() if ignore_case else label
-            label_found_in_line, text_to_search_value_in = False, current_line
-            start_index_of_label = -1
-            if label_must_be_at_start:
-                if processed_line.startswith(processed_label): start_index_of_label = 0
-            else: start_index_of_label = processed_line.find(processed_label)
-            if start_index_of_label != -1:
-                label_found_in_line = True
-                text_to_search_value_in = current_line[start_index_of_label + len(label):].strip()
-            if label_found_in_line:
-                target_line_idx = i + line_offset_for_value
-                if 0 <= target_line_idx < len(lines):
-                    line_content_for_search = lines[target_line_idx] if line_offset_for_value != 0 else text_to_search_value_in
-                    match = None
-                    if line_content_for_search:
-                        if require_unit:
-                            pat_with_unit = pattern_to_extract + r"\s*" + re.escape(require_unit)
-                            m_unit = re.search(pat_with_unit, line_content_for_search, re.IGNORECASE)
-                            if m_unit: match = m_unit
-                        else:
-                            match = re.search(pattern_to_extract, line_content_for_search)
-                    if match: return match.group(1)
-                    if line_offset_for_value == 0 :
-                        for j_offset in range(1, search_window_lines + 1):
-                            next_line_idx_abs = i + j_offset
-                            if next_line_idx_abs < len(lines):
-                                line_to_check_next = lines[next_line_idx_abs]
-                                match_next = None
-                                if require_unit:
-                                    pat_with_unit_next = pattern_to_extract + r"\s*" + re.escape(require_unit)
-                                    m_unit_next = re.search(pat_with_unit_next, line_to_check_next, re.IGNORECASE)
-                                    if m_unit_next: match_next = m_unit_next
-                                else:
-                                    match_next = re.search(pattern_to_extract, line_to_check_next)
-                                if match_next: return match_next.group(1)
-                return ""
-    return ""
-
-# --- Função de Anonimização ---
-def anonimizar_texto(texto_original):
-    linhas_processadas = []
-    for linha in texto_original.splitlines():
-        linha_strip = linha.strip()
-        if linha_strip.startswith("#ID:"):
-            partes = linha.split(":", 1)
-            id_tag = partes[0] + ":"
-            conteudo_id = partes[1].strip() if len(partes) > 1 else ""
-            
-            def substituir_nome_id_por_iniciais(match):
-                nome_completo = match.group(0).strip()
-                partes_nome = nome_completo.split()
-                PALAVRAS_EXCLUIR_DA_ABREVIACAO_ID = ["Pronto", "Socorro", "Centro", "Clínicas", "Hospital"]
-                
-                if len(partes_nome) > 1 and \
-                   all(p and p[0].isupper() for p in partes_nome) and \
-                   not nome_completo.isupper() and \
-                   not any(palavra_excluir.lower() in nome_completo.lower() for palavra_excluir in PALAVRAS_EXCLUIR_DA_ABREVIACAO_ID):
-                    
-                    partes_para_iniciais = [p for p in partes_nome if p.lower() not in ["de", "da", "do", "dos", "das", "e"]]
-                    if len(partes_para_iniciais) >= 2:
-                        iniciais = [p[0] + "." for p in partes_para_iniciais]
-                        return " ".join(iniciais)
-                return nome_completo
-
-            padrao_nome_composto_id = r"\b([A-ZÀ-Ú][a-zà-ú'-]+(?:\s+(?:de|da|do|dos|das|e)\s+[A-ZÀ-Ú][a-zà-ú'-]+){1,3})\b"
-            conteudo_id_anonimizado = re.sub(padrao_nome_composto_id, substituir_nome_id_por_iniciais, conteudo_id)
-            padrao_nome_geral_id = r"\b([A-ZÀ-Ú][a-zà-ú'-]+(?:\s+[A-ZÀ-Ú][a-zà-ú'-]+){1,2})\b"
-            conteudo_id_anonimizado = re.sub(padrao_nome_geral_id, substituir_nome_id_por_iniciais, conteudo_id_anonimizado)
-            
-            linhas_processadas.append(f"{id_tag} {conteudo_id_anonimizado}")
-        else:
-            linhas_processadas.append(linha)
-            
-    return "\n".join(linhas_processadas)
-    
-# --- Funções de Extração Específicas ---
-
-def extract_datetime_info(lines, is_tecnolab):
-    if is_tecnolab:
-        for line in lines:
-            m_tecnolab = re.search(r"Coleta\((\d{1,2}/\d{1,2}/\d{2,4})\s+(\d{1,2}:\d{2})\)", line, re.IGNORECASE)
-            if m_tecnolab:
-                date_part, time_part = m_tecnolab.group(1), m_tecnolab.group(2)
-                try:
-                    dt_obj_date = date_parser.parse(date_part, dayfirst=True)
-                    day_month = dt_obj_date.strftime("%d/%m")
-                    h_part, m_part = time_part.split(':')
-                    return f"{day_month} {h_part.zfill(2)}h{m_part.zfill(2)}"
-                except (ValueError, TypeError):
-                    continue
-        return "" 
-
-    for line in lines:
-        m_specific = re.search(
-            r"Data de Coleta/Recebimento:\s*(\d{1,2}/\d{1,2}/\d{2,4}),\s*Hora Aproximada:\s*(\d{1,2}:\d{2})(?:\s+\w{2,4})?",
-            line, re.IGNORECASE
-        )
-        if m_specific:
-            date_part_full, time_part = m_specific.group(1), m_specific.group(2)
-            try:
-                dt_obj_date = date_parser.parse(date_part_full, dayfirst=True, fuzzy=False)
-                day_month = dt_obj_date.strftime("%d/%m")
-                h_part, m_part = time_part.split(':')
-                return f"{day_month} {h_part.zfill(2)}h{m_part.zfill(2)}"
-            except (ValueError, TypeError):
-                day_month_match = re.match(r"(\d{1,2}/\d{1,2})", date_part_full)
-                if day_month_match:
-                    h_part, m_part = time_part.split(':')
-                    return f"{day_month_match.group(1)} {h_part.zfill(2)}h{m_part.zfill(2)}"
-    return ""
-
-
-def extract_hemograma_completo(lines, is_tecnolab):
-    results = {}
-    
-    red_idx = next((i for i, l in enumerate(lines) if "série vermelha" in l.lower() or "eritrograma" in l.lower()), -1)
-    search_scope = lines[red_idx:] if red_idx != -1 else lines
-    
-    mapa_vermelha = {
-        "Hb": ["Hemoglobina", "Hb"],
-        "Ht": ["Hematócrito", "Ht"],
-        "VCM": ["VCM", "Volume Corpuscular"],
-        "HCM": ["HCM", "Hemoglobina Corpuscular"],
-        "CHCM": ["CHCM", "Concentração"],
-        "RDW": ["RDW", "Red Cell"]
-    }
-
-    for key, labels in mapa_vermelha.items():
-        for line in search_scope:
-            for label in labels:
-                if label.lower() in line.lower():
-                    pattern = re.escape(label) + r"[.:\s]*" + NUM_PATTERN
-                    match = re.search(pattern, line, re.IGNORECASE)
-                    if match:
-                        results[key] = match.group(1)
-                        break 
-            if key in results: break
-
-    leuco_val = ""
-    for i, line in enumerate(lines):
-        if "leucócitos" in line.lower() and "urina" not in line.lower(): 
-            nums = re.findall(NUM_PATTERN, line)
-            for num in nums:
-                clean_n = clean_number_format(num)
-                try:
-                    val_float = float(clean_n)
-                    if 1000 < val_float < 500000: 
-                        leuco_val = clean_n; break
-                    if val_float < 100 and ("mil" in line.lower() or "x10^3" in line.lower()):
-                         leuco_val = str(int(val_float * 1000)); break
-                except: continue
-            if leuco_val: break     
-    results["Leuco"] = leuco_val
-
-    diff = []
-    
-    def extract_diff_item(label_list):
-        for line in lines:
-            if "valor de referência" in line.lower(): continue
-            if any(l.lower() in line.lower() for l in label_list):
-                pattern_percent = r"(?:" + "|".join(label_list) + r")[.:\s]*(" + NUM_PATTERN + r")\s*%"
-                m_perc = re.search(pattern_percent, line, re.IGNORECASE)
-                if m_perc: return m_perc.group(1)
-                
-                pattern_num = r"(?:" + "|".join(label_list) + r")[.:\s]*(" + NUM_PATTERN + r")"
-                m_num = re.search(pattern_num, line, re.IGNORECASE)
-                if m_num:
-                    try:
-                        v = float(clean_number_format(m_num.group(1)))
-                        if 0 <= v <= 100: return m_num.group(1)
-                    except: pass
-        return ""
-
-    bast = extract_diff_item(["Bastonetes", "Bastões"])
-    if bast: diff.append(f"Bast {bast}%")
-
-    seg = extract_diff_item(["Segmentados", "Segs"])
-    if not seg: seg = extract_diff_item(["Neutrófilos", "Neutrofilos"])
-    if seg: diff.append(f"Seg {seg}%")
-
-    linf = extract_diff_item(["Linfócitos", "Linfocitos"])
-    if linf: diff.append(f"Linf {linf}%")
-    
-    eos = extract_diff_item(["Eosinófilos"])
-    if eos and float(clean_number_format(eos)) > 0:
-        diff.append(f"Eos {eos}%")
-
-    results["Leuco_Diff"] = f"({', '.join(diff)})" if diff else ""
-
-    results["Plaq"] = ""
-    for line in lines:
-        if "plaquetas" in line.lower() and "volume" not in line.lower():
-             m = re.search(r"Plaquetas[.:\s]*(" + NUM_PATTERN + r")", line, re.IGNORECASE)
-             if m:
-                 val_plaq = m.group(1)
-                 results["Plaq"] = val_plaq
-                 try:
-                     if "mil" in line.lower() or float(clean_number_format(val_plaq)) < 1000:
-                         results["Plaq_unit"] = " mil"
-                 except: pass
-                 break
-    
-    return results
-
-def extract_coagulograma(lines, is_tecnolab):
-    results = {}
-    if is_tecnolab:
-        results["TP_s"] = extract_labeled_value(lines, "TEMPO DE PROTROMBINA....:", search_window_lines=0)
-        results["INR"] = extract_labeled_value(lines, "I.N.R...................:", search_window_lines=0)
-        ttpa_idx = next((i for i, l in enumerate(lines) if "tempo tromboplastina parcial ativada" in l.lower()), -1)
-        if ttpa_idx != -1 and ttpa_idx + 1 < len(lines):
-            match = re.search(r"RESULTADO:\s*" + NUM_PATTERN, lines[ttpa_idx + 1])
-            if match:
-                results["TTPA_s"] = match.group(1)
-        return results
-
-    results["TP_s"] = extract_labeled_value(lines, "Tempo em segundos:", label_must_be_at_start=False, search_window_lines=0)
-    inr_val = ""
-    for i, line in enumerate(lines):
-        if "Internacional (RNI):" in line:
-            if i + 1 < len(lines):
-                m_inr = re.search(NUM_PATTERN, lines[i+1])
-                if m_inr:
-                    inr_val = m_inr.group(1)
-                    break
-    if not inr_val:
-        inr_val = extract_labeled_value(lines, ["RNI:", "INR:"], label_must_be_at_start=False, search_window_lines=1)
-    results["INR"] = inr_val
-
-    ttpa_idx = next((i for i, l in enumerate(lines) if ("tempo de tromboplastina parcial ativado" in l.lower() or "ttpa" in l.lower()) and "tempo de protrombina" not in l.lower()), -1)
-    if ttpa_idx != -1:
-        search_ttpa = lines[ttpa_idx:]
-        results["TTPA_s"] = extract_labeled_value(search_ttpa, "Tempo em segundos", label_must_be_at_start=False, search_window_lines=1)
-        results["TTPA_R"] = extract_labeled_value(search_ttpa, "Relação:", label_must_be_at_start=False, search_window_lines=1)
-    return results
-
-def extract_tecnolab_generic(lines, labels):
-    if isinstance(labels, str): labels = [labels]
-    for i, line in enumerate(lines):
-        if any(label.lower() in line.lower() for label in labels) and "resultado" not in line.lower():
-            for j in range(i, min(i + 4, len(lines))):
-                if "RESULTADO:" in lines[j]:
-                    match = re.search(r"RESULTADO:\s*" + NUM_PATTERN, lines[j], re.IGNORECASE)
-                    if match:
-                        return match.group(1)
-    return ""
-
-def extract_funcao_renal_e_eletrólitos(lines, is_tecnolab):
-    results = {}
-    if is_tecnolab:
-        results["U"] = extract_labeled_value(lines, ["Ureia", "Uréia"], label_must_be_at_start=False)
-        results["Cr"] = extract_tecnolab_generic(lines, "CREATININA")
-        
-        egfr_afro = extract_labeled_value(lines, "*eGFR - Afro Descendente:")
-        egfr_non_afro = extract_labeled_value(lines, "*eGFR Não Afro Descendente:")
-        if egfr_afro and egfr_non_afro:
-             results["eGFR"] = f"{clean_number_format(egfr_afro)}-{clean_number_format(egfr_non_afro)}"
-        
-        results["K"] = extract_tecnolab_generic(lines, ["DOSAGEM DE POTÁSSIO", "POTÁSSIO"])
-        results["Na"] = extract_tecnolab_generic(lines, ["DOSAGEM DE SÓDIO", "SÓDIO"])
-        results["Mg"] = extract_tecnolab_generic(lines, ["DOSAGEM DE MAGNÉSIO", "MAGNÉSIIO"])
-        results["CaT"] = extract_tecnolab_generic(lines, "CALCIO") 
-        results["Gli"] = extract_tecnolab_generic(lines, ["DOSAGEM DE GLICOSE", "GLICOSE"])
-        return results
-
-    results["U"] = extract_labeled_value(lines, "Ureia", label_must_be_at_start=True)
-    if not results["U"]: results["U"] = extract_labeled_value(lines, "U ", label_must_be_at_start=True)
-    results["Cr"] = extract_labeled_value(lines, "Creatinina ", label_must_be_at_start=True)
-    results["eGFR"] = extract_labeled_value(lines, ["eGFR", "*eGFR", "Ritmo de Filtração Glomerular"], label_must_be_at_start=True)
-    for k, lbls in [("K", ["Potássio", "K "]), ("Na", ["Sódio", "Na "]), ("Mg", "Magnésio"),
-                    ("P", "Fósforo"), ("CaI", "Cálcio Iônico"), ("Cl", ["Cloro","Cloreto", "Cl "]), ("Gli", ["Glicose", "Glicemia"])]:
-        results[k] = extract_labeled_value(lines, lbls, label_must_be_at_start=k not in ["CaI"])
-    return results
-
-def extract_marcadores_inflamatorios_cardiacos(lines, is_tecnolab):
-    results = {}
-    if is_tecnolab:
-        results["PCR"] = extract_tecnolab_generic(lines, 'PROTEINA "C" REATIVA')
-        results["Trop"] = extract_tecnolab_generic(lines, 'TROPONINA T (ALTA SENSIBILIDADE)')
-        results["NT-proBNP"] = extract_tecnolab_generic(lines, 'NT-proBNP')
-        return results
-
-    for k, lbls, start in [("PCR",["Proteína C Reativa","PCR"],True), ("Lac","Lactato",True), ("Trop","Troponina",False), ("DD","D-Dímero",False)]:
-        results[k] = extract_labeled_value(lines, lbls, label_must_be_at_start=start)
-    return results
-
-def extract_hepatograma_pancreas(lines, is_tecnolab):
-    results = {}
-    if is_tecnolab:
-        results["TGO"] = extract_tecnolab_generic(lines, "TRANSAMINASE OXALACETICA - TGO")
-        results["TGP"] = extract_tecnolab_generic(lines, "TRANSAMINASE PIRUVICA (TGP)")
-        results["FA"] = extract_tecnolab_generic(lines, "FOSFATASE ALCALINA")
-        results["GGT"] = extract_tecnolab_generic(lines, "GAMA-GLUTAMIL TRANSFERASE")
-        results["AML"] = extract_tecnolab_generic(lines, "AMILASE")
-        
-        bili_idx = next((i for i, l in enumerate(lines) if "bilirrubina" in l.lower() and "resultado" in l.lower()), -1)
-        if bili_idx == -1:
-             bili_idx = next((i for i, l in enumerate(lines) if l.strip().upper() == "BILIRRUBINA"),-1)
-        if bili_idx != -1:
-            search_bili = lines[bili_idx : bili_idx + 5]
-            results["BT"] = extract_labeled_value(search_bili, "TOTAL....:", search_window_lines=0)
-            results["BD"] = extract_labeled_value(search_bili, "DIRETA...:", search_window_lines=0)
-            results["BI"] = extract_labeled_value(search_bili, "INDIRETA.:", search_window_lines=0)
-        
-        return results
-        
-    tgo_val, tgp_val = "", ""
-    for i, line in enumerate(lines):
-        if not tgo_val and ("Transaminase oxalacética - TGO" in line or ("Aspartato amino transferase" in line and "TGO" in line.upper())):
-            for offset in range(1, 4):
-                if i + offset < len(lines):
-                    target_line = lines[i + offset]
-                    match_ul = re.match(r"^\s*" + NUM_PATTERN + r"\s*U/L", target_line)
-                    if match_ul: tgo_val = match_ul.group(1); break
-            if not tgo_val and i + 2 < len(lines):
-                 m = re.search(NUM_PATTERN, lines[i+2])
-                 if m: tgo_val = m.group(1)
-        if not tgp_val and ("Transaminase pirúvica - TGP" in line or ("Alanina amino transferase" in line and "TGP" in line.upper())):
-            for offset in range(1, 4):
-                if i + offset < len(lines):
-                    target_line = lines[i + offset]
-                    match_ul = re.match(r"^\s*" + NUM_PATTERN + r"\s*U/L", target_line)
-                    if match_ul: tgp_val = match_ul.group(1); break
-            if not tgp_val and i + 2 < len(lines):
-                 m = re.search(NUM_PATTERN, lines[i+2])
-                 if m: tgp_val = m.group(1)
-    results["TGO"] = tgo_val
-    results["TGP"] = tgp_val
-    if not results.get("TGO"): results["TGO"] = extract_labeled_value(lines, ["TGO", "AST"], label_must_be_at_start=False, search_window_lines=1, require_unit="U/L")
-    if not results.get("TGP"): results["TGP"] = extract_labeled_value(lines, ["TGP", "ALT"], label_must_be_at_start=False, search_window_lines=1, require_unit="U/L")
-    results["GGT"] = extract_labeled_value(lines, ["Gama-Glutamil Transferase", "GGT"], label_must_be_at_start=True, search_window_lines=0, require_unit="U/L")
-    if not results["GGT"]: results["GGT"] = extract_labeled_value(lines, ["Gama-Glutamil Transferase", "GGT"], label_must_be_at_start=True, search_window_lines=0)
-    results["FA"] = extract_labeled_value(lines, "Fosfatase Alcalina", label_must_be_at_start=True, search_window_lines=0, require_unit="U/L")
-    if not results["FA"]: results["FA"] = extract_labeled_value(lines, "Fosfatase Alcalina", label_must_be_at_start=True, search_window_lines=0)
-    bilirrubina_section_found = False
-    bilirrubina_start_index = -1
-    for i, line in enumerate(lines):
-        if "bilirrubinas total, direta e indireta" in line.lower():
-            bilirrubina_section_found = True
-            bilirrubina_start_index = i
-            break
-    search_scope_bilirrubinas = lines[bilirrubina_start_index:] if bilirrubina_section_found else lines
-    results["BT"] = extract_labeled_value(search_scope_bilirrubinas, "Bilirrubina Total", label_must_be_at_start=True, search_window_lines=1)
-    results["BD"] = extract_labeled_value(search_scope_bilirrubinas, "Bilirrubina Direta", label_must_be_at_start=True, search_window_lines=1)
-    results["BI"] = extract_labeled_value(search_scope_bilirrubinas, "Bilirrubina Indireta", label_must_be_at_start=True, search_window_lines=1)
-    if not results.get("BT"): results["BT"] = extract_labeled_value(lines, "Bilirrubina Total", label_must_be_at_start=True, search_window_lines=1)
-    if not results.get("BD"): results["BD"] = extract_labeled_value(lines, "Bilirrubina Direta", label_must_be_at_start=True, search_window_lines=1)
-    if not results.get("BI"): results["BI"] = extract_labeled_value(lines, "Bilirrubina Indireta", label_must_be_at_start=True, search_window_lines=1)
-    results["ALB"] = extract_labeled_value(lines, "Albumina", label_must_be_at_start=True, search_window_lines=1)
-    results["AML"] = extract_labeled_value(lines, "Amilase", label_must_be_at_start=True, search_window_lines=1)
-    results["LIP"] = extract_labeled_value(lines, "Lipase", label_must_be_at_start=True, search_window_lines=1)
-    return results
-
-def extract_medicamentos(lines, is_tecnolab):
-    results = {}
-    results["Vanco"] = extract_labeled_value(lines, "Vancomicina", label_must_be_at_start=False, search_window_lines=0, require_unit="µg/mL")
-    return results
-
-def extract_gasometria(lines, is_tecnolab):
-    results = {}
-    exam_prefix = ""
-    gas_idx = -1
-    gas_header_found = False
-
-    for i, line in enumerate(lines):
-        l_line = line.lower()
-        if "gasometria arterial" in l_line:
-            exam_prefix = "GA_"
-            gas_idx = i
-            gas_header_found = True
-            break
-        elif "gasometria venosa" in l_line:
-            exam_prefix = "GV_"
-            gas_idx = i
-            gas_header_found = True
-            break
-    
-    if not gas_header_found:
-        for i, line in enumerate(lines):
-            l_line = line.lower()
-            if "gasometria" in l_line:
-                gas_idx = i
-                if "arterial" in l_line: exam_prefix = "GA_"
-                elif "venosa" in l_line: exam_prefix = "GV_"
-                gas_header_found = True
-                break
+        print(f"LOG: Cache de respostas indisponível em {IA_CACHE_PATH} ({e}); usando cache em memória.")
+        return ResponseCache(":memory:")
 
-    if not gas_header_found:
-        return results
+def cache_ia_ativo():
+    """Whether this session reads answers from the cache; the bypass checkbox turns it off (new answers are still stored)."""
+    return not st.session_state.get("ia_cache_bypass", False)
 
-    gas_map = {
-        "ph": "pH_gas", "pco2": "pCO2_gas", "hco3": "HCO3_gas",
-        "bicarbonato": "HCO3_gas", "be": "BE_gas", "excesso de bases": "BE_gas",
-        "po2": "pO2_gas", "saturação de o2": "SatO2_gas", "sato2": "SatO2_gas",
-        "lactato": "Lac_gas", "lac": "Lac_gas", "co2 total": "cCO2_gas", "conteúdo de co2": "cCO2_gas"
-    }
+def chave_cache_ia(prompt_text, file_parts=None):
+    # O modelo da chave é o pedido (pro); o que de fato respondeu fica gravado junto da resposta.
+    return ResponseCache.key_for(GEMINI_MODEL_PRO, prompt_text, file_parts)
 
-    search_lines = lines[gas_idx + 1 : min(gas_idx + 20, len(lines))]
-    
-    for line_content in search_lines:
-        if any(hdr in line_content.lower() for hdr in ["hemograma", "coagulograma", "bioquimica", "cultura", "urina tipo i", "assinado eletronicamente", "material:"]):
-            break
-        
-        match = re.match(r"^\s*([a-zA-Z0-9+\s]+?)\s*:\s*" + GAS_NUM_PATTERN, line_content)
-        if match:
-            label = match.group(1).strip().lower()
-            value = match.group(2)
-            if label in gas_map:
-                out_key = gas_map[label]
-                if out_key not in results:
-                    results[out_key] = value
-            continue
-
-    if exam_prefix:
-        return {exam_prefix + k: v for k, v in results.items() if v}
-    elif results:
-        return {k: v for k, v in results.items() if v}
-    return {}
-
-
-def extract_sorologias(lines, is_tecnolab):
-    results = {}
-    tests = [("Anti HIV 1/2","HIV"),("Anti-HAV (IgM)","HAV_IgM"),("HBsAg","HBsAg"),("Anti-HBs","AntiHBs"),
-             ("Anti-HBc Total","AntiHBc_Total"),("Anti-HCV","HCV"),("VDRL","VDRL")]
-    for i, line in enumerate(lines):
-        l_line = line.lower()
-        for srch_k, dict_k in tests:
-            if srch_k.lower() in l_line:
-                res_txt = ""
-                for k_rng in range(i, min(i + 3, len(lines))):
-                    s_line = lines[k_rng].lower()
-                    if any(t in s_line for t in ["não reagente","nao reagente","negativo"]): res_txt = "(-)"; break
-                    elif any(t in s_line for t in ["reagente","positivo"]): res_txt = "(+)"; break
-                    elif srch_k.lower() in s_line:
-                        m = re.search(r"(\d+[:/]\d+)", lines[k_rng])
-                        if m: res_txt = f"({m.group(1)})"; break
-                if res_txt: results[dict_k] = res_txt; break
-    return results
-
-def extract_urina_tipo_i(lines, is_tecnolab):
-    results = {}
-    u1_idx = next((i for i, l in enumerate(lines) if "urina tipo i" in l.lower()), -1)
-    if u1_idx == -1: return {}
-
-    search_u1 = lines[u1_idx : min(u1_idx + 25, len(lines))]
-    
-    if is_tecnolab:
-        for line in search_u1:
-            # Regex inclui letras acentuadas maiúsculas (À-Ú) para capturar PROTEÍNA, HEMÁCIAS, LEUCÓCITOS, REAÇÃO etc.
-            match = re.match(r"\s*([A-ZÀ-Ú\s-]+)\s*:\s*(.+)", line)
-            if match:
-                key, value = match.group(1).strip().lower(), match.group(2).strip()
-                val_num_match = re.search(NUM_PATTERN, value)
-                if "ph" in key: results["U1_pH"] = val_num_match.group(1) if val_num_match else ""
-                elif "densidade" in key: results["U1_dens"] = value.split()[0]
-                elif "proteína" in key: results["U1_prot"] = "(-)" if "negativo" in value.lower() else "(+)"
-                elif "glicose" in key: results["U1_glic"] = "(-)" if "negativo" in value.lower() else "(+)"
-                elif "nitrito" in key: results["U1_nit"] = "(-)" if "negativo" in value.lower() else "(+)"
-                elif "corpos cetônicos" in key: results["U1_CC"] = "(-)" if "negativo" in value.lower() else "(+)"
-                elif "hemácias" in key:
-                     # Preserva formato brasileiro com ponto como separador de milhar (ex: 3.000)
-                     if val_num_match: results["U1_hem"] = val_num_match.group(1)
-                elif "leucócitos" in key:
-                    if "acima de" in value.lower() and val_num_match:
-                        results["U1_leuco"] = ">" + val_num_match.group(1)
-                    elif val_num_match:
-                        results["U1_leuco"] = val_num_match.group(1)
-        return results
-
-    for line in search_u1:
-        l_line = line.lower()
-        if "assinado eletronicamente" in l_line or ("método:" in l_line and "urina tipo i" not in l_line): break
-        if "nitrito" in l_line: results["U1_nit"] = "(+)" if "positivo" in l_line else "(-)"
-        for k, lbls, terms in [("U1_leuco",["leucócitos"],{"numerosos":"Num","inumeros":"Num","raros":"Raros","campos cobertos":"Cob"}),
-                               ("U1_hem",["hemácias","eritrócitos"],{"numerosas":"Num","inumeras":"Num","raras":"Raras","campos cobertos":"Cob"})]:
-            if any(lbl in l_line for lbl in lbls):
-                search_text = line.split(lbls[0])[-1] if lbls[0] in line else line
-                m = re.search(NUM_PATTERN, search_text)
-                if m and clean_number_format(m.group(1)).isdigit():
-                    results[k] = clean_number_format(m.group(1)); break
-                for term, abbr in terms.items():
-                    if term in l_line: results[k] = abbr; break
-                if k in results: break
-    return results
-
-def extract_culturas(lines, is_tecnolab):
-    found_cultures = []
-    if is_tecnolab:
-        for i, line in enumerate(lines):
-            l_line = line.lower()
-            cult_type, cult_result = None, None
-            if l_line.startswith("urocultura"):
-                cult_type = "URC"
-                if i + 2 < len(lines) and "resultado:" in lines[i+1].lower():
-                    if "não houve crescimento" in lines[i+2].lower(): cult_result = "(-)"
-            elif l_line.startswith("hemocultura"):
-                cult_type = "HMC"
-                if i + 1 < len(lines) and "resultado parcial:" in lines[i+1].lower():
-                    if "parcialmente negativo" in lines[i+1].lower(): cult_result = "PN"
-
-            if cult_type and cult_result:
-                found_cultures.append({"Tipo": cult_type, "Resultado": cult_result})
-        
-        unique_cultures = []
-        seen = set()
-        for cult in found_cultures:
-            identifier = cult["Tipo"] 
-            if identifier not in seen:
-                unique_cultures.append(cult)
-                seen.add(identifier)
-        return unique_cultures
-
-    germe_regex = r"([A-Z][a-z]+\s(?:cf\.\s)?[A-Z]?[a-z]+)"
-    i = 0
-    while i < len(lines):
-        line_content = lines[i]
-        l_line = line_content.lower()
-        is_culture_header = "cultura de urina" in l_line or \
-                            "urocultura" in l_line or \
-                            "hemocultura" in l_line
-        if is_culture_header:
-            current_culture_block_lines = [line_content]
-            j = i + 1
-            while j < len(lines):
-                next_line_lower = lines[j].lower()
-                is_next_block_header = "cultura de urina" in next_line_lower or "urocultura" in next_line_lower or "hemocultura" in next_line_lower or "hemograma" in next_line_lower or "coagulograma" in next_line_lower or "bioquimica" in next_line_lower or "urina tipo i" in next_line_lower or "assinado eletronicamente" in next_line_lower
-                if is_next_block_header:
-                    break
-                current_culture_block_lines.append(lines[j])
-                j += 1
-            culture_data = process_single_culture_block(current_culture_block_lines, germe_regex)
-            if culture_data: found_cultures.append(culture_data)
-            i = j
-            continue
-        i += 1
-    final_cultures = []
-    seen_types_and_results = set()
-    for cult in found_cultures:
-        cult_id_tuple = (cult.get("Tipo"), cult.get("Resultado","").split(" / ")[0])
-        is_meaningful_hmc_negative = "HMC" in cult.get("Tipo","") and cult.get("Resultado","") == "(-)"
-        is_positive_result = "(+)" in cult.get("Resultado","")
-        has_antibiogram = any(val for val in cult.get("Antibiograma", {}).values())
-        if is_meaningful_hmc_negative or is_positive_result or has_antibiogram:
-            if cult_id_tuple not in seen_types_and_results or is_meaningful_hmc_negative:
-                final_cultures.append(cult)
-                if not is_meaningful_hmc_negative:
-                    seen_types_and_results.add(cult_id_tuple)
-    return final_cultures
-
-
-def process_single_culture_block(block_lines, germe_regex):
-    current_culture_data = {}
-    culture_type_label, culture_type_detail, sample_info = None, "", ""
-    first_line_lower = block_lines[0].lower()
-    if "cultura de urina" in first_line_lower or "urocultura" in first_line_lower:
-        culture_type_label = "URC"
-    elif "hemocultura" in first_line_lower:
-        culture_type_detail = "Aeróbio" if "aeróbios" in first_line_lower or "aerobio" in first_line_lower else \
-                              "Anaeróbio" if "anaeróbios" in first_line_lower or "anaerobio" in first_line_lower else ""
-        culture_type_label = f"HMC {culture_type_detail}".strip()
-        sample_match = re.search(r"\(Amostra\s*(\d+/\d+)\)", block_lines[0], re.IGNORECASE) or \
-                       (1 < len(block_lines) and re.search(r"\(Amostra\s*(\d+/\d+)\)", block_lines[1], re.IGNORECASE))
-        if sample_match: culture_type_label += f" Amostra {sample_match.group(1)}"
-    if not culture_type_label: return None
-    current_culture_data["Tipo"] = culture_type_label.strip()
-    result_text_found = "(-)"
-    for r_line in block_lines:
-        lc_r_line = r_line.lower()
-        if lc_r_line.startswith("resultado:") or "resultado da cultura:" in lc_r_line:
-            res_text = re.sub(r"(?i)(resultado:|resultado da cultura:)", "", r_line, count=1).strip()
-            germe_match = re.search(germe_regex, res_text)
-            if germe_match:
-                result_text_found = f"{germe_match.group(1).strip()} (+)"
-            elif any(neg in res_text.lower() for neg in ["negativo", "negativa", "não houve crescimento", "ausência de crescimento"]):
-                result_text_found = "(-)"
-            elif res_text:
-                result_text_clean = res_text.split("Negativo")[0].strip()
-                if result_text_clean: result_text_found = f"{result_text_clean} (+)"
-            break
-    current_culture_data["Resultado"] = result_text_found
-    antibiogram_results, antibiogram_start_idx_in_block = {"S": [], "I": [], "R": []}, -1
-    for k, abg_line in enumerate(block_lines):
-        if any(term in abg_line.lower() for term in ["antibiograma", "tsa", "teste de sensibilidade"]):
-            antibiogram_start_idx_in_block = k; break
-    if antibiogram_start_idx_in_block != -1:
-        for k_abg in range(antibiogram_start_idx_in_block + 1, len(block_lines)):
-            line_abg = block_lines[k_abg].strip()
-            if not line_abg or "legenda:" in line_abg.lower() or "valor de referência" in line_abg.lower() or \
-               line_abg.lower().startswith("método:") or line_abg.lower().startswith("nota:"): break
-            m = re.match(r"^\s*([a-zA-ZÀ-ÿ0-9\s.,()/-]+?)\s+[.,:]*\s*([SIR])\b", line_abg, re.IGNORECASE) or \
-                re.match(r"^\s*([a-zA-ZÀ-ÿ0-9\s.,()/-]+?)\s+.*?\b([SIR])\s*$", line_abg, re.IGNORECASE)
-            if m:
-                name, code = re.sub(r'\s*\.\s*', '', m.group(1).strip()).strip(), m.group(2).upper()
-                if code in antibiogram_results: antibiogram_results[code].append(name)
-    current_culture_data["Antibiograma"] = antibiogram_results
-    return current_culture_data
+def resposta_em_cache(cache_key, usar_cache=None):
+    """Cached RespostaIA for `cache_key`, or None; `usar_cache=None` follows the session's bypass checkbox."""
+    if usar_cache is None: usar_cache = cache_ia_ativo()
+    entry = get_response_cache().get(cache_key, bypass=not usar_cache)
+    return RespostaIA(entry[0], entry[1], do_cache=True) if entry is not None else None
 
 # --- Funções de Interação com IA Gemini ---
 # --- Função de Processamento de Arquivos para Gemini ---
@@ -1074,7 +609,7 @@ def process_uploaded_files_for_gemini(uploaded_files):
             file_bytes = f.getvalue()
             
             if f.type and f.type.startswith('image/'):
-                img = Image.open(io.BytesIO(file_bytes))
+                img = lazy_import("PIL.Image").open(io.BytesIO(file_bytes))
                 # Convert RGBA to RGB if needed (Gemini prefers RGB)
                 if img.mode == 'RGBA':
                     img = img.convert('RGB')
@@ -1102,61 +637,258 @@ def process_uploaded_files_for_gemini(uploaded_files):
     return parts, file_descriptions
 
 
-def gerar_resposta_ia(prompt_text, file_parts=None):
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+HEADERS_PARA_ESPACO = [
+    "#CUIDADOS PALIATIVOS:", "#ID:", "#HD:", "#AP:", "#HDA:", "#MUC:",
+    "#ALERGIAS:", "#ATB:", "#TEV:", "#EXAMES:", "#EVOLUÇÃO:",
+    "#EXAME FÍSICO:", "#PLANO TERAPÊUTICO:", "#CONDUTA:"
+]
+
+NOTA_IA_PATTERN = re.compile(r"\[IA:[^\]]*?\]")
+
+def montar_conteudo_ia(prompt_text, file_parts=None):
+    """Multimodal content for generate_content: the prompt alone, or prompt + files."""
+    return [prompt_text] + file_parts if file_parts else prompt_text
+
+def pos_processar_resposta_ia(processed_text):
+    """Strip [IA:...] notes, add a blank line after section headers, collapse blank runs and anonymize."""
+    processed_text = NOTA_IA_PATTERN.sub("", processed_text)
+    final_lines_with_spacing = []
+    lines_response = processed_text.splitlines()
+    for i, line in enumerate(lines_response):
+        final_lines_with_spacing.append(line)
+        if line.strip() and any(line.strip().startswith(h) for h in HEADERS_PARA_ESPACO):
+            if i + 1 < len(lines_response):
+                if lines_response[i+1].strip() != "" and not lines_response[i+1].strip().startswith("#"):
+                    final_lines_with_spacing.append("")
+            elif i + 1 == len(lines_response):
+                 final_lines_with_spacing.append("")
+    cleaned_final_lines = []
+    previous_line_was_blank = False
+    for line in final_lines_with_spacing:
+        is_current_line_blank = not line.strip()
+        if not (previous_line_was_blank and is_current_line_blank):
+            cleaned_final_lines.append(line)
+        previous_line_was_blank = is_current_line_blank
+    processed_text = "\n".join(cleaned_final_lines)
+    return anonimizar_texto(processed_text)
+
+class PosProcessadorStream:
+    """pos_processar_resposta_ia applied chunk by chunk to a streamed answer.
+
+    Only complete lines are released, and never in the middle of an [IA:...] note,
+    so once `finalizar()` is called `texto` equals pos_processar_resposta_ia(full text).
+    A header's blank line waits for the next line, as in the batch version.
+    """
+
+    def __init__(self):
+        self._pendente = ""
+        self.linhas = []
+        self._cabecalho_anterior = False
+        self._anterior_em_branco = False
+
+    def _limite_seguro(self):
+        """End (exclusive) of the prefix of the pending text that can be processed now."""
+        notas = list(NOTA_IA_PATTERN.finditer(self._pendente))
+        aberta = self._pendente.find("[IA:", notas[-1].end() if notas else 0)
+        fim = self._pendente.rfind("\n", 0, len(self._pendente) if aberta == -1 else aberta) + 1
+        for nota in reversed(notas):
+            if nota.start() < fim < nota.end(): fim = self._pendente.rfind("\n", 0, nota.start()) + 1
+        return fim
+
+    def _emitir(self, linha):
+        em_branco = not linha.strip()
+        if not (self._anterior_em_branco and em_branco): self.linhas.append(anonimizar_texto(linha))
+        self._anterior_em_branco = em_branco
+
+    def _processar(self, trecho):
+        for linha in NOTA_IA_PATTERN.sub("", trecho).splitlines():
+            if self._cabecalho_anterior and linha.strip() != "" and not linha.strip().startswith("#"):
+                self._emitir("")
+            self._emitir(linha)
+            self._cabecalho_anterior = bool(linha.strip()) and any(linha.strip().startswith(h) for h in HEADERS_PARA_ESPACO)
+
+    def alimentar(self, chunk):
+        self._pendente += chunk
+        fim = self._limite_seguro()
+        if fim:
+            self._processar(self._pendente[:fim])
+            self._pendente = self._pendente[fim:]
+        return self.texto
+
+    def finalizar(self):
+        self._processar(self._pendente)
+        self._pendente = ""
+        if self._cabecalho_anterior: self._emitir("")
+        self._cabecalho_anterior = False
+        return self.texto
+
+    @property
+    def texto(self):
+        # anonimizar_texto(texto completo) descarta a última linha vazia (splitlines)
+        linhas = self.linhas[:-1] if self.linhas and self.linhas[-1] == "" else self.linhas
+        return "\n".join(linhas)
+
+def gerar_resposta_ia(prompt_text, file_parts=None, usar_cache=None):
     if not gemini_available:
         return "Funcionalidade de IA indisponível. Verifique a configuração da API Key."
+    cache_key = chave_cache_ia(prompt_text, file_parts)
+    cached = resposta_em_cache(cache_key, usar_cache)
+    if cached is not None: return cached
     try:
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-        ]
-        
-        # Build multimodal content: text + files
-        if file_parts:
-            content = [prompt_text] + file_parts
-        else:
-            content = prompt_text
-        
-        try:
-            response = gemini_model_pro.generate_content(content, safety_settings=safety_settings)
-        except ResourceExhausted:
-            print("LOG: Cota do 3.0 Pro excedida. Fallback acionado para o 3.0 Flash.")
-            response = gemini_model_flash.generate_content(content, safety_settings=safety_settings)
+        router = get_model_router()
+    except Exception as e:
+        return f"Erro ao configurar a API do Gemini: {e}. Verifique sua chave de API."
+    try:
+        def _gerar(model):
+            model, content = preparar_chamada_ia(model, prompt_text, file_parts)
+            return model.generate_content(content, safety_settings=SAFETY_SETTINGS)
+        response, modelo = router.call(_gerar)
+        texto = RespostaIA(pos_processar_resposta_ia(response.text), modelo)
+        get_response_cache().put(cache_key, modelo, texto)
+        return texto
+    except Exception as e:
+        return f"Erro ao comunicar com a API do Gemini: {e}"
 
-        processed_text = response.text
-        processed_text = re.sub(r"\[IA:[^\]]*?\]", "", processed_text)
-        
-        headers_para_espaco = [
-            "#CUIDADOS PALIATIVOS:", "#ID:", "#HD:", "#AP:", "#HDA:", "#MUC:",
-            "#ALERGIAS:", "#ATB:", "#TEV:", "#EXAMES:", "#EVOLUÇÃO:",
-            "#EXAME FÍSICO:", "#PLANO TERAPÊUTICO:", "#CONDUTA:"
-        ]
-        final_lines_with_spacing = []
-        lines_response = processed_text.splitlines()
-        for i, line in enumerate(lines_response):
-            final_lines_with_spacing.append(line)
-            if line.strip() and any(line.strip().startswith(h) for h in headers_para_espaco):
-                if i + 1 < len(lines_response):
-                    if lines_response[i+1].strip() != "" and not lines_response[i+1].strip().startswith("#"):
-                        final_lines_with_spacing.append("")
-                elif i + 1 == len(lines_response):
-                     final_lines_with_spacing.append("")
-        cleaned_final_lines = []
-        previous_line_was_blank = False
-        for line in final_lines_with_spacing:
-            is_current_line_blank = not line.strip()
-            if not (previous_line_was_blank and is_current_line_blank):
-                cleaned_final_lines.append(line)
-            previous_line_was_blank = is_current_line_blank
-        processed_text = "\n".join(cleaned_final_lines)
-        return anonimizar_texto(processed_text)
+
+# --- Geração em Streaming (texto exibido à medida que chega) ---
+def motivo_fim_ia(chunk):
+    """Finish reason name of a response or stream chunk ("STOP", "SAFETY", "MAX_TOKENS"...), or None while unfinished."""
+    candidatos = getattr(chunk, "candidates", None) or ()
+    motivo = getattr(candidatos[0], "finish_reason", None) if candidatos else None
+    nome = getattr(motivo, "name", motivo)
+    return None if not nome or nome == "FINISH_REASON_UNSPECIFIED" else str(nome)
+
+def gerar_resposta_ia_stream(prompt_text, file_parts=None, usar_cache=None):
+    """Streaming version of gerar_resposta_ia: yields the post-processed text so far, the last yield being the final text."""
+    if not gemini_available:
+        yield "Funcionalidade de IA indisponível. Verifique a configuração da API Key."
+        return
+    cache_key = chave_cache_ia(prompt_text, file_parts)
+    cached = resposta_em_cache(cache_key, usar_cache)
+    if cached is not None:
+        yield cached
+        return
+    try:
+        router = get_model_router()
+    except Exception as e:
+        yield f"Erro ao configurar a API do Gemini: {e}. Verifique sua chave de API."
+        return
+    pos_processador = PosProcessadorStream()
+    try:
+        # Com stream=True o primeiro chunk já é pedido na chamada: erros de cota aparecem aqui. O
+        # roteador guarda o tempo até o primeiro chunk à parte e só conta a latência da rota (a do
+        # orçamento) quando o stream termina de ser lido.
+        def _gerar(model):
+            model, content = preparar_chamada_ia(model, prompt_text, file_parts)
+            return model.generate_content(content, safety_settings=SAFETY_SETTINGS, stream=True)
+        response, modelo = router.call(_gerar, stream=True)
+        motivo = None
+        for chunk in response:
+            motivo = motivo_fim_ia(chunk) or motivo
+            if chunk.parts: yield pos_processador.alimentar(chunk.text)
+        texto = pos_processador.finalizar()
+        # Só uma geração concluída normalmente vai para o cache; um stream cortado (bloqueio de
+        # segurança, limite de tokens) é mostrado com o aviso e pedido de novo no próximo clique.
+        if motivo != "STOP" or not texto.strip():
+            print(f"LOG: Stream do Gemini terminou sem conclusão normal (motivo: {motivo}); resposta não gravada em cache.")
+            if not texto.strip():
+                yield f"Erro ao comunicar com a API do Gemini: resposta vazia (motivo: {motivo})."
+                return
+            yield RespostaIA(f"{texto}\n\n[Resposta incompleta: geração interrompida pela API (motivo: {motivo}).]", modelo)
+            return
+        texto = RespostaIA(texto, modelo)
+        get_response_cache().put(cache_key, modelo, texto)
+        yield texto
+    except Exception as e:
+        yield f"Erro ao comunicar com a API do Gemini: {e}"
+
+def gerar_resposta_ia_na_tela(prompt_text, file_parts=None, mensagem="IA gerando a resposta..."):
+    """Final answer text; with streaming enabled the partial text is shown in place while it arrives."""
+    if not st.session_state.get("ia_streaming", True):
+        with st.spinner(mensagem):
+            texto = gerar_resposta_ia(prompt_text, file_parts=file_parts)
+        avisar_modelo_ia(texto)
+        return texto
+    parcial = st.empty()
+    parcial.caption(mensagem)
+    texto = ""
+    for texto in gerar_resposta_ia_stream(prompt_text, file_parts=file_parts):
+        parcial.text(texto)
+    parcial.empty()
+    avisar_modelo_ia(texto)
+    return texto
+
+def avisar_modelo_ia(resposta):
+    """Toast naming the model that served `resposta` when it was not the preferred one or came from the cache."""
+    modelo = getattr(resposta, "modelo", None)
+    if modelo and (modelo != GEMINI_MODEL_PRO or resposta.do_cache):
+        st.toast(f"Resposta de {modelo}" + (" (cache)" if resposta.do_cache else ""))
+
+
+# --- Geração Assíncrona (artefatos independentes em paralelo) ---
+@st.cache_resource(show_spinner=False)
+def get_ia_event_loop():
+    """One event loop per process, running in a daemon thread.
+
+    The async Gemini client keeps its gRPC channel bound to the loop it was first
+    used on, so every coroutine must run on this same loop (not a fresh asyncio.run).
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="clipdoc-ia-loop", daemon=True).start()
+    return loop
+
+async def gerar_resposta_ia_async(prompt_text, file_parts=None, semaforo=None, usar_cache=True):
+    """Async version of gerar_resposta_ia (generate_content_async, same routing, post-processing and cache).
+
+    Runs on the event loop thread, where st.session_state is not available, so the
+    caller decides `usar_cache`.
+    """
+    if not gemini_available:
+        return "Funcionalidade de IA indisponível. Verifique a configuração da API Key."
+    cache_key = chave_cache_ia(prompt_text, file_parts)
+    cached = resposta_em_cache(cache_key, usar_cache)
+    if cached is not None: return cached
+    try:
+        router = get_model_router()
+    except Exception as e:
+        return f"Erro ao configurar a API do Gemini: {e}. Verifique sua chave de API."
+    try:
+        async def _gerar(model):
+            # Fora do loop: criar o contexto da tarefa na primeira chamada é uma requisição bloqueante.
+            model, content = await asyncio.to_thread(preparar_chamada_ia, model, prompt_text, file_parts)
+            return await model.generate_content_async(content, safety_settings=SAFETY_SETTINGS)
+        async with semaforo or nullcontext():
+            response, modelo = await router.call_async(_gerar)
+        texto = RespostaIA(pos_processar_resposta_ia(response.text), modelo)
+        get_response_cache().put(cache_key, modelo, texto)
+        return texto
     except Exception as e:
         return f"Erro ao comunicar com a API do Gemini: {e}"
 
-def evoluir_paciente_enfermaria_ia_fase1(evolucao_anterior, file_parts=None):
-    prompt = f"""Você é um médico hospitalista sênior, especialista em clínica médica, atuando como consultor de um médico diarista durante a visita de enfermaria. Seu ambiente é um convênio verticalizado: a eficiência (giro de leito, redução do tempo de permanência - LOS) e a prevenção de iatrogenias são tão vitais quanto a precisão diagnóstica. Todas as suas análises são baseadas nas melhores evidências (diretrizes, RCTs).
+def gerar_artefatos_ia(tarefas, max_concorrencia=3, usar_cache=None):
+    """Run independent prompts concurrently, at most `max_concorrencia` calls at a time.
+
+    `tarefas` maps a key to (prompt, file_parts); returns {key: text} in the same order.
+    The total time is roughly that of the slowest call instead of the sum of all of them.
+    """
+    usar_cache = cache_ia_ativo() if usar_cache is None else usar_cache
+
+    async def _gerar_todos():
+        semaforo = asyncio.Semaphore(max_concorrencia)
+        textos = await asyncio.gather(*(gerar_resposta_ia_async(prompt, file_parts, semaforo, usar_cache)
+                                        for prompt, file_parts in tarefas.values()))
+        return OrderedDict(zip(tarefas, textos))
+    return asyncio.run_coroutine_threadsafe(_gerar_todos(), get_ia_event_loop()).result()
+
+
+INSTRUCOES_EVOLUCAO_FASE1 = """Você é um médico hospitalista sênior, especialista em clínica médica, atuando como consultor de um médico diarista durante a visita de enfermaria. Seu ambiente é um convênio verticalizado: a eficiência (giro de leito, redução do tempo de permanência - LOS) e a prevenção de iatrogenias são tão vitais quanto a precisão diagnóstica. Todas as suas análises são baseadas nas melhores evidências (diretrizes, RCTs).
 O usuário enviará informações por texto ou foto. Se houver dados cruciais ilegíveis/ausentes, aponte-os imediatamente. Você apoia a decisão médica, nunca a substitui. Seja implacável na objetividade. Use linguagem clínica árida e direta.
 
 Abaixo está a evolução de um paciente. Para cada caso, gere a resposta EXATAMENTE nesta estrutura:
@@ -1214,14 +946,58 @@ Sinais de alerta para escalonamento/revisão:
 - Cultura positiva com resistência à cobertura empírica → ajustar imediatamente
 - Cultura negativa após 48h em paciente estável com baixa probabilidade pré-teste → considerar suspender
 
-Evolução do paciente:
+"""
+
+def prompt_evolucao_fase1(evolucao_anterior):
+    return PromptIA("evolucao_fase1", f"""Evolução do paciente:
 ---
 {evolucao_anterior}
 ---
+""")
+
+def evoluir_paciente_enfermaria_ia_fase1(evolucao_anterior, file_parts=None):
+    return gerar_resposta_ia(prompt_evolucao_fase1(evolucao_anterior), file_parts=file_parts)
+
+INSTRUCOES_EVOLUCAO_FASE2 = """Você é um médico hospitalista sênior em convênio verticalizado. Sua tarefa é gerar a nota de EVOLUÇÃO MÉDICA para HOJE. Neste modelo, ofereça APENAS as terapias essenciais baseadas em evidência — nada a mais, nada a menos. Evite overtesting e polifarmácia.
+
+REGRA FUNDAMENTAL DE FORMATO: A evolução gerada DEVE preservar a estrutura e formato da 'Evolução Anterior Original' (fornecida em (2)). Tudo que puder ser mantido, DEVE ser mantido. Copie os campos inalterados VERBATIM. Atualize APENAS o que for necessário com base nos novos dados (fornecidos em (3)).
+
+REGRAS ESPECÍFICAS:
+- NÃO use abreviações no texto clínico (anamnese, exame físico, conduta). Escreva por extenso (ex: "Murmúrio vesicular" e não "MV"; "Ruídos hidroaéreos" e não "RHA"; "Membros inferiores" e não "MMII"; "Bulhas rítmicas normofonéticas" e não "BRNF"). EXCEÇÃO: abreviações de exames laboratoriais (Hb, Ht, PCR, TGO, TGP, Na, K, Cr, BNP, etc.) DEVEM ser mantidas como estão — não as expanda.
+- #EXAME FÍSICO: PRESERVE o exame físico da evolução anterior como base. Altere APENAS os itens que o médico explicitamente atualizou nos novos dados. Se o médico informou apenas um achado novo (ex: "edema de membros inferiores"), atualize SOMENTE esse item e mantenha todos os demais itens do exame físico anterior intactos e na mesma ordem.
+- #ID, #HD, #AP, #HDA (ou #HMA/#HPMA): Mantenha EXATAMENTE como estão na evolução anterior, a menos que haja informação diretamente contraditória nos novos dados.
+- #MUC (Medicamentos de Uso Contínuo): Refere-se aos medicamentos que o paciente JÁ USAVA em casa antes da internação (uso crônico/domiciliar). NÃO inclua aqui medicações iniciadas durante a internação atual.
+- #ATB (Antibióticos): Inclua TODOS os antibióticos usados durante esta internação — tanto os já suspensos (com data de início e término) quanto os em uso atual (com data de início e dia de terapia D+X).
+- #ALERGIAS, #TEV (Profilaxia para TEV): Mantenha como na evolução anterior, salvo mudança explícita.
+- #CUIDADOS PALIATIVOS: Omita se não houver informação relevante ou se indicar "não"/"ausente"/"ndn"/vazio.
+- #EXAMES: Mantenha os exames anteriores e ADICIONE os novos resultados fornecidos.
+- #EVOLUÇÃO: Narrativa objetiva do dia, em linguagem clínica direta.
+- #PLANO TERAPÊUTICO e #CONDUTA: Gere novo conteúdo focado no essencial — ajustes necessários, desprescrição ativa de medicações sem indicação, progressão do cuidado. Conduta em primeira pessoa, com hífens.
+- ADICIONE UMA LINHA EM BRANCO APÓS CADA CAMPO PRINCIPAL.
+
+DIRETRIZES DE STEWARDSHIP DE ANTIBIÓTICO (aplicar ao gerar #PLANO TERAPÊUTICO e #CONDUTA):
+Ao recomendar início, manutenção, de-escalação ou término de antibiótico, consulte estas durações baseadas em IDSA/SBI/Sanford:
+- PAC não grave: 5 dias; PAC grave/bacterêmica: 7 dias
+- ITU baixa não complicada: 3-5 dias; Pielonefrite/ITU complicada: 7 dias (fluoroquinolona) ou 10-14 dias (betalactâmico)
+- Celulite não purulenta: 5-6 dias
+- Infecção intra-abdominal com controle de foco: 4-7 dias
+- Bacteriemia por BGN (foco controlado): 7 dias; Bacteriemia por S. aureus: 14 dias mínimo
+Switch IV→VO (COMS - todos presentes): melhora clínica sustentada, via oral disponível, marcadores inflamatórios em queda, estabilidade hemodinâmica ≥24h.
+Quando sugerir início de ATB no #CONDUTA, inclua duração estimada. Quando sugerir switch ou suspensão, justifique com base nos critérios acima.
+
+VERIFICADOR DE SEGURANÇA DE PRESCRIÇÃO (CONDICIONAL):
+Se — e APENAS SE — os 'Novos dados de HOJE' (fornecidos em (3)) incluírem uma prescrição ou lista de medicamentos em uso hospitalar, analise-a silenciosamente e mencione no #CONDUTA QUALQUER um dos seguintes pontos que identificar:
+- Medicações que precisam de ajuste por função renal (use a Cr/eGFR disponíveis): ex. enoxaparina em ClCr<30, metformina em ClCr<45, gabapentina em ClCr<60, ATB nefrotóxicos.
+- Duplicidade terapêutica na mesma classe (ex. dois IECAs, dois BZD, dois IBPs).
+- Interações clinicamente relevantes (ex. AAS+clopidogrel+anticoagulante sem indicação clara, amiodarona+warfarina sem monitoramento).
+- Critérios de Beers em idoso (>65a): BZD de ação prolongada, anti-histamínicos de 1ª geração, relaxantes musculares centrais, antipsicóticos sem indicação psiquiátrica clara.
+- Polifarmácia (>10 medicamentos ativos) — sugerir revisão formal.
+- Profilaxias em falta: TVP farmacológica em paciente de risco (Padua ≥4) sem contraindicação, profilaxia gástrica em paciente com indicação válida (UTI + ventilação mecânica OU coagulopatia, NÃO apenas por uso de corticoide).
+Se NÃO houver prescrição nos dados fornecidos, ignore completamente esta seção — NÃO mencione nada sobre segurança de prescrição.
+
 """
-    return gerar_resposta_ia(prompt, file_parts=file_parts)
 
-def evoluir_paciente_enfermaria_ia_fase2(resumo_ia_fase1, dados_medico_hoje, evolucao_anterior_original, file_parts=None):
+def prompt_evolucao_fase2(resumo_ia_fase1, dados_medico_hoje, evolucao_anterior_original):
     evolucao_anterior_original_anon = anonimizar_texto(evolucao_anterior_original)
     dados_medico_hoje_anon = anonimizar_texto(dados_medico_hoje)
 
@@ -1301,44 +1077,7 @@ def evoluir_paciente_enfermaria_ia_fase2(resumo_ia_fase1, dados_medico_hoje, evo
 
     template_evolucao_final = "".join(template_evolucao_parts)
 
-    prompt = f"""Você é um médico hospitalista sênior em convênio verticalizado. Sua tarefa é gerar a nota de EVOLUÇÃO MÉDICA para HOJE. Neste modelo, ofereça APENAS as terapias essenciais baseadas em evidência — nada a mais, nada a menos. Evite overtesting e polifarmácia.
-
-REGRA FUNDAMENTAL DE FORMATO: A evolução gerada DEVE preservar a estrutura e formato da 'Evolução Anterior Original' (fornecida em (2)). Tudo que puder ser mantido, DEVE ser mantido. Copie os campos inalterados VERBATIM. Atualize APENAS o que for necessário com base nos novos dados (fornecidos em (3)).
-
-REGRAS ESPECÍFICAS:
-- NÃO use abreviações no texto clínico (anamnese, exame físico, conduta). Escreva por extenso (ex: "Murmúrio vesicular" e não "MV"; "Ruídos hidroaéreos" e não "RHA"; "Membros inferiores" e não "MMII"; "Bulhas rítmicas normofonéticas" e não "BRNF"). EXCEÇÃO: abreviações de exames laboratoriais (Hb, Ht, PCR, TGO, TGP, Na, K, Cr, BNP, etc.) DEVEM ser mantidas como estão — não as expanda.
-- #EXAME FÍSICO: PRESERVE o exame físico da evolução anterior como base. Altere APENAS os itens que o médico explicitamente atualizou nos novos dados. Se o médico informou apenas um achado novo (ex: "edema de membros inferiores"), atualize SOMENTE esse item e mantenha todos os demais itens do exame físico anterior intactos e na mesma ordem.
-- #ID, #HD, #AP, #HDA (ou #HMA/#HPMA): Mantenha EXATAMENTE como estão na evolução anterior, a menos que haja informação diretamente contraditória nos novos dados.
-- #MUC (Medicamentos de Uso Contínuo): Refere-se aos medicamentos que o paciente JÁ USAVA em casa antes da internação (uso crônico/domiciliar). NÃO inclua aqui medicações iniciadas durante a internação atual.
-- #ATB (Antibióticos): Inclua TODOS os antibióticos usados durante esta internação — tanto os já suspensos (com data de início e término) quanto os em uso atual (com data de início e dia de terapia D+X).
-- #ALERGIAS, #TEV (Profilaxia para TEV): Mantenha como na evolução anterior, salvo mudança explícita.
-- #CUIDADOS PALIATIVOS: Omita se não houver informação relevante ou se indicar "não"/"ausente"/"ndn"/vazio.
-- #EXAMES: Mantenha os exames anteriores e ADICIONE os novos resultados fornecidos.
-- #EVOLUÇÃO: Narrativa objetiva do dia, em linguagem clínica direta.
-- #PLANO TERAPÊUTICO e #CONDUTA: Gere novo conteúdo focado no essencial — ajustes necessários, desprescrição ativa de medicações sem indicação, progressão do cuidado. Conduta em primeira pessoa, com hífens.
-- ADICIONE UMA LINHA EM BRANCO APÓS CADA CAMPO PRINCIPAL.
-
-DIRETRIZES DE STEWARDSHIP DE ANTIBIÓTICO (aplicar ao gerar #PLANO TERAPÊUTICO e #CONDUTA):
-Ao recomendar início, manutenção, de-escalação ou término de antibiótico, consulte estas durações baseadas em IDSA/SBI/Sanford:
-- PAC não grave: 5 dias; PAC grave/bacterêmica: 7 dias
-- ITU baixa não complicada: 3-5 dias; Pielonefrite/ITU complicada: 7 dias (fluoroquinolona) ou 10-14 dias (betalactâmico)
-- Celulite não purulenta: 5-6 dias
-- Infecção intra-abdominal com controle de foco: 4-7 dias
-- Bacteriemia por BGN (foco controlado): 7 dias; Bacteriemia por S. aureus: 14 dias mínimo
-Switch IV→VO (COMS - todos presentes): melhora clínica sustentada, via oral disponível, marcadores inflamatórios em queda, estabilidade hemodinâmica ≥24h.
-Quando sugerir início de ATB no #CONDUTA, inclua duração estimada. Quando sugerir switch ou suspensão, justifique com base nos critérios acima.
-
-VERIFICADOR DE SEGURANÇA DE PRESCRIÇÃO (CONDICIONAL):
-Se — e APENAS SE — os 'Novos dados de HOJE' (fornecidos em (3)) incluírem uma prescrição ou lista de medicamentos em uso hospitalar, analise-a silenciosamente e mencione no #CONDUTA QUALQUER um dos seguintes pontos que identificar:
-- Medicações que precisam de ajuste por função renal (use a Cr/eGFR disponíveis): ex. enoxaparina em ClCr<30, metformina em ClCr<45, gabapentina em ClCr<60, ATB nefrotóxicos.
-- Duplicidade terapêutica na mesma classe (ex. dois IECAs, dois BZD, dois IBPs).
-- Interações clinicamente relevantes (ex. AAS+clopidogrel+anticoagulante sem indicação clara, amiodarona+warfarina sem monitoramento).
-- Critérios de Beers em idoso (>65a): BZD de ação prolongada, anti-histamínicos de 1ª geração, relaxantes musculares centrais, antipsicóticos sem indicação psiquiátrica clara.
-- Polifarmácia (>10 medicamentos ativos) — sugerir revisão formal.
-- Profilaxias em falta: TVP farmacológica em paciente de risco (Padua ≥4) sem contraindicação, profilaxia gástrica em paciente com indicação válida (UTI + ventilação mecânica OU coagulopatia, NÃO apenas por uso de corticoide).
-Se NÃO houver prescrição nos dados fornecidos, ignore completamente esta seção — NÃO mencione nada sobre segurança de prescrição.
-
-(1) Análise da IA (consultor hospitalista) sobre a evolução anterior:
+    return PromptIA("evolucao_fase2", f"""(1) Análise da IA (consultor hospitalista) sobre a evolução anterior:
 ---
 {resumo_ia_fase1}
 ---
@@ -1355,13 +1094,14 @@ Se NÃO houver prescrição nos dados fornecidos, ignore completamente esta seç
 
 Gere a nota de EVOLUÇÃO MÉDICA para HOJE, preenchendo o modelo abaixo. Lembre-se: preserve o formato e conteúdo da evolução anterior, atualizando SOMENTE o necessário:
 {template_evolucao_final}
-"""
+""")
+
+def evoluir_paciente_enfermaria_ia_fase2(resumo_ia_fase1, dados_medico_hoje, evolucao_anterior_original, file_parts=None):
+    prompt = prompt_evolucao_fase2(resumo_ia_fase1, dados_medico_hoje, evolucao_anterior_original)
     return gerar_resposta_ia(prompt, file_parts=file_parts)
 
 
-def gerar_passagem_caso_sbar_ia(evolucao_final):
-    evolucao_anon = anonimizar_texto(evolucao_final)
-    prompt = f"""Você é um médico hospitalista sênior preparando uma passagem de caso para o plantão noturno ou cobertura de fim de semana.
+INSTRUCOES_PASSAGEM_CASO_SBAR = """Você é um médico hospitalista sênior preparando uma passagem de caso para o plantão noturno ou cobertura de fim de semana.
 
 Gere uma passagem de caso estruturada no formato SBAR, em linguagem clínica direta e objetiva. A passagem deve ser CONCISA (máximo 1 página), acionável e focada no que o colega precisa saber para tomar decisões seguras.
 
@@ -1391,52 +1131,23 @@ REGRAS:
 - Seja direto. O colega que recebe a passagem tem 5-10 minutos para ler. Elimine qualquer palavra que não agregue decisão.
 - Se a evolução fornecida não contém informação para uma seção, indique "(não disponível na evolução)".
 
-Evolução atual do paciente:
+"""
+
+def prompt_passagem_caso_sbar(evolucao_final):
+    evolucao_anon = anonimizar_texto(evolucao_final)
+    return PromptIA("passagem_caso_sbar", f"""Evolução atual do paciente:
 ---
 {evolucao_anon}
 ---
 
 Gere a passagem de caso SBAR:
-"""
-    return gerar_resposta_ia(prompt)
-
-
-def preencher_admissao_ia(info_caso_original, file_parts=None):
-    info_caso = anonimizar_texto(info_caso_original)
-    template_admissao = """# UNIDADE DE INTERNAÇÃO - ADMISSÃO #
-
-#ID:
-
-#HD:
-
-#AP:
-
-#HDA:
-
-#MUC:
-
-#ALERGIAS:
-
-#ATB:
-
-#TEV:
-
-#EXAMES:
->MICROBIOLOGIA:
->IMAGEM:
->LABS:
-
-#AVALIAÇÃO:
-
-#EXAME FÍSICO:
-
-#PLANO TERAPÊUTICO:
+""")
 
-#CONDUTA:
+def gerar_passagem_caso_sbar_ia(evolucao_final):
+    return gerar_resposta_ia(prompt_passagem_caso_sbar(evolucao_final))
 
-#DATA PROVÁVEL DA ALTA: SEM PREVISÃO"""
 
-    prompt = f"""Você é um médico hospitalista sênior em convênio verticalizado. Neste modelo, ofereça APENAS as terapias essenciais baseadas em evidência — nada a mais, nada a menos. Evite overtesting e polifarmácia desde a admissão.
+INSTRUCOES_ADMISSAO = """Você é um médico hospitalista sênior em convênio verticalizado. Neste modelo, ofereça APENAS as terapias essenciais baseadas em evidência — nada a mais, nada a menos. Evite overtesting e polifarmácia desde a admissão.
 
 Sua tarefa é preencher o modelo de ADMISSÃO HOSPITALAR com as informações fornecidas sobre o caso. Siga as regras rigorosamente:
 
@@ -1477,19 +1188,56 @@ Baseado em IDSA/SBI/Sanford. Ao propor ATB empírico, SEMPRE inclua duração es
 - Sepse sem foco definido: ampla cobertura (piperacilina-tazobactam ou cefepime, ± vancomicina); ajustar em 48-72h com culturas.
 Nunca iniciar ATB sem: (1) coleta prévia de culturas sempre que possível, (2) diagnóstico presuntivo claro, (3) duração estimada, (4) plano de reavaliação em 48-72h.
 
-Informações do caso:
+"""
+
+def prompt_admissao(info_caso_original):
+    info_caso = anonimizar_texto(info_caso_original)
+    template_admissao = """# UNIDADE DE INTERNAÇÃO - ADMISSÃO #
+
+#ID:
+
+#HD:
+
+#AP:
+
+#HDA:
+
+#MUC:
+
+#ALERGIAS:
+
+#ATB:
+
+#TEV:
+
+#EXAMES:
+>MICROBIOLOGIA:
+>IMAGEM:
+>LABS:
+
+#AVALIAÇÃO:
+
+#EXAME FÍSICO:
+
+#PLANO TERAPÊUTICO:
+
+#CONDUTA:
+
+#DATA PROVÁVEL DA ALTA: SEM PREVISÃO"""
+
+    return PromptIA("admissao", f"""Informações do caso:
 ---
 {info_caso}
 ---
 
 Preencha o modelo abaixo:
 {template_admissao}
-"""
-    return gerar_resposta_ia(prompt, file_parts=file_parts)
+""")
 
-def gerar_resumo_alta_ia(ultima_evolucao_original, file_parts=None):
-    ultima_evolucao = anonimizar_texto(ultima_evolucao_original)
-    prompt = f"""Você é um médico hospitalista experiente. Suas orientações sempre são guiadas por evidência científica e, em casos em que há evidência fraca, você levanta e discute quais são as condutas possíveis. Para orientações de alta, você utiliza uma linguagem clara e direta e evita jargão médico.
+def preencher_admissao_ia(info_caso_original, file_parts=None):
+    return gerar_resposta_ia(prompt_admissao(info_caso_original), file_parts=file_parts)
+
+INSTRUCOES_RESUMO_ALTA = """Você é um médico hospitalista experiente. Suas orientações sempre são guiadas por evidência científica e, em casos em que há evidência fraca, você levanta e discute quais são as condutas possíveis. Para orientações de alta, você utiliza uma linguagem clara e direta e evita jargão médico.
 
 Com base na última evolução do paciente fornecida abaixo, redija um resumo de alta hospitalar conciso e claro, estruturado em dois ou três parágrafos.
 O resumo deve incluir:
@@ -1500,176 +1248,123 @@ O resumo deve incluir:
 Adicione uma linha em branco entre cada parágrafo.
 Não utilizar tags de formatação, como "**" para negrito.
 
-Última Evolução:
+"""
+
+def prompt_resumo_alta(ultima_evolucao_original):
+    ultima_evolucao = anonimizar_texto(ultima_evolucao_original)
+    return PromptIA("resumo_alta", f"""Última Evolução:
 ---
 {ultima_evolucao}
 ---
 Resumo de Alta (em 2 ou 3 parágrafos):
-"""
-    return gerar_resposta_ia(prompt, file_parts=file_parts)
+""")
 
-def gerar_orientacoes_alta_ia(caso_paciente_original, file_parts=None):
-    caso_paciente = anonimizar_texto(caso_paciente_original)
-    prompt = f"""Você é um médico hospitalista experiente, e suas orientações sempre são guiadas por evidência científica. Em casos em que há evidência fraca, você levanta e discute quais são as condutas possíveis.
+def gerar_resumo_alta_ia(ultima_evolucao_original, file_parts=None):
+    return gerar_resposta_ia(prompt_resumo_alta(ultima_evolucao_original), file_parts=file_parts)
+
+INSTRUCOES_ORIENTACOES_ALTA = """Você é um médico hospitalista experiente, e suas orientações sempre são guiadas por evidência científica. Em casos em que há evidência fraca, você levanta e discute quais são as condutas possíveis.
 Para orientações de alta, você utiliza uma linguagem clara e direta e evita jargão médico.
 
 Com base no caso do paciente descrito abaixo (diagnóstico e antecedentes), gere orientações de alta pertinentes sobre sinais e sintomas de alerta que indicariam a necessidade de retornar ao Pronto-Socorro.
 Apresente as orientações em formato de lista, com cada item iniciando com um hífen. Adicione uma linha em branco entre cada item da lista.
 
-Caso do Paciente:
+"""
+
+def prompt_orientacoes_alta(caso_paciente_original):
+    caso_paciente = anonimizar_texto(caso_paciente_original)
+    return PromptIA("orientacoes_alta", f"""Caso do Paciente:
 ---
 {caso_paciente}
 ---
 Orientações de Alta (Sinais de Alerta para Retorno ao PS):
-"""
-    return gerar_resposta_ia(prompt, file_parts=file_parts)
-
+""")
 
+def gerar_orientacoes_alta_ia(caso_paciente_original, file_parts=None):
+    return gerar_resposta_ia(prompt_orientacoes_alta(caso_paciente_original), file_parts=file_parts)
+
+INSTRUCOES_IA = {
+    "evolucao_fase1": INSTRUCOES_EVOLUCAO_FASE1,
+    "evolucao_fase2": INSTRUCOES_EVOLUCAO_FASE2,
+    "passagem_caso_sbar": INSTRUCOES_PASSAGEM_CASO_SBAR,
+    "admissao": INSTRUCOES_ADMISSAO,
+    "resumo_alta": INSTRUCOES_RESUMO_ALTA,
+    "orientacoes_alta": INSTRUCOES_ORIENTACOES_ALTA,
+}
 
-# --- Função Principal de Análise de Exames (parse_lab_report) ---
-def parse_lab_report(text):
-    is_tecnolab = "tecnolab.com.br" in text.lower()
-    
-    subs = [(r"Creatinina(?!\s*Kinase|\s*quinase)", "Creatinina ")]
-    for p, r in subs: text = re.sub(f"(?i){p}", r, text)
-    text = re.sub(r"(?i)ur[eé]ia", "Ureia", text)
-    text = re.sub(r"(?i)pot[aá]ssio", "Potássio", text)
-    text = re.sub(r"(?i)s[oó]dio", "Sódio", text)
-    text = re.sub(r"(?i)c[aá]lcio i[oô]nico", "Cálcio Iônico", text)
-    text = re.sub(r"(?i)magn[eé]sio", "Magnésio", text)
-
-    lines = [line.strip() for line in text.splitlines() if line.strip()]
-
-    all_res = {"datetime": extract_datetime_info(lines, is_tecnolab)}
-    for ext_func in [extract_hemograma_completo, extract_coagulograma, extract_funcao_renal_e_eletrólitos,
-                     extract_marcadores_inflamatorios_cardiacos, extract_hepatograma_pancreas,
-                     extract_medicamentos, extract_gasometria, extract_sorologias, extract_urina_tipo_i]:
-        all_res.update(ext_func(lines, is_tecnolab))
-
-    all_res["culturas_list"] = extract_culturas(lines, is_tecnolab)
-
-    out_sections = {s: [] for s in ["HEADER", "HEMOGRAMA", "COAGULOGRAMA", "FUNCAO_RENAL_ELETRÓLITOS_GLI",
-                                     "MARCADORES_INFLAM_CARD", "HEPATOGRAMA_PANCREAS", "MEDICAMENTOS", "GASOMETRIA",
-                                     "URINA_I", "SOROLOGIAS", "CULTURAS", "OUTROS"]}
-
-    if all_res.get("datetime"): out_sections["HEADER"].append(all_res["datetime"])
-
-    for k, lbl in [("Hb","Hb"),("Ht","Ht"),("VCM","VCM"),("HCM","HCM"),("CHCM","CHCM"),("RDW","RDW")]:
-        if all_res.get(k): out_sections["HEMOGRAMA"].append(format_value_with_alert(lbl, all_res[k], k))
-    
-    l_str = format_value_with_alert("Leuco", all_res.get("Leuco",""), "Leuco", unit_suffix=all_res.get("Leuco_unit", ""))
-    if l_str:
-        diff_str = all_res.get("Leuco_Diff", "")
-        if "Neut" in diff_str or "Linf" in diff_str:
-            l_str += f" {diff_str}"
-        out_sections["HEMOGRAMA"].append(l_str)
-    
-    p_str = format_value_with_alert("Plaq", all_res.get("Plaq", ""), "Plaq", unit_suffix=all_res.get("Plaq_unit", ""))
-    if p_str:
-        out_sections["HEMOGRAMA"].append(p_str)
-
-    tp_raw, inr_raw = all_res.get("TP_s",""), all_res.get("INR","")
-    tp_fmt = format_value_with_alert("TP", tp_raw, "TP_s").replace("TP ","") if tp_raw else ""
-    inr_fmt = format_value_with_alert("INR", inr_raw, "INR").replace("INR ","") if inr_raw else ""
-    coag_p = []
-    if tp_fmt:
-        tp_inr_s = f"TP {tp_fmt}"
-        if inr_fmt: tp_inr_s += f" (INR {inr_fmt})"
-        coag_p.append(tp_inr_s)
-    ttpa_s_raw, ttpa_r_raw = all_res.get("TTPA_s",""), all_res.get("TTPA_R","")
-    ttpa_s_fmt = format_value_with_alert("TTPA", ttpa_s_raw, "TTPA_s").replace("TTPA ","") if ttpa_s_raw else ""
-    ttpa_r_fmt = format_value_with_alert("R", ttpa_r_raw, "TTPA_R").replace("R ","") if ttpa_r_raw else ""
-    if ttpa_s_fmt:
-        ttpa_s = f"TTPA {ttpa_s_fmt}"
-        if ttpa_r_fmt: ttpa_s += f" (R {ttpa_r_fmt})"
-        coag_p.append(ttpa_s)
-    if coag_p: out_sections["COAGULOGRAMA"].append(" ; ".join(coag_p))
-
-    if all_res.get("U"): out_sections["FUNCAO_RENAL_ELETRÓLITOS_GLI"].append(format_value_with_alert("U", all_res["U"], "U"))
-    cr_raw, egfr_raw = all_res.get("Cr",""), all_res.get("eGFR","")
-    cr_fmt = format_value_with_alert("Cr", cr_raw, "Cr").replace("Cr ", "") if cr_raw else ""
-    egfr_fmt = format_value_with_alert("eGFR", egfr_raw, "eGFR").replace("eGFR ", "") if egfr_raw else ""
-    cr_egfr_s = f"Cr {cr_fmt}" if cr_fmt else ""
-    if egfr_fmt:
-        cr_egfr_s = (cr_egfr_s + f" ({egfr_fmt})") if cr_egfr_s else egfr_fmt
-
-    if cr_egfr_s: out_sections["FUNCAO_RENAL_ELETRÓLITOS_GLI"].append(cr_egfr_s)
-
-    for k, lbl in [("Na","Na"),("K","K"),("Cl","Cl"),("Mg","Mg"),("CaI","CaI"), ("CaT","CaT"), ("P","P"),("Gli","Gli")]:
-        if all_res.get(k): out_sections["FUNCAO_RENAL_ELETRÓLITOS_GLI"].append(format_value_with_alert(lbl, all_res[k], k))
-    try:
-        na,cl = convert_to_float(clean_number_format(all_res.get("Na",""))), convert_to_float(clean_number_format(all_res.get("Cl","")))
-        hco3_s = next((all_res.get(k) for k in [f"{p}HCO3_gas" for p in ["GA_","GV_",""]] if all_res.get(k)), None)
-        hco3 = convert_to_float(clean_number_format(hco3_s if hco3_s else ""))
-        if na and cl and hco3: out_sections["FUNCAO_RENAL_ELETRÓLITOS_GLI"].append(f"AGap {(na-(cl+hco3)):.1f}")
-    except: pass
-
-    for k, lbl in [("PCR","PCR"),("Lac","Lactato"),("Trop","TnT-hs"),("DD","D-Dímero"), ("NT-proBNP", "NT-proBNP")]:
-         if all_res.get(k): out_sections["MARCADORES_INFLAM_CARD"].append(format_value_with_alert(lbl, all_res[k], k))
-    
-    if all_res.get("Vanco"): out_sections["MEDICAMENTOS"].append(format_value_with_alert("Vanco", all_res["Vanco"], "Vanco"))
-
-    for k, lbl in [("TGO","TGO"),("TGP","TGP"),("GGT","GGT"),("FA","FA")]:
-        if all_res.get(k): out_sections["HEPATOGRAMA_PANCREAS"].append(format_value_with_alert(lbl, all_res[k], k))
-    bili_p = [format_value_with_alert(lbl,all_res[k],k) for k,lbl in [("BT","BT"),("BD","BD"),("BI","BI")] if all_res.get(k)]
-    if bili_p: out_sections["HEPATOGRAMA_PANCREAS"].append(" ".join(bili_p))
-    for k, lbl in [("ALB","ALB"),("AML","AML"),("LIP","LIP")]:
-        if all_res.get(k): out_sections["HEPATOGRAMA_PANCREAS"].append(format_value_with_alert(lbl, all_res[k], k))
-
-    gas_pfx = ""
-    if any(k.startswith("GA_") for k in all_res.keys()): gas_pfx = "GA_"
-    elif any(k.startswith("GV_") for k in all_res.keys()): gas_pfx = "GV_"
-    
-    gas_params_output = []
-    if gas_pfx or any("_gas" in k and all_res[k] for k in all_res.keys()):
-        gas_order_map = {"pH": "pH_gas", "pCO2": "pCO2_gas", "pO2": "pO2_gas", "HCO3": "HCO3_gas", "BE": "BE_gas", "SatO2": "SatO2_gas", "Lac": "Lac_gas", "cCO2": "cCO2_gas"}
-        for display_label, dict_key_suffix in gas_order_map.items():
-            full_key_to_check = (gas_pfx + dict_key_suffix) if gas_pfx else dict_key_suffix
-            if full_key_to_check in all_res and all_res[full_key_to_check]:
-                gas_params_output.append(format_value_with_alert(display_label, all_res[full_key_to_check], dict_key_suffix))
-
-    if gas_params_output:
-        gas_header = "Gasometria Arterial: " if gas_pfx == "GA_" else "Gasometria Venosa: " if gas_pfx == "GV_" else "Gasometria: "
-        out_sections["GASOMETRIA"].append(gas_header + "; ".join(gas_params_output))
-
-    u1_parts = []
-    for k, lbl in [("U1_pH", "U1_pH"),("U1_dens", "U1_dens"), ("U1_prot", "U1_prot"), ("U1_glic", "U1_glic"),
-                   ("U1_nit", "U1_nit"), ("U1_CC", "U1_CC"), ("U1_hem", "U1_hem"), ("U1_leuco", "U1_leuco")]:
-        if all_res.get(k):
-             u1_parts.append(f"{lbl} {all_res[k]}")
-    if u1_parts:
-        out_sections["URINA_I"].append(" ; ".join(u1_parts))
-
-    soro_map = {"HIV":"Anti HIV 1/2","HAV_IgM":"Anti-HAV IgM","HBsAg":"HBsAg","AntiHBs":"Anti-HBs",
-                "AntiHBc_Total":"Anti-HBc Total","HCV":"Anti-HCV","VDRL":"VDRL"}
-    for k, lbl in soro_map.items():
-        if all_res.get(k): out_sections["SOROLOGIAS"].append(f"{lbl} {all_res[k]}")
-
-    if all_res.get("culturas_list"):
-        for cult_info in all_res["culturas_list"]:
-            c_str = f"{cult_info.get('Tipo','')} {cult_info.get('Resultado','')}"
-            abg = cult_info.get("Antibiograma",{})
-            abg_p = [f"{s[0]}: {', '.join(abg[s[0]])}" for s in ["S","I","R"] if abg.get(s[0])]
-            if abg_p: c_str += " / "+" | ".join(abg_p)
-            out_sections["CULTURAS"].append(c_str.strip())
-
-    section_order = ["HEADER","HEMOGRAMA","COAGULOGRAMA","FUNCAO_RENAL_ELETRÓLITOS_GLI",
-                     "MARCADORES_INFLAM_CARD", "MEDICAMENTOS", "HEPATOGRAMA_PANCREAS",
-                     "GASOMETRIA","URINA_I","SOROLOGIAS","CULTURAS","OUTROS"]
-    final_out = [" ; ".join(out_sections[s_k]) for s_k in section_order if out_sections[s_k]]
-    return " ; ".join(filter(None, final_out)) + (";" if any(final_out) else "")
+def gerar_pacote_alta_ia(ultima_evolucao_original, caso_paciente_original=None, file_parts=None, max_concorrencia=3):
+    """SBAR, discharge summary and discharge instructions generated concurrently for one patient.
+
+    The instructions use `caso_paciente_original` when given, otherwise the last evolution
+    itself (it already carries diagnoses and history). As in the individual buttons, the
+    SBAR handoff is built from the text only.
+    """
+    caso_paciente_original = caso_paciente_original or ultima_evolucao_original
+    return gerar_artefatos_ia(OrderedDict([
+        ("sbar", (prompt_passagem_caso_sbar(ultima_evolucao_original), None)),
+        ("resumo_alta", (prompt_resumo_alta(ultima_evolucao_original), file_parts)),
+        ("orientacoes_alta", (prompt_orientacoes_alta(caso_paciente_original), file_parts)),
+    ]), max_concorrencia=max_concorrencia)
+
+
+# --- Cache de Análises (compartilhado entre reruns e sessões) ---
+@st.cache_resource
+def get_parse_cache():
+    return ParseCache()
+
+@st.cache_resource
+def get_block_cache():
+    """Per-block extractor results (see parse_lab_report_structured): an edited paste re-runs only what changed."""
+    return ParseCache(maxsize=4096)
+
+def analisar_exames(texto_exame, separar_coletas=False, profile=None, range_set=None):
+    """Anonymize + parse for the tab1 button, memoized by content hash. Returns a list of LabResult.
+
+    On a miss the report is parsed incrementally against the shared block
+    cache. With a ParseProfile both caches are bypassed (a hit would have
+    nothing to measure) and the profile's records are logged.
+    """
+    def _compute():
+        texto_anonimizado = anonimizar_texto(texto_exame)
+        block_cache = get_block_cache() if profile is None else None
+        if separar_coletas:
+            return list(parse_lab_report_stream(texto_anonimizado, structured=True, profile=profile,
+                                                range_set=range_set, block_cache=block_cache))
+        return [parse_lab_report_structured(texto_anonimizado, profile=profile, range_set=range_set,
+                                            block_cache=block_cache)]
+    if profile is not None:
+        resultados = _compute()
+        profile.log()
+        return resultados
+    return get_parse_cache().get_or_compute(ParseCache.key_for(texto_exame, separar_coletas, range_set), _compute)
 
 
 # ============================================================
 # CHANGE 3: Color-coded HTML output function
 # ============================================================
-def colorize_output_html(plain_text):
-    """Convert plain text output to color-coded HTML for display."""
+def colorize_output_html(plain_text, lab_results=None):
+    """Convert plain text output to color-coded HTML for display.
+
+    When the LabResult objects behind `plain_text` are given, flagged values and
+    collection datetimes are taken from them instead of being re-parsed.
+    """
     if not plain_text:
         return '<span style="color: #999; font-style: italic;">Aguardando análise...</span>'
     
     import html as html_module
     safe = html_module.escape(plain_text)
+
+    if lab_results is not None:
+        css_by_text = {}
+        for result in lab_results:
+            if result.datetime: css_by_text[html_module.escape(result.datetime)] = "cd-datetime"
+            for lab_value in result.flagged():
+                css_class = "cd-val-crit" if lab_value.alert == ALERTA_CRITICO else "cd-val-alert"
+                css_by_text[html_module.escape(lab_value.text)] = css_class
+        if not css_by_text:
+            return safe
+        alternation = "|".join(re.escape(t) for t in sorted(css_by_text, key=len, reverse=True))
+        return re.sub(r"(?<![\w.])(" + alternation + r")",
+                      lambda m: f'<span class="{css_by_text[m.group(1)]}">{m.group(1)}</span>', safe)
     
     # Highlight critical values (!)
     safe = re.sub(
@@ -1691,9 +1386,9 @@ def colorize_output_html(plain_text):
         safe
     )
     
-    # Highlight datetime at the beginning
+    # Highlight datetime at the beginning (of each collection line)
     safe = re.sub(
-        r'^(\d{2}/\d{2}\s+\d{2}h\d{2})',
+        r'(?m)^(\d{2}/\d{2}\s+\d{2}h\d{2})',
         r'<span class="cd-datetime">\1</span>',
         safe
     )
@@ -1756,7 +1451,7 @@ def render_file_uploader(key_suffix, help_text="Anexe imagens ou PDFs com exames
         )
     
     with col_paste:
-        paste_result = pbutton(
+        paste_result = lazy_import("streamlit_paste_button").paste_image_button(
             label="📋 Colar",
             text_color="#ffffff",
             background_color="#0F6E56",
@@ -1850,8 +1545,6 @@ st.markdown("""
 
 if not GOOGLE_API_KEY and api_key_source != "secrets":
     st.warning("Chave da API do Google não configurada. Funcionalidades de IA estarão desabilitadas.")
-elif GOOGLE_API_KEY and not gemini_available and 'gemini_config_error' in st.session_state:
-     st.error(st.session_state.gemini_config_error)
 
 # --- Session State Initialization ---
 for key, default in [
@@ -1864,8 +1557,13 @@ for key, default in [
     ("ia_output_sbar", ""),
     ("ia_output_resumo_alta", ""),
     ("ia_output_orientacoes_alta", ""),
+    ("ia_streaming", True),
+    ("ia_cache_bypass", False),
     ("input_text_area_content_tab1", ""),
     ("saida_exames", ""),
+    ("saida_exames_estruturada", None),
+    ("saida_exames_tendencia", None),
+    ("perfil_parse_tab1", None),
     ("show_about_tab1", False),
     ("show_compatible_exams_detailed_tab1", False),
 ]:
@@ -1899,9 +1597,20 @@ with tab1:
                 current_input_tab1 = st.session_state.entrada_widget_tab1
                 if current_input_tab1:
                     with st.spinner("Analisando..."):
-                        texto_anonimizado_exames = anonimizar_texto(current_input_tab1)
-                        resultado_processado = parse_lab_report(texto_anonimizado_exames)
+                        perfil = ParseProfile("tab1") if st.query_params.get("debug") == "1" else None
+                        modo_tendencia = bool(st.session_state.get("modo_tendencia_tab1"))
+                        resultados_estruturados = analisar_exames(
+                            current_input_tab1,
+                            separar_coletas=modo_tendencia or bool(st.session_state.get("separar_coletas_tab1")),
+                            profile=perfil, range_set=st.session_state.get("valores_referencia_tab1", "padrao")
+                        )
+                        st.session_state["perfil_parse_tab1"] = perfil.records() if perfil else None
+                        tendencia = LabTrendStore(resultados_estruturados) if modo_tendencia else None
+                        resultado_processado = tendencia.render() if tendencia else \
+                            "\n".join(r.text for r in resultados_estruturados if r.text)
                         st.session_state["saida_exames"] = resultado_processado
+                        st.session_state["saida_exames_estruturada"] = resultados_estruturados
+                        st.session_state["saida_exames_tendencia"] = tendencia
                     st.session_state.input_text_area_content_tab1 = ""
                     st.rerun()
                 else:
@@ -1909,15 +1618,26 @@ with tab1:
         with btn_col2:
             if st.button("Limpar", use_container_width=True, key="btn_limpar_tab1"):
                 st.session_state["saida_exames"] = ""
+                st.session_state["saida_exames_estruturada"] = None
+                st.session_state["saida_exames_tendencia"] = None
                 st.session_state.input_text_area_content_tab1 = ""
                 st.rerun()
+        st.checkbox("Separar por coleta", key="separar_coletas_tab1",
+                    help="Para impressões com várias coletas: gera uma linha por data/hora de coleta.")
+        st.checkbox("Modo tendência", key="modo_tendencia_tab1",
+                    help="Várias coletas do mesmo paciente: uma linha por analito em ordem cronológica (Hb 10.2 → 9.1 → 8.7).")
+        st.selectbox("Valores de referência", list(REFERENCE_RANGE_SETS), key="valores_referencia_tab1",
+                     format_func=lambda nome: {"padrao": "Padrão", "feminino": "Feminino"}.get(nome, nome.capitalize()),
+                     help="Faixas usadas para marcar valores alterados (*) e críticos (!).")
     
     with col2_tab1:
         st.markdown('<p class="cd-section-label">Resultado formatado</p>', unsafe_allow_html=True)
         
         # CHANGE 3: Color-coded HTML output
         output_text = st.session_state.get("saida_exames", "")
-        colorized_html = colorize_output_html(output_text)
+        tendencia = st.session_state.get("saida_exames_tendencia")
+        colorized_html = tendencia.to_html() if tendencia and output_text else \
+            colorize_output_html(output_text, st.session_state.get("saida_exames_estruturada"))
         st.markdown(
             f'<div class="cd-output-box">{colorized_html}</div>',
             unsafe_allow_html=True
@@ -1926,6 +1646,14 @@ with tab1:
         if output_text:
             # Plain text copy button (copies raw text for EMR pasting)
             components.html(make_copy_button_html("cClipExames", output_text, "Copiar para prontuário"), height=55)
+            if st.session_state.get("saida_exames_estruturada"):
+                st.download_button(
+                    "⬇  Exportar JSON",
+                    data=json.dumps([r.to_dict() for r in st.session_state["saida_exames_estruturada"]], ensure_ascii=False, indent=2),
+                    file_name="exames_clipdoc.json",
+                    mime="application/json",
+                    key="btn_export_json_tab1"
+                )
         
         # Legend for markers
         if output_text:
@@ -1962,6 +1690,36 @@ with tab1:
         **Culturas:** Urocultura e Hemocultura (com antibiograma).
         """)
 
+    # Painel de diagnóstico: visível apenas com ?debug=1 na URL
+    if st.query_params.get("debug") == "1":
+        with st.expander("🛠  Diagnóstico"):
+            st.markdown("**Cache de análises**")
+            st.json(get_parse_cache().stats())
+            st.markdown("**Cache de blocos (re-análise incremental)**")
+            st.json(get_block_cache().stats())
+            st.markdown("**Padrões regex compilados**")
+            st.json(PATTERNS.stats())
+            st.markdown("**Cache de respostas da IA**")
+            st.json(get_response_cache().stats())
+            if "google.generativeai" in sys.modules or "fake_gemini" in sys.modules:
+                st.markdown("**Roteamento entre modelos Gemini**")
+                st.dataframe(get_model_router().stats(), use_container_width=True, hide_index=True)
+                st.markdown("**Instruções fixas por tarefa (cache de contexto)**")
+                st.caption(f"Modo: {IA_CONTEXTO}")
+                st.dataframe(get_contextos_ia().stats(), use_container_width=True, hide_index=True)
+            if "fake_gemini" in sys.modules:
+                st.markdown("**Backend simulado (fake_gemini)**")
+                st.json(sys.modules["fake_gemini"].STATS.snapshot())
+            st.markdown("**Custo de importação por dependência**")
+            st.dataframe(import_cost_report(), use_container_width=True, hide_index=True)
+            st.markdown("**Tempo por etapa da última análise**")
+            perfil_registros = st.session_state.get("perfil_parse_tab1")
+            if perfil_registros:
+                st.caption(f"Total: {sum(r['wall_ms'] for r in perfil_registros):.2f} ms")
+                st.dataframe(perfil_registros, use_container_width=True, hide_index=True)
+            else:
+                st.caption("Clique em Analisar Exame com ?debug=1 para medir cada extrator.")
+
 # ============================================================
 # TAB 2 — AI AGENT (Redesigned with step indicators + cards)
 # ============================================================
@@ -1974,13 +1732,18 @@ with tab2:
             "Evoluir Paciente (Enfermaria - Interativo)",
             "Auxiliar na Admissão de Paciente",
             "Redigir Resumo de Alta",
-            "Gerar Orientações de Alta"
+            "Gerar Orientações de Alta",
+            "Pacote de Alta (SBAR + Resumo + Orientações)"
         ]
         tarefa_ia_selecionada = st.selectbox(
             "Qual tarefa o Agente IA deve realizar?",
             ia_task_options,
             key="ia_task_selector_tab2"
         )
+        st.checkbox("Exibir a resposta enquanto é gerada", key="ia_streaming",
+                    help="Mostra o texto da IA à medida que chega, em vez de esperar a resposta completa.")
+        st.checkbox("Ignorar respostas em cache", key="ia_cache_bypass",
+                    help="Gera uma nova resposta mesmo que as mesmas entradas já tenham sido enviadas antes.")
 
         # --- Evoluir Paciente (Interativo) ---
         if tarefa_ia_selecionada == "Evoluir Paciente (Enfermaria - Interativo)":
@@ -2011,12 +1774,12 @@ with tab2:
                 
                 if st.button("Analisar Evolução Anterior →", key="btn_ia_evol_enf_fase1", type="primary"):
                     if st.session_state.evolucao_anterior_input_fase1 or file_parts_fase1:
-                        with st.spinner("IA analisando a evolução anterior..."):
-                            st.session_state.evolucao_anterior_original_para_fase2 = st.session_state.evolucao_anterior_input_fase1
-                            st.session_state.ia_output_evolucao_enf_fase1 = evoluir_paciente_enfermaria_ia_fase1(
-                                st.session_state.evolucao_anterior_input_fase1,
-                                file_parts=file_parts_fase1 if file_parts_fase1 else None
-                            )
+                        st.session_state.evolucao_anterior_original_para_fase2 = st.session_state.evolucao_anterior_input_fase1
+                        st.session_state.ia_output_evolucao_enf_fase1 = gerar_resposta_ia_na_tela(
+                            prompt_evolucao_fase1(st.session_state.evolucao_anterior_input_fase1),
+                            file_parts=file_parts_fase1 if file_parts_fase1 else None,
+                            mensagem="IA analisando a evolução anterior..."
+                        )
                         st.session_state.ia_fase_evolucao_interativa = 2
                         st.rerun()
                     else:
@@ -2043,13 +1806,15 @@ with tab2:
                 with col_btn1:
                     if st.button("Gerar Evolução Final →", key="btn_ia_evol_enf_fase2", type="primary"):
                         if st.session_state.ia_dados_medico_hoje or file_parts_fase2:
-                            with st.spinner("IA gerando a evolução final..."):
-                                st.session_state.ia_output_evolucao_final = evoluir_paciente_enfermaria_ia_fase2(
+                            st.session_state.ia_output_evolucao_final = gerar_resposta_ia_na_tela(
+                                prompt_evolucao_fase2(
                                     st.session_state.ia_output_evolucao_enf_fase1,
                                     st.session_state.ia_dados_medico_hoje,
-                                    st.session_state.evolucao_anterior_original_para_fase2,
-                                    file_parts=file_parts_fase2 if file_parts_fase2 else None
-                                )
+                                    st.session_state.evolucao_anterior_original_para_fase2
+                                ),
+                                file_parts=file_parts_fase2 if file_parts_fase2 else None,
+                                mensagem="IA gerando a evolução final..."
+                            )
                             st.session_state.ia_fase_evolucao_interativa = 3
                             st.rerun()
                         else:
@@ -2090,10 +1855,10 @@ with tab2:
                     col_sbar1, col_sbar2 = st.columns([3, 1])
                     with col_sbar1:
                         if st.button("Gerar Passagem de Caso (SBAR)", key="btn_gerar_sbar", type="primary"):
-                            with st.spinner("IA gerando a passagem SBAR..."):
-                                st.session_state.ia_output_sbar = gerar_passagem_caso_sbar_ia(
-                                    st.session_state.ia_output_evolucao_final
-                                )
+                            st.session_state.ia_output_sbar = gerar_resposta_ia_na_tela(
+                                prompt_passagem_caso_sbar(st.session_state.ia_output_evolucao_final),
+                                mensagem="IA gerando a passagem SBAR..."
+                            )
                             st.rerun()
                     with col_sbar2:
                         if st.session_state.get("ia_output_sbar"):
@@ -2134,11 +1899,11 @@ with tab2:
             
             if st.button("Gerar Admissão com IA", key="btn_ia_adm_tab2", type="primary"):
                 if st.session_state.ia_input_admissao_caso or file_parts_adm:
-                    with st.spinner("IA gerando o rascunho da admissão..."):
-                        st.session_state.ia_output_admissao = preencher_admissao_ia(
-                            st.session_state.ia_input_admissao_caso,
-                            file_parts=file_parts_adm if file_parts_adm else None
-                        )
+                    st.session_state.ia_output_admissao = gerar_resposta_ia_na_tela(
+                        prompt_admissao(st.session_state.ia_input_admissao_caso),
+                        file_parts=file_parts_adm if file_parts_adm else None,
+                        mensagem="IA gerando o rascunho da admissão..."
+                    )
                 else:
                     st.warning("Forneça as informações do caso.")
             if st.session_state.ia_output_admissao:
@@ -2169,11 +1934,11 @@ with tab2:
             
             if st.button("Gerar Resumo de Alta", key="btn_ia_resumo_alta", type="primary"):
                 if st.session_state.ia_input_ultima_evolucao_alta or file_parts_resumo:
-                    with st.spinner("IA gerando o resumo de alta..."):
-                        st.session_state.ia_output_resumo_alta = gerar_resumo_alta_ia(
-                            st.session_state.ia_input_ultima_evolucao_alta,
-                            file_parts=file_parts_resumo if file_parts_resumo else None
-                        )
+                    st.session_state.ia_output_resumo_alta = gerar_resposta_ia_na_tela(
+                        prompt_resumo_alta(st.session_state.ia_input_ultima_evolucao_alta),
+                        file_parts=file_parts_resumo if file_parts_resumo else None,
+                        mensagem="IA gerando o resumo de alta..."
+                    )
                 else:
                     st.warning("Cole a última evolução do paciente.")
             if st.session_state.ia_output_resumo_alta:
@@ -2204,11 +1969,11 @@ with tab2:
             
             if st.button("Gerar Orientações de Alta", key="btn_ia_orientacoes_alta", type="primary"):
                 if st.session_state.ia_input_caso_orientacoes or file_parts_orient:
-                    with st.spinner("IA gerando as orientações de alta..."):
-                        st.session_state.ia_output_orientacoes_alta = gerar_orientacoes_alta_ia(
-                            st.session_state.ia_input_caso_orientacoes,
-                            file_parts=file_parts_orient if file_parts_orient else None
-                        )
+                    st.session_state.ia_output_orientacoes_alta = gerar_resposta_ia_na_tela(
+                        prompt_orientacoes_alta(st.session_state.ia_input_caso_orientacoes),
+                        file_parts=file_parts_orient if file_parts_orient else None,
+                        mensagem="IA gerando as orientações de alta..."
+                    )
                 else:
                     st.warning("Descreva o caso do paciente.")
             if st.session_state.ia_output_orientacoes_alta:
@@ -2221,6 +1986,58 @@ with tab2:
                     st.session_state.ia_input_caso_orientacoes = ""
                     st.rerun()
 
+        # --- Pacote de Alta (gerado em paralelo) ---
+        elif tarefa_ia_selecionada == "Pacote de Alta (SBAR + Resumo + Orientações)":
+            st.markdown('<p class="cd-section-label">Última evolução do paciente</p>', unsafe_allow_html=True)
+            st.caption("Gera a passagem SBAR, o resumo de alta e as orientações de alta ao mesmo tempo.")
+            if 'ia_input_pacote_alta' not in st.session_state:
+                st.session_state.ia_input_pacote_alta = ""
+            st.session_state.ia_input_pacote_alta = st.text_area(
+                "Última evolução:",
+                value=st.session_state.ia_input_pacote_alta,
+                height=300,
+                key="ia_input_pacote_alta_widget",
+                label_visibility="collapsed",
+                placeholder="Cole a última evolução completa do paciente..."
+            )
+            st.markdown('<p class="cd-file-upload-label">📎 Anexar arquivos ou colar do clipboard (Ctrl+V após Win+Shift+S) — opcional</p>', unsafe_allow_html=True)
+            _, file_parts_pacote, _ = render_file_uploader("pacote_alta")
+
+            if st.button("Gerar Pacote de Alta", key="btn_ia_pacote_alta", type="primary"):
+                if st.session_state.ia_input_pacote_alta:
+                    with st.spinner("IA gerando SBAR, resumo e orientações de alta..."):
+                        pacote = gerar_pacote_alta_ia(
+                            st.session_state.ia_input_pacote_alta,
+                            file_parts=file_parts_pacote if file_parts_pacote else None
+                        )
+                    st.session_state.ia_output_sbar = pacote["sbar"]
+                    st.session_state.ia_output_resumo_alta = pacote["resumo_alta"]
+                    st.session_state.ia_output_orientacoes_alta = pacote["orientacoes_alta"]
+                else:
+                    st.warning("Cole a última evolução do paciente.")
+            if st.session_state.ia_output_sbar or st.session_state.ia_output_resumo_alta or st.session_state.ia_output_orientacoes_alta:
+                if st.session_state.ia_output_sbar:
+                    st.markdown("---")
+                    st.markdown('<p class="cd-section-label">Passagem de caso (SBAR)</p>', unsafe_allow_html=True)
+                    st.markdown(st.session_state.ia_output_sbar)
+                    components.html(make_copy_button_html("cClipPacoteSBAR", st.session_state.ia_output_sbar, "Copiar passagem SBAR"), height=55)
+                if st.session_state.ia_output_resumo_alta:
+                    st.markdown("---")
+                    st.markdown('<p class="cd-section-label">Resumo de alta</p>', unsafe_allow_html=True)
+                    st.text_area("Resumo:", value=st.session_state.ia_output_resumo_alta, height=400, key="ia_pacote_resumo_display", disabled=True, label_visibility="collapsed")
+                    components.html(make_copy_button_html("cClipPacoteResumo", st.session_state.ia_output_resumo_alta, "Copiar resumo de alta"), height=55)
+                if st.session_state.ia_output_orientacoes_alta:
+                    st.markdown("---")
+                    st.markdown('<p class="cd-section-label">Orientações de alta — sinais de alerta</p>', unsafe_allow_html=True)
+                    st.markdown(st.session_state.ia_output_orientacoes_alta)
+                    components.html(make_copy_button_html("cClipPacoteOrient", st.session_state.ia_output_orientacoes_alta, "Copiar orientações"), height=55)
+                if st.button("Limpar pacote", key="btn_clear_ia_pacote_alta"):
+                    st.session_state.ia_output_sbar = ""
+                    st.session_state.ia_output_resumo_alta = ""
+                    st.session_state.ia_output_orientacoes_alta = ""
+                    st.session_state.ia_input_pacote_alta = ""
+                    st.rerun()
+
 
 # --- Footer ---
 st.markdown("""
@@ -3,6 +3,7 @@ import re
 import json
 import streamlit.components.v1 as components
 from dateutil import parser as date_parser
+from lab_normalize import normalize_lab_terms
 
 # --- Padrões Regex Globais ---
 NUM_PATTERN = r"([<>]{0,1}\d{1,6}(?:[,.]\d{1,3})?)"
@@ -552,11 +553,8 @@ def process_single_culture_block(block_lines, all_lines, original_start_idx, ger
 
 # --- Função Principal de Análise ---
 def parse_lab_report(text):
-    # Pré-processamento do texto para padronizar termos.
-    subs = [("ur[eé]ia", "Ureia"), ("pot[aá]ssio", "Potássio"), ("s[oó]dio", "Sódio"),
-            ("c[aá]lcio i[oô]nico", "Cálcio Iônico"), ("magn[eé]sio", "Magnésio"),
-            ("Creatinina(?!\s*Kinase|\s*quinase)", "Creatinina ")]
-    for p, r in subs: text = re.sub(f"(?i){p}", r, text)
+    # Pré-processamento do texto para padronizar termos (uma passada, regras compartilhadas).
+    text = normalize_lab_terms(text)
     lines = [line.strip() for line in text.splitlines() if line.strip()]
 
     all_res = {"datetime": extract_datetime_info(lines)}
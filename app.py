@@ -2,6 +2,7 @@ import streamlit as st
 import re
 import json
 import streamlit.components.v1 as components
+from lab_normalize import LAB_TERM_RULES, Normalizer, remap
 
 # Padrões numéricos universais:
 num_pattern = r"(\d{1,6}(?:[,.]\d{1,3})?)"  # de 1 a 6 dígitos, opcionalmente com vírgula/ponto e 1 a 3 decimais
@@ -134,8 +135,11 @@ def extract_cultura(lines):
         output = f"{culture_type} {result}"
     return output
 
+# Regra de ureia da tabela compartilhada, abreviada para "U" como este parser procura.
+normalize_chrome_terms = Normalizer(remap(LAB_TERM_RULES, {"Ureia": "U"}))
+
 def parse_lab_report_chrome(text):
-    text = re.sub(r"(?i)ur[eé]ia", "U", text)
+    text = normalize_chrome_terms(text)
     lines = [line.strip() for line in text.splitlines() if line.strip()]
     full_text = " ".join(lines).lower()
 
@@ -0,0 +1,144 @@
+"""Teste de carga da aba do Agente IA com o backend simulado (fake_gemini).
+
+Abre várias sessões do app ao mesmo tempo com o AppTest do Streamlit, cada uma
+executando a tarefa escolhida repetidas vezes com entradas distintas (sem acerto
+de cache), e mede o tempo de parede por clique. O AppTest não é thread-safe, então
+cada sessão roda em um processo próprio (como réplicas do app); o cache de
+respostas em SQLite é compartilhado entre elas. Roda sem rede e sem chave de API.
+Com --latency fixed:0 o tempo medido é só o custo do próprio app.
+
+Uso:
+    python bench_ia.py --task admissao --sessions 8 --requests 5
+    python bench_ia.py --task pacote --sessions 4 --latency lognormal:20,0.4 --fake "pro.quota_error_rate=0.2"
+    python bench_ia.py --task evolucao --latency fixed:0 --output bench_ia.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import fake_gemini
+
+AGENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "agent.py")
+
+# tarefa -> (opção do seletor, [(widget de entrada, botão)], chaves de saída no session_state)
+TAREFAS = {
+    "evolucao": ("Evoluir Paciente (Enfermaria - Interativo)",
+                 [("ia_evol_enf_input_fase1_widget", "btn_ia_evol_enf_fase1"),
+                  ("ia_dados_medico_input_fase2_widget", "btn_ia_evol_enf_fase2")],
+                 ["ia_output_evolucao_enf_fase1", "ia_output_evolucao_final"]),
+    "admissao": ("Auxiliar na Admissão de Paciente", [("ia_adm_info_input_widget", "btn_ia_adm_tab2")],
+                 ["ia_output_admissao"]),
+    "resumo": ("Redigir Resumo de Alta", [("ia_input_resumo_alta_widget", "btn_ia_resumo_alta")],
+               ["ia_output_resumo_alta"]),
+    "orientacoes": ("Gerar Orientações de Alta", [("ia_input_orientacoes_alta_widget", "btn_ia_orientacoes_alta")],
+                    ["ia_output_orientacoes_alta"]),
+    "pacote": ("Pacote de Alta (SBAR + Resumo + Orientações)", [("ia_input_pacote_alta_widget", "btn_ia_pacote_alta")],
+               ["ia_output_sbar", "ia_output_resumo_alta", "ia_output_orientacoes_alta"]),
+}
+
+ENTRADA = """#ID: Paciente de 72 anos, internado pelo PS
+#HD: Pneumonia comunitária
+#AP: HAS, DM2
+#ATB: Ceftriaxona D{dia}
+#EVOLUÇÃO: afebril, sem dispneia. Requisição {sessao}-{requisicao}."""
+
+
+def _sessao(tarefa, sessao, requisicoes, streaming, timeout_s):
+    """One simulated user in its own process; returns (click times, errors, fake_gemini stats).
+
+    The app's "LOG:" prints go to stderr, so stdout carries only the JSON summary.
+    """
+    with contextlib.redirect_stdout(sys.stderr):
+        return _executar_sessao(tarefa, sessao, requisicoes, streaming, timeout_s)
+
+
+def _executar_sessao(tarefa, sessao, requisicoes, streaming, timeout_s):
+    from streamlit.testing.v1 import AppTest
+
+    opcao, passos, saidas = TAREFAS[tarefa]
+    medidas, erros = [], []
+    try:
+        at = AppTest.from_file(AGENT_PATH, default_timeout=timeout_s).run()
+        at.selectbox(key="ia_task_selector_tab2").set_value(opcao).run()
+        at.checkbox(key="ia_streaming").set_value(streaming).run()
+        for requisicao in range(requisicoes):
+            t0 = time.perf_counter()
+            for widget, botao in passos:
+                at.text_area(key=widget).input(ENTRADA.format(dia=requisicao + 1, sessao=sessao, requisicao=requisicao))
+                at.button(key=botao).click().run()
+            medidas.append(time.perf_counter() - t0)
+            falha = [e.value for e in at.exception] or [k for k in saidas if not at.session_state[k]
+                                                        or str(at.session_state[k]).startswith("Erro")]
+            if falha: erros.append(f"sessão {sessao}, requisição {requisicao}: {falha}")
+            if tarefa == "evolucao": at.button(key="btn_nova_evol_interativa").click().run()
+    except Exception:
+        erros.append(f"sessão {sessao}: {traceback.format_exc(limit=3)}")
+    return medidas, erros, fake_gemini.STATS.snapshot()
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def executar(tarefa, sessoes=4, requisicoes=3, streaming=True, timeout_s=300):
+    """Run the load test and return a JSON-serializable summary."""
+    medidas, erros, modelos = [], [], {}
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=sessoes) as pool:
+        futuros = [pool.submit(_sessao, tarefa, i, requisicoes, streaming, timeout_s) for i in range(sessoes)]
+        for futuro in futuros:
+            medidas_sessao, erros_sessao, stats = futuro.result()
+            medidas += medidas_sessao
+            erros += erros_sessao
+            for modelo, linha in stats.items():
+                total_modelo = modelos.setdefault(modelo, dict.fromkeys(linha, 0))
+                for campo, valor in linha.items(): total_modelo[campo] += valor
+    total = time.perf_counter() - t0
+    resumo = {"tarefa": tarefa, "sessoes": sessoes, "requisicoes_por_sessao": requisicoes, "streaming": streaming,
+              "fake": os.environ.get("CLIPDOC_FAKE_GEMINI", ""), "total_s": round(total, 3),
+              "cliques_por_s": round(len(medidas) / total, 3) if total > 0 else 0.0,
+              "modelos": modelos, "erros": erros}
+    if medidas:
+        resumo.update({"p50_s": round(statistics.median(medidas), 3), "p95_s": round(_percentil(medidas, 95), 3),
+                       "max_s": round(max(medidas), 3), "media_s": round(statistics.fmean(medidas), 3)})
+    return resumo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga da aba do Agente IA com o Gemini simulado.")
+    parser.add_argument("--task", choices=list(TAREFAS), default="admissao")
+    parser.add_argument("--sessions", type=int, default=4, help="Sessões simultâneas.")
+    parser.add_argument("--requests", type=int, default=3, help="Cliques por sessão.")
+    parser.add_argument("--latency", default=None, help="Distribuição de latência do fake (ex.: lognormal:2,0.4).")
+    parser.add_argument("--fake", default="", help="Demais parâmetros do fake (formato de CLIPDOC_FAKE_GEMINI).")
+    parser.add_argument("--no-stream", action="store_true", help="Desliga a exibição em streaming.")
+    parser.add_argument("--timeout", type=float, default=300, help="Tempo máximo por execução do script (s).")
+    parser.add_argument("--output", default=None, help="Arquivo JSON de resultados (padrão: stdout).")
+    args = parser.parse_args(argv)
+
+    fake_spec = ";".join(filter(None, [f"latency={args.latency}" if args.latency else "", args.fake]))
+    os.environ["CLIPDOC_GEMINI_BACKEND"] = "fake"
+    os.environ["CLIPDOC_FAKE_GEMINI"] = fake_spec
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CLIPDOC_IA_CACHE"] = os.path.join(tmp, "ia_respostas.sqlite3")
+        resumo = executar(args.task, args.sessions, args.requests, not args.no_stream, args.timeout)
+
+    saida = json.dumps(resumo, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: f.write(saida + "\n")
+    else:
+        print(saida)
+    for erro in resumo["erros"]: print(f"ERRO {erro}", file=sys.stderr)
+    return 1 if resumo["erros"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""Benchmark do motor de extração de exames com corpus sintético.
+
+Gera laudos sintéticos nos layouts padrão e Tecnolab (tamanhos pequeno, típico e
+enorme), mede cada extrator e o parse completo e grava um JSON comparável entre
+execuções.
+
+Uso:
+    python bench_lab.py --output bench.json
+    python bench_lab.py --output bench_novo.json --compare bench.json
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+import clipdoc_core
+
+TAMANHOS = {"pequeno": 40, "tipico": 160, "enorme": 5000}
+
+
+# --- Corpus sintético ---
+def _num(rng, low, high, decimals=1):
+    return f"{rng.uniform(low, high):.{decimals}f}".replace(".", ",")
+
+def _milhar(value):
+    return f"{value:,}".replace(",", ".")
+
+def gerar_coleta_padrao(rng, dia, completa=True):
+    """One collection in the default (hospital system) layout."""
+    data = f"{dia % 28 + 1:02d}/{dia // 28 % 12 + 1:02d}/2025"
+    hora = f"{rng.randint(0, 23):02d}:{rng.choice(['00', '15', '30', '45'])}"
+    coleta = f"Data de Coleta/Recebimento: {data}, Hora Aproximada: {hora} BRT"
+    linhas = [
+        "HEMOGRAMA COMPLETO", coleta, "Série Vermelha",
+        f"Hemoglobina: {_num(rng, 6, 17)} g/dL", f"Hematócrito: {_num(rng, 20, 50)} %",
+        f"VCM: {_num(rng, 75, 105)} fL", f"HCM: {_num(rng, 25, 34)} pg",
+        f"CHCM: {_num(rng, 30, 36)} g/dL", f"RDW: {_num(rng, 11, 18)} %",
+        "Série Branca", f"Leucócitos: {_milhar(rng.randint(2000, 35000))} /mm³",
+        f"Bastonetes: {rng.randint(0, 10)} % {rng.randint(0, 900)}",
+        f"Segmentados: {rng.randint(40, 85)} % {_milhar(rng.randint(1000, 20000))}",
+        f"Linfócitos: {rng.randint(5, 40)} % {_milhar(rng.randint(500, 4000))}",
+        f"Monócitos: {rng.randint(1, 10)} % {rng.randint(50, 900)}",
+        f"Eosinófilos: {rng.randint(0, 6)} % {rng.randint(0, 500)}",
+        f"Basófilos: {rng.randint(0, 2)} % {rng.randint(0, 100)}",
+        f"Plaquetas: {rng.randint(15, 600)} mil/mm³", "Valor de referência: 150 a 450 mil",
+        "Assinado eletronicamente por Dr. Laboratório",
+        "COAGULOGRAMA", coleta, "Tempo de Protrombina", f"Tempo em segundos: {_num(rng, 11, 30)}",
+        f"Atividade: {rng.randint(20, 100)} %", "Razão Normatizada Internacional (RNI):", _num(rng, 0.9, 4.5, 2),
+        "Tempo de Tromboplastina Parcial Ativado", f"Tempo em segundos: {_num(rng, 25, 80)}",
+        f"Relação: {_num(rng, 0.8, 2.5, 2)}", "Assinado eletronicamente por Dr. Laboratório",
+        "BIOQUIMICA", coleta, f"Ureia {rng.randint(10, 200)} mg/dL", f"Creatinina {_num(rng, 0.4, 6, 2)} mg/dL",
+        f"eGFR {rng.randint(5, 120)} mL/min", f"Potássio {_num(rng, 2.5, 6.8)} mmol/L",
+        f"Sódio {rng.randint(118, 162)} mmol/L", f"Cloro {rng.randint(90, 115)} mmol/L",
+        f"Magnésio {_num(rng, 1.2, 3)} mg/dL", f"Fósforo {_num(rng, 1.5, 7)} mg/dL",
+        f"Cálcio iônico {_num(rng, 0.9, 1.5, 2)} mmol/L", f"Glicose {rng.randint(40, 450)} mg/dL",
+        f"Proteína C Reativa {_num(rng, 0.1, 40)} mg/dL", "Assinado eletronicamente por Dr. Laboratório",
+    ]
+    if completa:
+        linhas += [
+            "Transaminase oxalacética - TGO", "Resultado", f"{rng.randint(10, 300)} U/L",
+            "Transaminase pirúvica - TGP", "Resultado", f"{rng.randint(5, 300)} U/L",
+            f"Gama-Glutamil Transferase {rng.randint(10, 400)} U/L", f"Fosfatase Alcalina {rng.randint(40, 500)} U/L",
+            "Bilirrubinas Total, Direta e Indireta", f"Bilirrubina Total {_num(rng, 0.2, 8, 2)} mg/dL",
+            f"Bilirrubina Direta {_num(rng, 0.1, 5, 2)} mg/dL", f"Bilirrubina Indireta {_num(rng, 0.1, 3, 2)} mg/dL",
+            f"Albumina {_num(rng, 2, 5)} g/dL", f"Amilase {rng.randint(20, 400)} U/L", f"Lipase {rng.randint(10, 600)} U/L",
+            "Assinado eletronicamente por Dr. Laboratório",
+            "Gasometria Arterial", coleta, f"pH: {_num(rng, 7.1, 7.6, 2)}", f"pCO2: {_num(rng, 20, 80)} mmHg",
+            f"pO2: {rng.randint(40, 200)} mmHg", f"HCO3: {_num(rng, 10, 35)} mmol/L",
+            f"BE: {_num(rng, -10, 8)} mmol/L", f"Saturação de O2: {rng.randint(80, 100)} %",
+            f"Lactato: {_num(rng, 0.5, 6)} mmol/L", "Assinado eletronicamente por Dr. Laboratório",
+            "Urina Tipo I", coleta, f"Nitrito: {rng.choice(['Positivo', 'Negativo'])}",
+            f"Leucócitos: {rng.randint(1000, 90000)} /mL", f"Hemácias: {rng.choice(['raras', 'numerosas', '5000 /mL'])}",
+            "Assinado eletronicamente por Dr. Laboratório",
+            "Cultura de urina", coleta, "Material: urina",
+            rng.choice(["Resultado: Escherichia coli >100.000 UFC/mL", "Resultado: Negativo"]),
+            "Antibiograma", "Ampicilina R", "Ceftriaxona S", "Ciprofloxacino I", "",
+            "Assinado eletronicamente por Dr. Laboratório",
+        ]
+    return linhas
+
+def gerar_coleta_tecnolab(rng, dia, completa=True):
+    """One collection in the Tecnolab layout."""
+    coleta = f"Coleta({dia % 28 + 1:02d}/{dia // 28 % 12 + 1:02d}/2025 {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d})"
+    linhas = [
+        "www.tecnolab.com.br", coleta, "HEMOGRAMA", "ERITROGRAMA",
+        f"Hemoglobina....: {_num(rng, 6, 17)} g/dL", f"Hematócrito....: {_num(rng, 20, 50)} %",
+        f"VCM............: {_num(rng, 75, 105)} fL", f"HCM............: {_num(rng, 25, 34)} pg",
+        f"CHCM...........: {_num(rng, 30, 36)} g/dL", f"RDW............: {_num(rng, 11, 18)} %",
+        "LEUCOGRAMA", f"Leucócitos.....: {_milhar(rng.randint(2000, 35000))} /mm3",
+        f"Bastonetes.....: {rng.randint(0, 10)} % {rng.randint(0, 900)}",
+        f"Segmentados....: {rng.randint(40, 85)} % {_milhar(rng.randint(1000, 20000))}",
+        f"Linfócitos.....: {rng.randint(5, 40)} % {_milhar(rng.randint(500, 4000))}",
+        f"Eosinófilos....: {rng.randint(0, 6)} % {rng.randint(0, 500)}",
+        f"Plaquetas......: {_milhar(rng.randint(15000, 600000))} /mm3",
+        f"TEMPO DE PROTROMBINA....: {_num(rng, 11, 30)} seg", f"I.N.R...................: {_num(rng, 0.9, 4.5, 2)}",
+        "TEMPO TROMBOPLASTINA PARCIAL ATIVADA", f"RESULTADO: {_num(rng, 25, 80)} seg",
+        f"Uréia: {rng.randint(10, 200)} mg/dL", "CREATININA", f"RESULTADO: {_num(rng, 0.4, 6, 2)} mg/dL",
+        f"*eGFR - Afro Descendente: {rng.randint(10, 120)}", f"*eGFR Não Afro Descendente: {rng.randint(10, 120)}",
+        "DOSAGEM DE POTÁSSIO", f"RESULTADO: {_num(rng, 2.5, 6.8)} mmol/L",
+        "DOSAGEM DE SÓDIO", f"RESULTADO: {rng.randint(118, 162)} mmol/L",
+        "DOSAGEM DE MAGNÉSIO", f"RESULTADO: {_num(rng, 1.2, 3)} mg/dL",
+        "DOSAGEM DE GLICOSE", f"RESULTADO: {rng.randint(40, 450)} mg/dL",
+        'PROTEINA "C" REATIVA', f"RESULTADO: {_num(rng, 0.1, 40, 2)} mg/dL",
+    ]
+    if completa:
+        linhas += [
+            "TRANSAMINASE OXALACETICA - TGO", f"RESULTADO: {rng.randint(10, 300)} U/L",
+            "TRANSAMINASE PIRUVICA (TGP)", f"RESULTADO: {rng.randint(5, 300)} U/L",
+            "FOSFATASE ALCALINA", f"RESULTADO: {rng.randint(40, 500)} U/L",
+            "GAMA-GLUTAMIL TRANSFERASE", f"RESULTADO: {rng.randint(10, 400)} U/L",
+            "AMILASE", f"RESULTADO: {rng.randint(20, 400)} U/L",
+            "BILIRRUBINA", f"TOTAL....: {_num(rng, 0.2, 8, 2)} mg/dL", f"DIRETA...: {_num(rng, 0.1, 5, 2)} mg/dL",
+            f"INDIRETA.: {_num(rng, 0.1, 3, 2)} mg/dL",
+            "URINA TIPO I", f"PH: {_num(rng, 5, 8)}", "DENSIDADE: 1.020", "PROTEÍNA: Negativo", "GLICOSE: Negativo",
+            f"NITRITO: {rng.choice(['Positivo', 'Negativo'])}", f"HEMÁCIAS: {_milhar(rng.randint(1000, 90000))} /mL",
+            f"LEUCÓCITOS: {_milhar(rng.randint(1000, 90000))} /mL",
+            "UROCULTURA", "RESULTADO:", "Não houve crescimento bacteriano",
+            "HEMOCULTURA", "Resultado parcial: parcialmente negativo",
+        ]
+    return linhas
+
+def gerar_laudo(layout, n_linhas, seed=0):
+    """Synthetic report with at least `n_linhas` lines, built from dated collections."""
+    rng = random.Random(f"{layout}-{n_linhas}-{seed}")
+    gerar_coleta = gerar_coleta_padrao if layout == "padrao" else gerar_coleta_tecnolab
+    linhas, dia = [], 0
+    while len(linhas) < n_linhas:
+        linhas += gerar_coleta(rng, dia, completa=n_linhas > TAMANHOS["pequeno"])
+        dia += 1
+    return "\n".join(linhas)
+
+def gerar_corpus(seed=0):
+    return {f"{layout}_{tamanho}": gerar_laudo(layout, n_linhas, seed)
+            for layout in ("padrao", "tecnolab") for tamanho, n_linhas in TAMANHOS.items()}
+
+
+# --- Medição ---
+def _resumo(amostras_s):
+    ms = [a * 1000 for a in amostras_s]
+    return {"min_ms": round(min(ms), 4), "median_ms": round(statistics.median(ms), 4), "runs": len(ms)}
+
+def medir_laudo(texto, repeticoes):
+    """Time the end-to-end parse, the line preparation and each extractor on fresh LabLines."""
+    formato = clipdoc_core.detect_lab_format(texto)
+    etapas = [formato.datetime_extractor, *formato.extractors, formato.culturas_extractor]
+    parse_s, prepare_s = [], []
+    extratores_s = {f.__name__: [] for f in etapas}
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        clipdoc_core.parse_lab_report(texto)
+        parse_s.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        lines = clipdoc_core.prepare_lab_lines(texto)
+        prepare_s.append(time.perf_counter() - inicio)
+        for ext_func in etapas:
+            inicio = time.perf_counter()
+            ext_func(lines)
+            extratores_s[ext_func.__name__].append(time.perf_counter() - inicio)
+    return {
+        "format": formato.name,
+        "lines": len(clipdoc_core.prepare_lab_lines(texto)),
+        "parse": _resumo(parse_s),
+        "prepare": _resumo(prepare_s),
+        "extractors": {nome: _resumo(amostras) for nome, amostras in extratores_s.items()},
+    }
+
+def executar(repeticoes=20, seed=0):
+    corpus = gerar_corpus(seed)
+    casos = {}
+    for nome, texto in corpus.items():
+        reps = max(3, repeticoes // 10) if nome.endswith("enorme") else repeticoes
+        casos[nome] = medir_laudo(texto, reps)
+    return {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "seed": seed, "repetitions": repeticoes},
+        "cases": casos,
+    }
+
+
+def comparar(atual, anterior):
+    """Print median parse/extractor times against a previous run."""
+    def _linha(nome, novo, velho):
+        delta = (novo - velho) / velho * 100 if velho else 0.0
+        print(f"  {nome:<45} {velho:>10.3f} {novo:>10.3f} ms  {delta:+7.1f}%")
+
+    for caso, dados in atual["cases"].items():
+        base = anterior.get("cases", {}).get(caso)
+        if not base: continue
+        print(f"{caso} ({dados['lines']} linhas)")
+        _linha("parse_lab_report", dados["parse"]["median_ms"], base["parse"]["median_ms"])
+        for nome, tempos in dados["extractors"].items():
+            if nome in base.get("extractors", {}):
+                _linha(nome, tempos["median_ms"], base["extractors"][nome]["median_ms"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do parse_lab_report com corpus sintético.")
+    parser.add_argument("--repetitions", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_lab.json", help="Arquivo JSON de resultados.")
+    parser.add_argument("--compare", default=None, help="JSON de uma execução anterior para comparar.")
+    parser.add_argument("--dump-corpus", default=None, help="Diretório onde gravar os laudos sintéticos.")
+    args = parser.parse_args(argv)
+
+    if args.dump_corpus:
+        import os
+        os.makedirs(args.dump_corpus, exist_ok=True)
+        for nome, texto in gerar_corpus(args.seed).items():
+            with open(os.path.join(args.dump_corpus, f"{nome}.txt"), "w", encoding="utf-8") as f:
+                f.write(texto)
+
+    resultados = executar(args.repetitions, args.seed)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+    for caso, dados in resultados["cases"].items():
+        print(f"{caso:<20} {dados['lines']:>6} linhas  parse {dados['parse']['median_ms']:.3f} ms")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            comparar(resultados, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1793 @@
+"""Motor de extração de exames do ClipDoc, sem Streamlit nem Gemini.
+
+Parsing de laudos (parse_lab_report, parse_lab_report_structured,
+parse_lab_report_stream), anonimização, valores de referência e tendências.
+Importa só a biblioteca padrão, então pode ser usado por scripts, workers e
+ferramentas de desktop; agent.py é a interface Streamlit sobre este módulo.
+python-dateutil só é carregado se um laudo tiver uma data fora do formato esperado.
+"""
+import re
+import json
+import hashlib
+import threading
+import time
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import nullcontext
+from datetime import date
+
+from lab_normalize import normalize_lab_terms
+
+# --- Padrões Regex Globais ---
+NUM_PATTERN = r"([<>]{0,1}\d{1,6}(?:[,.]\d{1,3})?)"
+GAS_NUM_PATTERN = r"([<>]{0,1}-?\d{1,6}(?:[,.]\d{1,3})?)"
+COLETA_TECNOLAB_PATTERN = r"Coleta\((\d{1,2}/\d{1,2}/\d{2,4})\s+(\d{1,2}:\d{2})\)"
+COLETA_PADRAO_PATTERN = r"Data de Coleta/Recebimento:\s*(\d{1,2}/\d{1,2}/\d{2,4}),\s*Hora Aproximada:\s*(\d{1,2}:\d{2})(?:\s+\w{2,4})?"
+
+# --- Registro de Padrões Compilados ---
+class PatternRegistry:
+    """Process-wide cache of compiled extraction regexes keyed by (kind, label, unit, flags).
+
+    Each kind maps to a builder that turns a label/unit into the regex source.
+    `compiles` counts cache misses and `hits` counts reuses: once every layout has
+    been parsed, `compiles` stops growing and the hot path only takes hits.
+    """
+
+    BUILDERS = {
+        "raw": lambda label, unit: label,
+        "with_unit": lambda label, unit: label + r"\s*" + re.escape(unit),
+        "label_num": lambda label, unit: re.escape(label) + r"[.:\s]*" + NUM_PATTERN,
+        "label_alt_num": lambda label, unit: r"(?:" + label + r")[.:\s]*(" + NUM_PATTERN + r")",
+        "label_alt_percent": lambda label, unit: r"(?:" + label + r")[.:\s]*(" + NUM_PATTERN + r")\s*%",
+        "resultado_num": lambda label, unit: r"RESULTADO:\s*" + NUM_PATTERN,
+        "num_with_unit_at_start": lambda label, unit: r"^\s*" + NUM_PATTERN + r"\s*" + re.escape(unit),
+    }
+
+    def __init__(self):
+        self._compiled = {}
+        self.hits = 0
+        self.compiles = 0
+
+    def get(self, kind, label="", unit="", flags=0):
+        key = (kind, label, unit, flags)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = re.compile(self.BUILDERS[kind](label, unit), flags)
+            self._compiled[key] = compiled
+            self.compiles += 1
+        else:
+            self.hits += 1
+        counter = getattr(_PROFILE_STATE, "counter", None)
+        return compiled if counter is None else CountingPattern(compiled, counter)
+
+    def stats(self):
+        return {"patterns": len(self._compiled), "compiles": self.compiles, "hits": self.hits}
+
+PATTERNS = PatternRegistry()
+
+# --- Instrumentação do Parser (opt-in) ---
+lab_profile_logger = logging.getLogger("clipdoc.lab_profile")
+_PROFILE_STATE = threading.local()
+
+class StageCounter:
+    __slots__ = ("lines", "regex_calls")
+
+    def __init__(self):
+        self.lines = self.regex_calls = 0
+
+
+class CountingPattern:
+    """Compiled-pattern proxy that counts matching calls; only handed out while profiling."""
+    __slots__ = ("_pattern", "_counter")
+
+    def __init__(self, pattern, counter):
+        self._pattern, self._counter = pattern, counter
+
+    def search(self, *args, **kwargs):
+        self._counter.regex_calls += 1
+        return self._pattern.search(*args, **kwargs)
+
+    def match(self, *args, **kwargs):
+        self._counter.regex_calls += 1
+        return self._pattern.match(*args, **kwargs)
+
+    def findall(self, *args, **kwargs):
+        self._counter.regex_calls += 1
+        return self._pattern.findall(*args, **kwargs)
+
+    def finditer(self, *args, **kwargs):
+        self._counter.regex_calls += 1
+        return self._pattern.finditer(*args, **kwargs)
+
+    def sub(self, *args, **kwargs):
+        self._counter.regex_calls += 1
+        return self._pattern.sub(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._pattern, name)
+
+
+class ParseProfile:
+    """Opt-in per-stage profile of parse_lab_report: wall time, lines scanned and regex calls.
+
+    Pass an instance as ``profile=`` to parse_lab_report_structured (or the
+    stream/tab1 helpers). Stages with the same name are accumulated, so one
+    profile can span every collection of a multi-collection paste. "Lines
+    scanned" counts the candidate lines handed to the extractor by the label
+    index (or every line, for unindexed scans).
+    """
+
+    def __init__(self, source="parse_lab_report"):
+        self.source = source
+        self.stages = OrderedDict()
+        self.parses = 0
+
+    def stage(self, name):
+        return _ProfiledStage(self, name)
+
+    def add(self, name, wall_ms, lines, regex_calls):
+        entry = self.stages.setdefault(name, {"stage": name, "calls": 0, "wall_ms": 0.0, "lines": 0, "regex_calls": 0})
+        entry["calls"] += 1
+        entry["wall_ms"] += wall_ms
+        entry["lines"] += lines
+        entry["regex_calls"] += regex_calls
+
+    @property
+    def total_ms(self):
+        return sum(entry["wall_ms"] for entry in self.stages.values())
+
+    def records(self):
+        """One flat dict per stage, slowest first."""
+        return [dict(entry, wall_ms=round(entry["wall_ms"], 3), source=self.source, parses=self.parses)
+                for entry in sorted(self.stages.values(), key=lambda e: -e["wall_ms"])]
+
+    def log(self, logger=None):
+        """Emit one structured record per stage (JSON message + ``lab_profile`` extra)."""
+        logger = logger or lab_profile_logger
+        for record in self.records():
+            logger.info(json.dumps(record, ensure_ascii=False), extra={"lab_profile": record})
+
+
+class _ProfiledStage:
+    def __init__(self, profile, name):
+        self.profile, self.name = profile, name
+
+    def __enter__(self):
+        self.counter, self.previous = StageCounter(), getattr(_PROFILE_STATE, "counter", None)
+        _PROFILE_STATE.counter = self.counter
+        self.start = time.perf_counter()
+        return self.counter
+
+    def __exit__(self, *exc):
+        wall_ms = (time.perf_counter() - self.start) * 1000
+        _PROFILE_STATE.counter = self.previous
+        self.profile.add(self.name, wall_ms, self.counter.lines, self.counter.regex_calls)
+        return False
+
+def profile_stage(profile, name):
+    return profile.stage(name) if profile is not None else nullcontext()
+
+def count_scanned_lines(n):
+    counter = getattr(_PROFILE_STATE, "counter", None)
+    if counter is not None: counter.lines += n
+
+# --- Configuração de Valores de Referência ---
+VALORES_REFERENCIA = {
+    "Hb": {"min": 13.0, "max": 17.0, "crit_low": 7.0, "crit_high": 20.0},
+    "Ht": {"min": 40.0, "max": 50.0, "crit_low": 20.0},
+    "VCM": {"min": 83.0, "max": 101.0},
+    "HCM": {"min": 27.0, "max": 32.0},
+    "CHCM": {"min": 31.0, "max": 35.0},
+    "RDW": {"min": 11.6, "max": 14.0},
+    "Leuco": {"min": 4000, "max": 10000, "crit_low": 1000, "crit_high": 30000},
+    "Plaq": {"min": 150000, "max": 450000, "crit_low": 20000, "crit_high": 1000000},
+    "PCR": {"max": 0.30, "crit_high": 100.0},
+    "U": {"min": 15, "max": 50},
+    "Cr": {"min": 0.50, "max": 1.30},
+    "eGFR": {"min": 90},
+    "K": {"min": 3.5, "max": 5.1, "crit_low": 2.5, "crit_high": 6.5},
+    "Na": {"min": 136, "max": 145, "crit_low": 120, "crit_high": 160},
+    "Mg": {"min": 1.8, "max": 2.4},
+    "CaI": {"min": 1.12, "max": 1.32},
+    "CaT": {"min": 8.6, "max": 10.0},
+    "P": {"min": 2.5, "max": 4.5},
+    "Cl": {"min": 98, "max": 107},
+    "Gli": {"min": 70, "max": 99, "crit_high": 400, "crit_low": 40},
+    "INR": {"min": 0.96, "max": 1.30, "crit_high": 5.0},
+    "TTPA_s": {"min": 27.80, "max": 38.60, "crit_high": 100.0},
+    "TTPA_R": {"min": 0.90, "max": 1.25, "crit_high": 3.0},
+    "TGO": {"min": 15, "max": 37},
+    "TGP": {"min": 6, "max": 45},
+    "GGT": {"max": 71}, 
+    "FA": {"max": 129}, 
+    "BT": {"min": 0.30, "max": 1.20},
+    "BD": {"max": 0.30},
+    "BI": {"min": 0.10, "max": 1.00},
+    "ALB": {"min": 3.5, "max": 5.2},
+    "AML": {"max": 100},
+    "LIP": {"max": 160},
+    "Vanco": {"min": 15.0, "max": 20.0, "crit_low": 10.0, "crit_high": 25.0},
+    "pH_gas": {"min": 7.35, "max": 7.45, "crit_low": 7.2, "crit_high": 7.6},
+    "pCO2_gas": {"min": 35.0, "max": 45.0, "crit_low": 20, "crit_high": 80},
+    "HCO3_gas": {"min": 21.0, "max": 28.0, "crit_low": 10, "crit_high": 40},
+    "BE_gas": {"min": -3.0, "max": 3.0},
+    "pO2_gas": {"min": 80.0, "max": 95.0, "crit_low": 40},
+    "SatO2_gas": {"min": 95.0, "max": 99.0, "crit_low": 88},
+    "Lac_gas": {"min": 4.5, "max": 20, "crit_high": 40},
+    "Lac": {"min": 4, "max": 20, "crit_high": 30.0},
+    "cCO2_gas": {"min": 23.0, "max": 29.0}
+}
+
+UNIDADES_PADRAO = {
+    "Hb": "g/dL", "Ht": "%", "VCM": "fL", "HCM": "pg", "CHCM": "g/dL", "RDW": "%",
+    "Leuco": "/mm³", "Plaq": "/mm³", "PCR": "mg/dL", "U": "mg/dL", "Cr": "mg/dL", "eGFR": "mL/min/1,73m²",
+    "K": "mEq/L", "Na": "mEq/L", "Mg": "mg/dL", "CaI": "mmol/L", "CaT": "mg/dL", "P": "mg/dL", "Cl": "mEq/L",
+    "Gli": "mg/dL", "TP_s": "s", "TTPA_s": "s", "TGO": "U/L", "TGP": "U/L", "GGT": "U/L", "FA": "U/L",
+    "BT": "mg/dL", "BD": "mg/dL", "BI": "mg/dL", "ALB": "g/dL", "AML": "U/L", "LIP": "U/L", "Vanco": "µg/mL",
+    "pCO2_gas": "mmHg", "HCO3_gas": "mmol/L", "BE_gas": "mmol/L", "pO2_gas": "mmHg", "SatO2_gas": "%",
+    "Lac_gas": "mg/dL", "Lac": "mg/dL", "cCO2_gas": "mmol/L"
+}
+
+
+# --- Funções Auxiliares ---
+def _parse_date(text, **kwargs):
+    from dateutil import parser as date_parser  # opcional: só para datas fora do padrão
+    return date_parser.parse(text, **kwargs)
+
+def clean_number_format(value_str):
+    if not value_str: return ""
+    s = str(value_str).strip().lstrip('<>')
+    if '.' in s and ',' in s:
+        s = s.replace('.', '').replace(',', '.')
+    elif ',' in s:
+        s = s.replace(',', '.')
+    return s
+
+class LabNumber:
+    """A numeric result parsed once, when it leaves the extractor.
+
+    `raw` is the extracted text (Brazilian locale, e.g. "<1.234,5"), `text` the
+    normalized decimal shown in the output ("1234.5"), `value` its float,
+    `comparator` "<", ">" or "" and `scale` " mil" when the report counts in
+    thousands (`scaled` is then the value in units).
+    """
+    __slots__ = ("raw", "text", "value", "comparator", "scale")
+
+    def __init__(self, raw, text, value, comparator="", scale=""):
+        self.raw, self.text, self.value = raw, text, value
+        self.comparator, self.scale = comparator, scale
+
+    @classmethod
+    def parse(cls, raw, scale=""):
+        """LabNumber for `raw` (a LabNumber is returned as is), or None if it is not a plain number."""
+        if isinstance(raw, cls): return raw
+        text = clean_number_format(raw)
+        if not text: return None
+        try: value = float(text)
+        except ValueError: return None
+        first = str(raw).strip()[:1]
+        return cls(raw, text, value, first if first in ("<", ">") else "", scale)
+
+    @property
+    def scaled(self):
+        return self.value * 1000 if self.scale == " mil" else self.value
+
+    def __str__(self):
+        return self.raw
+
+    def __repr__(self):
+        return f"LabNumber({self.raw!r}, {self.scaled!r})"
+
+
+# --- Índice de Rótulos (pré-processamento único por laudo) ---
+class LabelIndex:
+    """Label -> line-position index over the lowercased lines of one report.
+
+    All lines are lowercased and joined once; each label is then located with
+    C-level ``str.find`` over the joined text (one scan per label, cached), so
+    extractors jump straight to candidate lines instead of rescanning the report.
+    """
+
+    def __init__(self, lower_lines):
+        self.lower_lines = lower_lines
+        self._text = "\n".join(lower_lines)
+        self._line_starts = []
+        offset = 0
+        for line in lower_lines:
+            self._line_starts.append(offset)
+            offset += len(line) + 1
+        self._positions = {}
+
+    def positions(self, label):
+        """Ascending positions of the lines containing `label` (already lowercased)."""
+        found = self._positions.get(label)
+        if found is None:
+            found = []
+            if label:
+                find, starts, n_lines = self._text.find, self._line_starts, len(self.lower_lines)
+                j = find(label)
+                while j != -1:
+                    line_no = bisect_right(starts, j) - 1
+                    found.append(line_no)
+                    if line_no + 1 >= n_lines: break
+                    j = find(label, starts[line_no + 1])
+            self._positions[label] = found
+        return found
+
+
+class LabLines(list):
+    """List of report lines carrying their lowercased copy and a shared LabelIndex.
+
+    Contiguous slices (``lines[i:]``, ``lines[i:j]``) return views that share the
+    same index, so block-scoped searches stay indexed as well.
+    """
+
+    def __init__(self, lines, lower_lines=None, index=None, offset=0):
+        super().__init__(lines)
+        self.lower = lower_lines if lower_lines is not None else [l.lower() for l in self]
+        self.index = index if index is not None else LabelIndex(self.lower)
+        self.offset = offset
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step == 1:
+                return LabLines(list.__getitem__(self, item), self.lower[item], self.index, self.offset + start)
+        return list.__getitem__(self, item)
+
+    def positions(self, *labels):
+        """Ascending positions (relative to this view) of lines containing any of `labels`."""
+        lo_abs, hi_abs = self.offset, self.offset + len(self)
+        merged = set()
+        for label in labels:
+            abs_positions = self.index.positions(label.lower())
+            lo, hi = bisect_left(abs_positions, lo_abs), bisect_left(abs_positions, hi_abs)
+            merged.update(abs_positions[lo:hi])
+        return sorted(p - lo_abs for p in merged)
+
+
+def lower_lines_of(lines):
+    return lines.lower if isinstance(lines, LabLines) else [l.lower() for l in lines]
+
+def find_label_lines(lines, *labels):
+    """Positions of the lines containing any of `labels` (case-insensitive), in order."""
+    if isinstance(lines, LabLines):
+        found = lines.positions(*labels)
+        count_scanned_lines(len(found))
+        return found
+    count_scanned_lines(len(lines))
+    lowered = [label.lower() for label in labels]
+    return [i for i, l in enumerate(lines) if any(label in l.lower() for label in lowered)]
+
+def first_label_line(lines, *labels):
+    found = find_label_lines(lines, *labels)
+    return found[0] if found else -1
+
+# --- Resultado Estruturado ---
+ALERTA_NORMAL, ALERTA_ALTERADO, ALERTA_CRITICO = 0, 1, 2
+SUFIXO_ALERTA = {ALERTA_NORMAL: "", ALERTA_ALTERADO: " *", ALERTA_CRITICO: " (!)"}
+
+class LabValue:
+    """One analyte of a parsed report.
+
+    `value` is the float compared against VALORES_REFERENCIA (already scaled for
+    " mil"), `unit` comes from UNIDADES_PADRAO and `text` is the display string
+    used in the formatted output (`display` is the same without the label).
+    Non-numeric results (urina, sorologias) keep `value` as None.
+    """
+    __slots__ = ("key", "label", "raw", "value", "unit", "alert", "section", "text", "display")
+
+    def __init__(self, key, label, raw, value=None, unit="", alert=ALERTA_NORMAL, section="", text="", display=None):
+        self.key, self.label, self.raw, self.value = key, label, raw, value
+        self.unit, self.alert, self.section, self.text = unit, alert, section, text
+        # `display` é o texto sem o rótulo ("9.8 *"), usado em "TP 14.2 (INR 1.25)" e nas tendências.
+        self.display = display if display is not None else text[len(label) + 1:] if text.startswith(f"{label} ") else text
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __repr__(self):
+        return f"LabValue({self.text!r}, section={self.section!r})"
+
+
+class LabResult:
+    """Structured result of parse_lab_report: analytes, cultures, the formatted text and the lab layout.
+
+    `leuco_diff` is the leukocyte differential table of parse_leukogram (cell ->
+    {"pct", "abs"}), including the cell types the compact text leaves out.
+    """
+    __slots__ = ("datetime", "values", "cultures", "text", "lab_format", "leuco_diff")
+
+    def __init__(self, datetime, values, cultures, text, lab_format="", leuco_diff=None):
+        self.datetime, self.values, self.cultures, self.text = datetime, values, cultures, text
+        self.lab_format, self.leuco_diff = lab_format, leuco_diff if leuco_diff is not None else OrderedDict()
+
+    def flagged(self, min_alert=ALERTA_ALTERADO):
+        return [v for v in self.values if v.alert >= min_alert]
+
+    def get(self, key):
+        return next((v for v in self.values if v.key == key), None)
+
+    def to_dict(self):
+        return {"datetime": self.datetime, "text": self.text, "formato": self.lab_format,
+                "values": [v.to_dict() for v in self.values], "culturas": self.cultures,
+                "leucograma_diferencial": {cell: dict(row) for cell, row in self.leuco_diff.items()}}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), ensure_ascii=False, **kwargs)
+
+    def __str__(self):
+        return self.text
+
+
+# --- Tabela de Limiares de Referência ---
+# Conjuntos selecionáveis aplicados sobre VALORES_REFERENCIA (sexo, faixa etária, laboratório).
+# Cada conjunto sobrescreve só os limites que informa; vários podem ser combinados em ordem.
+REFERENCE_RANGE_SETS = OrderedDict([
+    ("padrao", {}),
+    ("feminino", {"Hb": {"min": 12.0, "max": 16.0}, "Ht": {"min": 36.0, "max": 46.0}, "Cr": {"min": 0.50, "max": 1.10}}),
+])
+
+class ReferenceTable:
+    """Reference ranges compiled into parallel threshold arrays indexed by analyte id.
+
+    Missing bounds are stored as ±inf and unknown analytes map to an all-inf row,
+    so classifying a value is four comparisons on precomputed floats with no
+    per-key dict lookups. `classify_many` classifies every value of a report,
+    or of a whole batch, in one call (see classify_lab_results).
+    """
+
+    def __init__(self, ranges):
+        inf = float("inf")
+        self.ids = {key: i + 1 for i, key in enumerate(ranges)}
+        rows = [{}] + list(ranges.values())
+        self.min = array("d", (r.get("min", -inf) for r in rows))
+        self.max = array("d", (r.get("max", inf) for r in rows))
+        self.crit_low = array("d", (r.get("crit_low", -inf) for r in rows))
+        self.crit_high = array("d", (r.get("crit_high", inf) for r in rows))
+
+    def classify(self, key_ref, val_float):
+        if val_float is None: return ALERTA_NORMAL
+        i = self.ids.get(key_ref, 0)
+        if val_float < self.crit_low[i] or val_float > self.crit_high[i]: return ALERTA_CRITICO
+        return ALERTA_ALTERADO if val_float < self.min[i] or val_float > self.max[i] else ALERTA_NORMAL
+
+    def classify_many(self, keys, values):
+        """Alert level for each (key, value) pair; None values are ALERTA_NORMAL."""
+        ids, mn, mx, cl, ch = self.ids, self.min, self.max, self.crit_low, self.crit_high
+        alerts = []
+        for key_ref, v in zip(keys, values):
+            i = ids.get(key_ref, 0)
+            if v is None: alerts.append(ALERTA_NORMAL); continue
+            crit = v < cl[i] or v > ch[i]
+            alerts.append(ALERTA_CRITICO if crit else ALERTA_ALTERADO if v < mn[i] or v > mx[i] else ALERTA_NORMAL)
+        return alerts
+
+
+_reference_tables = {}
+
+def get_reference_table(range_set=None):
+    """ReferenceTable for a range set name (or tuple of names, applied in order); cached per combination."""
+    names = (range_set,) if isinstance(range_set, str) else tuple(range_set or ())
+    table = _reference_tables.get(names)
+    if table is None:
+        ranges = {key: dict(ref) for key, ref in VALORES_REFERENCIA.items()}
+        for name in names:
+            for key, overrides in REFERENCE_RANGE_SETS[name].items():
+                ranges.setdefault(key, {}).update(overrides)
+        table = _reference_tables[names] = ReferenceTable(ranges)
+    return table
+
+def classify_value(key_ref, val_float, table=None):
+    return (table or get_reference_table()).classify(key_ref, val_float)
+
+def result_key_ref(key):
+    """VALORES_REFERENCIA key of an extractor result key (gasometria drops its GA_/GV_ prefix)."""
+    return key[3:] if key.startswith(("GA_", "GV_")) else key
+
+def classify_lab_results(results_list, table=None):
+    """Alert levels of every LabNumber in a list of extractor results, classified in one call.
+
+    Returns one {result key: alert} dict per entry of `results_list`, for format_lab_result.
+    """
+    refs, keys, values = [], [], []
+    for i, all_res in enumerate(results_list):
+        for key, raw in all_res.items():
+            if isinstance(raw, LabNumber):
+                refs.append((i, key))
+                keys.append(result_key_ref(key))
+                values.append(raw.scaled)
+    alerts = [{} for _ in results_list]
+    for (i, key), alert in zip(refs, (table or get_reference_table()).classify_many(keys, values)):
+        alerts[i][key] = alert
+    return alerts
+
+def evaluate_value(label, raw_value, key_ref, unit_suffix="", section="", table=None, alert=None):
+    """LabValue for a LabNumber (or raw string) with its alert level; None for an empty value.
+
+    `alert` is the level already computed by classify_lab_results, if any.
+    """
+    if raw_value == "" or raw_value is None: return None
+    unit = UNIDADES_PADRAO.get(key_ref, "")
+    number = LabNumber.parse(raw_value, unit_suffix)
+    if number is None:
+        # Sem número (ex.: eGFR "95-82"): exibido como veio, sem alerta.
+        display = clean_number_format(raw_value) or str(raw_value)
+        return LabValue(key_ref, label, str(raw_value), unit=unit, section=section, text=f"{label} {display}",
+                        display=display)
+
+    if alert is None: alert = classify_value(key_ref, number.scaled, table)
+    display = f"{number.text}{number.scale}{SUFIXO_ALERTA[alert]}"
+    return LabValue(key_ref, label, number.raw, number.scaled, unit, alert, section, f"{label} {display}", display)
+
+def format_value_with_alert(label, raw_value_str, key_ref, unit_suffix=""):
+    lab_value = evaluate_value(label, raw_value_str, key_ref, unit_suffix)
+    return lab_value.text if lab_value is not None else ""
+
+
+def extract_labeled_value(lines, labels_to_search, pattern_to_extract=NUM_PATTERN,
+                          search_window_lines=3, label_must_be_at_start=False,
+                          ignore_case=True, line_offset_for_value=0, require_unit=None):
+    if isinstance(labels_to_search, str): labels_to_search = [labels_to_search]
+    if require_unit:
+        value_regex = PATTERNS.get("with_unit", pattern_to_extract, require_unit, re.IGNORECASE)
+    else:
+        value_regex = PATTERNS.get("raw", pattern_to_extract)
+    if ignore_case:
+        processed_lines = lower_lines_of(lines)
+        candidate_idx = find_label_lines(lines, *labels_to_search)
+    else:
+        processed_lines, candidate_idx = lines, range(len(lines))
+        count_scanned_lines(len(lines))
+    for i in candidate_idx:
+        current_line, processed_line = lines[i], processed_lines[i]
+        for label in labels_to_search:
+            processed_label = label.lower() if ignore_case else label
+            label_found_in_line, text_to_search_value_in = False, current_line
+            start_index_of_label = -1
+            if label_must_be_at_start:
+                if processed_line.startswith(processed_label): start_index_of_label = 0
+            else: start_index_of_label = processed_line.find(processed_label)
+            if start_index_of_label != -1:
+                label_found_in_line = True
+                text_to_search_value_in = current_line[start_index_of_label + len(label):].strip()
+            if label_found_in_line:
+                target_line_idx = i + line_offset_for_value
+                if 0 <= target_line_idx < len(lines):
+                    line_content_for_search = lines[target_line_idx] if line_offset_for_value != 0 else text_to_search_value_in
+                    match = None
+                    if line_content_for_search:
+                        match = value_regex.search(line_content_for_search)
+                    if match: return match.group(1)
+                    if line_offset_for_value == 0 :
+                        for j_offset in range(1, search_window_lines + 1):
+                            next_line_idx_abs = i + j_offset
+                            if next_line_idx_abs < len(lines):
+                                match_next = value_regex.search(lines[next_line_idx_abs])
+                                if match_next: return match_next.group(1)
+                return ""
+    return ""
+
+# --- Função de Anonimização ---
+def anonimizar_texto(texto_original):
+    linhas_processadas = []
+    for linha in texto_original.splitlines():
+        linha_strip = linha.strip()
+        if linha_strip.startswith("#ID:"):
+            partes = linha.split(":", 1)
+            id_tag = partes[0] + ":"
+            conteudo_id = partes[1].strip() if len(partes) > 1 else ""
+            
+            def substituir_nome_id_por_iniciais(match):
+                nome_completo = match.group(0).strip()
+                partes_nome = nome_completo.split()
+                PALAVRAS_EXCLUIR_DA_ABREVIACAO_ID = ["Pronto", "Socorro", "Centro", "Clínicas", "Hospital"]
+                
+                if len(partes_nome) > 1 and \
+                   all(p and p[0].isupper() for p in partes_nome) and \
+                   not nome_completo.isupper() and \
+                   not any(palavra_excluir.lower() in nome_completo.lower() for palavra_excluir in PALAVRAS_EXCLUIR_DA_ABREVIACAO_ID):
+                    
+                    partes_para_iniciais = [p for p in partes_nome if p.lower() not in ["de", "da", "do", "dos", "das", "e"]]
+                    if len(partes_para_iniciais) >= 2:
+                        iniciais = [p[0] + "." for p in partes_para_iniciais]
+                        return " ".join(iniciais)
+                return nome_completo
+
+            padrao_nome_composto_id = r"\b([A-ZÀ-Ú][a-zà-ú'-]+(?:\s+(?:de|da|do|dos|das|e)\s+[A-ZÀ-Ú][a-zà-ú'-]+){1,3})\b"
+            conteudo_id_anonimizado = re.sub(padrao_nome_composto_id, substituir_nome_id_por_iniciais, conteudo_id)
+            padrao_nome_geral_id = r"\b([A-ZÀ-Ú][a-zà-ú'-]+(?:\s+[A-ZÀ-Ú][a-zà-ú'-]+){1,2})\b"
+            conteudo_id_anonimizado = re.sub(padrao_nome_geral_id, substituir_nome_id_por_iniciais, conteudo_id_anonimizado)
+            
+            linhas_processadas.append(f"{id_tag} {conteudo_id_anonimizado}")
+        else:
+            linhas_processadas.append(linha)
+            
+    return "\n".join(linhas_processadas)
+    
+# --- Funções de Extração Específicas ---
+
+def format_collection_stamp(date_part, time_part, lenient=False):
+    """"dd/mm hhhmm" from the date ("12/03/2024") and time ("6:30") groups of a collection header.
+
+    Plain day/month/year dates are formatted straight from the digits; anything
+    else (month > 12, 3-digit year, impossible dates) goes through dateutil with
+    dayfirst. Returns None if the date is invalid, or with ``lenient=True`` its
+    day/month as written.
+    """
+    h_part, m_part = time_part.split(':')
+    hour = f"{h_part.zfill(2)}h{m_part.zfill(2)}"
+    day, month, year = date_part.split("/")
+    if len(year) in (2, 4):
+        try:
+            date(int(year) if len(year) == 4 else 2000 + int(year), int(month), int(day))
+            return f"{day.zfill(2)}/{month.zfill(2)} {hour}"
+        except ValueError:
+            pass
+    try:
+        return f"{_parse_date(date_part, dayfirst=True).strftime('%d/%m')} {hour}"
+    except (ValueError, TypeError, OverflowError):
+        return f"{day}/{month} {hour}" if lenient else None
+
+def find_collection_times(lines, label, header_pattern, lenient=False):
+    """Every collection header of one layout as (line index, "dd/mm hhhmm"), in order.
+
+    Only lines containing `label` are matched against `header_pattern`, so a
+    report is searched once for all of its collections.
+    """
+    regex = PATTERNS.get("raw", header_pattern, flags=re.IGNORECASE)
+    found = []
+    for i in find_label_lines(lines, label):
+        m = regex.search(lines[i])
+        if m is None: continue
+        stamp = format_collection_stamp(m.group(1), m.group(2), lenient)
+        if stamp: found.append((i, stamp))
+    return found
+
+def collection_times_tecnolab(lines):
+    return find_collection_times(lines, "coleta(", COLETA_TECNOLAB_PATTERN)
+
+def collection_times(lines):
+    return find_collection_times(lines, "data de coleta/recebimento:", COLETA_PADRAO_PATTERN, lenient=True)
+
+def extract_datetime_info_tecnolab(lines):
+    found = collection_times_tecnolab(lines)
+    return found[0][1] if found else ""
+
+def extract_datetime_info(lines):
+    found = collection_times(lines)
+    return found[0][1] if found else ""
+
+
+# --- Leucograma (contagem total + diferencial em uma passada) ---
+# Tipos celulares do diferencial, na ordem do laudo: chave -> rótulos aceitos.
+LEUKOCYTE_DIFFERENTIAL = OrderedDict([
+    ("MM", ("Metamielócitos", "Metamielocitos")),
+    ("Bast", ("Bastonetes", "Bastões")),
+    ("Seg", ("Segmentados", "Segs")),
+    ("Neut", ("Neutrófilos", "Neutrofilos")),
+    ("Linf", ("Linfócitos", "Linfocitos")),
+    ("Mono", ("Monócitos", "Monocitos")),
+    ("Eos", ("Eosinófilos",)),
+    ("Baso", ("Basófilos", "Basofilos")),
+])
+_DIFFERENTIAL_CELL_BY_LABEL = {label.lower(): cell for cell, labels in LEUKOCYTE_DIFFERENTIAL.items() for label in labels}
+# Rótulo, valor, "%" opcional e a contagem absoluta que costuma vir depois: "Segmentados....: 62 % 5.146".
+DIFFERENTIAL_ROW_PATTERN = (r"(" + "|".join(_DIFFERENTIAL_CELL_BY_LABEL) + r")[.:\s]*" + NUM_PATTERN +
+                            r"(?:\s*(%)(?:\s*(\d{1,3}(?:\.\d{3})+|\d{1,6}(?:,\d{1,3})?)\b)?)?")
+
+def _leuco_count(line, line_lower):
+    for num in PATTERNS.get("raw", NUM_PATTERN).findall(line):
+        clean_n = clean_number_format(num)
+        # "12.500 /mm³": ponto como separador de milhar na contagem absoluta
+        if "/mm" in line_lower and PATTERNS.get("raw", r"\d{1,3}\.\d{3}$").match(num):
+            clean_n = num.replace(".", "")
+        try:
+            val_float = float(clean_n)
+        except ValueError:
+            continue
+        if 1000 < val_float < 500000: return clean_n
+        if val_float < 100 and ("mil" in line_lower or "x10^3" in line_lower): return str(int(val_float * 1000))
+    return ""
+
+def parse_leukogram(lines):
+    """Total leukocyte count and differential table of a report, reading each candidate line once.
+
+    Returns (leuco, table): `leuco` is the count in /mm³ as text ("" if absent)
+    and `table` maps each cell type of LEUKOCYTE_DIFFERENTIAL found to
+    {"pct", "abs"} (the absolute count as printed, "" when the report has none).
+    The first line with a percentage (or a bare value up to 100) wins per cell;
+    reference-range lines are skipped.
+    """
+    lower_lines = lower_lines_of(lines)
+    row_regex = PATTERNS.get("raw", DIFFERENTIAL_ROW_PATTERN, flags=re.IGNORECASE)
+    leuco, table = "", OrderedDict()
+    for i in find_label_lines(lines, "leucócitos", *_DIFFERENTIAL_CELL_BY_LABEL):
+        line, line_lower = lines[i], lower_lines[i]
+        if not leuco and "leucócitos" in line_lower and "urina" not in line_lower:
+            leuco = _leuco_count(line, line_lower)
+        if "valor de referência" in line_lower: continue
+        percent_rows, bare_rows = {}, {}
+        for label, value, percent, absolute in row_regex.findall(line):
+            cell = _DIFFERENTIAL_CELL_BY_LABEL[label.lower()]
+            if cell in table: continue
+            if percent: percent_rows.setdefault(cell, {"pct": value, "abs": absolute})
+            elif 0 <= float(clean_number_format(value)) <= 100: bare_rows.setdefault(cell, {"pct": value, "abs": ""})
+        for cell, row in list(percent_rows.items()) + list(bare_rows.items()):
+            table.setdefault(cell, row)
+    return leuco, OrderedDict((cell, table[cell]) for cell in LEUKOCYTE_DIFFERENTIAL if cell in table)
+
+def extract_hemograma_completo(lines):
+    results = {}
+    
+    red_idx = first_label_line(lines, "série vermelha", "eritrograma")
+    search_scope = lines[red_idx:] if red_idx != -1 else lines
+    
+    mapa_vermelha = {
+        "Hb": ["Hemoglobina", "Hb"],
+        "Ht": ["Hematócrito", "Ht"],
+        "VCM": ["VCM", "Volume Corpuscular"],
+        "HCM": ["HCM", "Hemoglobina Corpuscular"],
+        "CHCM": ["CHCM", "Concentração"],
+        "RDW": ["RDW", "Red Cell"]
+    }
+
+    scope_lower = lower_lines_of(search_scope)
+    for key, labels in mapa_vermelha.items():
+        for i in find_label_lines(search_scope, *labels):
+            line, line_lower = search_scope[i], scope_lower[i]
+            for label in labels:
+                if label.lower() in line_lower:
+                    match = PATTERNS.get("label_num", label, flags=re.IGNORECASE).search(line)
+                    if match:
+                        results[key] = match.group(1)
+                        break 
+            if key in results: break
+
+    lower_lines = lower_lines_of(lines)
+    results["Leuco"], table = parse_leukogram(lines)
+    results["Leuco_Diff_Tabela"] = table
+
+    diff = []
+    cell_pct = {cell: values["pct"] for cell, values in table.items()}
+    if cell_pct.get("MM") and float(clean_number_format(cell_pct["MM"])) > 0: diff.append(f"MM {cell_pct['MM']}%")
+    if cell_pct.get("Bast"): diff.append(f"Bast {cell_pct['Bast']}%")
+    seg = cell_pct.get("Seg") or cell_pct.get("Neut")
+    if seg: diff.append(f"Seg {seg}%")
+    if cell_pct.get("Linf"): diff.append(f"Linf {cell_pct['Linf']}%")
+    eos = cell_pct.get("Eos")
+    if eos and float(clean_number_format(eos)) > 0:
+        diff.append(f"Eos {eos}%")
+
+    results["Leuco_Diff"] = f"({', '.join(diff)})" if diff else ""
+
+    results["Plaq"] = ""
+    for i in find_label_lines(lines, "plaquetas"):
+        line = lines[i]
+        if "volume" not in lower_lines[i]:
+             m = PATTERNS.get("label_alt_num", "Plaquetas", flags=re.IGNORECASE).search(line)
+             if m:
+                 val_plaq = m.group(1)
+                 results["Plaq"] = val_plaq
+                 try:
+                     if "mil" in lower_lines[i] or float(clean_number_format(val_plaq)) < 1000:
+                         results["Plaq_unit"] = " mil"
+                 except: pass
+                 break
+    
+    return results
+
+def extract_coagulograma_tecnolab(lines):
+    results = {}
+    results["TP_s"] = extract_labeled_value(lines, "TEMPO DE PROTROMBINA....:", search_window_lines=0)
+    results["INR"] = extract_labeled_value(lines, "I.N.R...................:", search_window_lines=0)
+    ttpa_idx = first_label_line(lines, "tempo tromboplastina parcial ativada")
+    if ttpa_idx != -1 and ttpa_idx + 1 < len(lines):
+        match = PATTERNS.get("resultado_num").search(lines[ttpa_idx + 1])
+        if match:
+            results["TTPA_s"] = match.group(1)
+    return results
+
+def extract_coagulograma(lines):
+    results = {}
+    results["TP_s"] = extract_labeled_value(lines, "Tempo em segundos:", label_must_be_at_start=False, search_window_lines=0)
+    inr_val = ""
+    for i in find_label_lines(lines, "Internacional (RNI):"):
+        if "Internacional (RNI):" in lines[i]:
+            if i + 1 < len(lines):
+                m_inr = PATTERNS.get("raw", NUM_PATTERN).search(lines[i+1])
+                if m_inr:
+                    inr_val = m_inr.group(1)
+                    break
+    if not inr_val:
+        inr_val = extract_labeled_value(lines, ["RNI:", "INR:"], label_must_be_at_start=False, search_window_lines=1)
+    results["INR"] = inr_val
+
+    lower_lines = lower_lines_of(lines)
+    ttpa_idx = next((i for i in find_label_lines(lines, "tempo de tromboplastina parcial ativado", "ttpa")
+                     if "tempo de protrombina" not in lower_lines[i]), -1)
+    if ttpa_idx != -1:
+        search_ttpa = lines[ttpa_idx:]
+        results["TTPA_s"] = extract_labeled_value(search_ttpa, "Tempo em segundos", label_must_be_at_start=False, search_window_lines=1)
+        results["TTPA_R"] = extract_labeled_value(search_ttpa, "Relação:", label_must_be_at_start=False, search_window_lines=1)
+    return results
+
+def extract_tecnolab_generic(lines, labels):
+    if isinstance(labels, str): labels = [labels]
+    lower_lines = lower_lines_of(lines)
+    for i in find_label_lines(lines, *labels):
+        if "resultado" not in lower_lines[i]:
+            for j in range(i, min(i + 4, len(lines))):
+                if "RESULTADO:" in lines[j]:
+                    match = PATTERNS.get("resultado_num", flags=re.IGNORECASE).search(lines[j])
+                    if match:
+                        return match.group(1)
+    return ""
+
+def extract_funcao_renal_e_eletrólitos_tecnolab(lines):
+    results = {}
+    results["U"] = extract_labeled_value(lines, ["Ureia", "Uréia"], label_must_be_at_start=False)
+    results["Cr"] = extract_tecnolab_generic(lines, "CREATININA")
+
+    egfr_afro = extract_labeled_value(lines, "*eGFR - Afro Descendente:")
+    egfr_non_afro = extract_labeled_value(lines, "*eGFR Não Afro Descendente:")
+    if egfr_afro and egfr_non_afro:
+         results["eGFR"] = f"{clean_number_format(egfr_afro)}-{clean_number_format(egfr_non_afro)}"
+
+    results["K"] = extract_tecnolab_generic(lines, ["DOSAGEM DE POTÁSSIO", "POTÁSSIO"])
+    results["Na"] = extract_tecnolab_generic(lines, ["DOSAGEM DE SÓDIO", "SÓDIO"])
+    results["Mg"] = extract_tecnolab_generic(lines, ["DOSAGEM DE MAGNÉSIO", "MAGNÉSIIO"])
+    results["CaT"] = extract_tecnolab_generic(lines, "CALCIO")
+    results["Gli"] = extract_tecnolab_generic(lines, ["DOSAGEM DE GLICOSE", "GLICOSE"])
+    return results
+
+def extract_funcao_renal_e_eletrólitos(lines):
+    results = {}
+    results["U"] = extract_labeled_value(lines, "Ureia", label_must_be_at_start=True)
+    if not results["U"]: results["U"] = extract_labeled_value(lines, "U ", label_must_be_at_start=True)
+    results["Cr"] = extract_labeled_value(lines, "Creatinina ", label_must_be_at_start=True)
+    results["eGFR"] = extract_labeled_value(lines, ["eGFR", "*eGFR", "Ritmo de Filtração Glomerular"], label_must_be_at_start=True)
+    for k, lbls in [("K", ["Potássio", "K "]), ("Na", ["Sódio", "Na "]), ("Mg", "Magnésio"),
+                    ("P", "Fósforo"), ("CaI", "Cálcio Iônico"), ("Cl", ["Cloro","Cloreto", "Cl "]), ("Gli", ["Glicose", "Glicemia"])]:
+        results[k] = extract_labeled_value(lines, lbls, label_must_be_at_start=k not in ["CaI"])
+    return results
+
+def extract_marcadores_inflamatorios_cardiacos_tecnolab(lines):
+    results = {}
+    results["PCR"] = extract_tecnolab_generic(lines, 'PROTEINA "C" REATIVA')
+    results["Trop"] = extract_tecnolab_generic(lines, 'TROPONINA T (ALTA SENSIBILIDADE)')
+    results["NT-proBNP"] = extract_tecnolab_generic(lines, 'NT-proBNP')
+    return results
+
+def extract_marcadores_inflamatorios_cardiacos(lines):
+    results = {}
+    for k, lbls, start in [("PCR",["Proteína C Reativa","PCR"],True), ("Lac","Lactato",True), ("Trop","Troponina",False), ("DD","D-Dímero",False)]:
+        results[k] = extract_labeled_value(lines, lbls, label_must_be_at_start=start)
+    return results
+
+def extract_hepatograma_pancreas_tecnolab(lines):
+    results = {}
+    lower_lines = lower_lines_of(lines)
+    results["TGO"] = extract_tecnolab_generic(lines, "TRANSAMINASE OXALACETICA - TGO")
+    results["TGP"] = extract_tecnolab_generic(lines, "TRANSAMINASE PIRUVICA (TGP)")
+    results["FA"] = extract_tecnolab_generic(lines, "FOSFATASE ALCALINA")
+    results["GGT"] = extract_tecnolab_generic(lines, "GAMA-GLUTAMIL TRANSFERASE")
+    results["AML"] = extract_tecnolab_generic(lines, "AMILASE")
+
+    bili_idx = next((i for i in find_label_lines(lines, "bilirrubina") if "resultado" in lower_lines[i]), -1)
+    if bili_idx == -1:
+         bili_idx = next((i for i, l in enumerate(lines) if l.strip().upper() == "BILIRRUBINA"),-1)
+    if bili_idx != -1:
+        search_bili = lines[bili_idx : bili_idx + 5]
+        results["BT"] = extract_labeled_value(search_bili, "TOTAL....:", search_window_lines=0)
+        results["BD"] = extract_labeled_value(search_bili, "DIRETA...:", search_window_lines=0)
+        results["BI"] = extract_labeled_value(search_bili, "INDIRETA.:", search_window_lines=0)
+
+    return results
+
+def extract_hepatograma_pancreas(lines):
+    results = {}
+    tgo_val, tgp_val = "", ""
+    for i in find_label_lines(lines, "Transaminase oxalacética - TGO", "Aspartato amino transferase",
+                              "Transaminase pirúvica - TGP", "Alanina amino transferase"):
+        line = lines[i]
+        if not tgo_val and ("Transaminase oxalacética - TGO" in line or ("Aspartato amino transferase" in line and "TGO" in line.upper())):
+            for offset in range(1, 4):
+                if i + offset < len(lines):
+                    target_line = lines[i + offset]
+                    match_ul = PATTERNS.get("num_with_unit_at_start", unit="U/L").match(target_line)
+                    if match_ul: tgo_val = match_ul.group(1); break
+            if not tgo_val and i + 2 < len(lines):
+                 m = PATTERNS.get("raw", NUM_PATTERN).search(lines[i+2])
+                 if m: tgo_val = m.group(1)
+        if not tgp_val and ("Transaminase pirúvica - TGP" in line or ("Alanina amino transferase" in line and "TGP" in line.upper())):
+            for offset in range(1, 4):
+                if i + offset < len(lines):
+                    target_line = lines[i + offset]
+                    match_ul = PATTERNS.get("num_with_unit_at_start", unit="U/L").match(target_line)
+                    if match_ul: tgp_val = match_ul.group(1); break
+            if not tgp_val and i + 2 < len(lines):
+                 m = PATTERNS.get("raw", NUM_PATTERN).search(lines[i+2])
+                 if m: tgp_val = m.group(1)
+    results["TGO"] = tgo_val
+    results["TGP"] = tgp_val
+    if not results.get("TGO"): results["TGO"] = extract_labeled_value(lines, ["TGO", "AST"], label_must_be_at_start=False, search_window_lines=1, require_unit="U/L")
+    if not results.get("TGP"): results["TGP"] = extract_labeled_value(lines, ["TGP", "ALT"], label_must_be_at_start=False, search_window_lines=1, require_unit="U/L")
+    results["GGT"] = extract_labeled_value(lines, ["Gama-Glutamil Transferase", "GGT"], label_must_be_at_start=True, search_window_lines=0, require_unit="U/L")
+    if not results["GGT"]: results["GGT"] = extract_labeled_value(lines, ["Gama-Glutamil Transferase", "GGT"], label_must_be_at_start=True, search_window_lines=0)
+    results["FA"] = extract_labeled_value(lines, "Fosfatase Alcalina", label_must_be_at_start=True, search_window_lines=0, require_unit="U/L")
+    if not results["FA"]: results["FA"] = extract_labeled_value(lines, "Fosfatase Alcalina", label_must_be_at_start=True, search_window_lines=0)
+    bilirrubina_start_index = first_label_line(lines, "bilirrubinas total, direta e indireta")
+    bilirrubina_section_found = bilirrubina_start_index != -1
+    search_scope_bilirrubinas = lines[bilirrubina_start_index:] if bilirrubina_section_found else lines
+    results["BT"] = extract_labeled_value(search_scope_bilirrubinas, "Bilirrubina Total", label_must_be_at_start=True, search_window_lines=1)
+    results["BD"] = extract_labeled_value(search_scope_bilirrubinas, "Bilirrubina Direta", label_must_be_at_start=True, search_window_lines=1)
+    results["BI"] = extract_labeled_value(search_scope_bilirrubinas, "Bilirrubina Indireta", label_must_be_at_start=True, search_window_lines=1)
+    if not results.get("BT"): results["BT"] = extract_labeled_value(lines, "Bilirrubina Total", label_must_be_at_start=True, search_window_lines=1)
+    if not results.get("BD"): results["BD"] = extract_labeled_value(lines, "Bilirrubina Direta", label_must_be_at_start=True, search_window_lines=1)
+    if not results.get("BI"): results["BI"] = extract_labeled_value(lines, "Bilirrubina Indireta", label_must_be_at_start=True, search_window_lines=1)
+    results["ALB"] = extract_labeled_value(lines, "Albumina", label_must_be_at_start=True, search_window_lines=1)
+    results["AML"] = extract_labeled_value(lines, "Amilase", label_must_be_at_start=True, search_window_lines=1)
+    results["LIP"] = extract_labeled_value(lines, "Lipase", label_must_be_at_start=True, search_window_lines=1)
+    return results
+
+def extract_medicamentos(lines):
+    results = {}
+    results["Vanco"] = extract_labeled_value(lines, "Vancomicina", label_must_be_at_start=False, search_window_lines=0, require_unit="µg/mL")
+    return results
+
+def extract_gasometria(lines):
+    results = {}
+    exam_prefix = ""
+    lower_lines = lower_lines_of(lines)
+
+    gas_idx = first_label_line(lines, "gasometria arterial", "gasometria venosa")
+    gas_header_found = gas_idx != -1
+    if gas_header_found:
+        exam_prefix = "GA_" if "gasometria arterial" in lower_lines[gas_idx] else "GV_"
+    
+    if not gas_header_found:
+        gas_idx = first_label_line(lines, "gasometria")
+        if gas_idx != -1:
+            l_line = lower_lines[gas_idx]
+            if "arterial" in l_line: exam_prefix = "GA_"
+            elif "venosa" in l_line: exam_prefix = "GV_"
+            gas_header_found = True
+
+    if not gas_header_found:
+        return results
+
+    gas_map = {
+        "ph": "pH_gas", "pco2": "pCO2_gas", "hco3": "HCO3_gas",
+        "bicarbonato": "HCO3_gas", "be": "BE_gas", "excesso de bases": "BE_gas",
+        "po2": "pO2_gas", "saturação de o2": "SatO2_gas", "sato2": "SatO2_gas",
+        "lactato": "Lac_gas", "lac": "Lac_gas", "co2 total": "cCO2_gas", "conteúdo de co2": "cCO2_gas"
+    }
+
+    search_lines = lines[gas_idx + 1 : min(gas_idx + 20, len(lines))]
+    
+    for line_content in search_lines:
+        if any(hdr in line_content.lower() for hdr in ["hemograma", "coagulograma", "bioquimica", "cultura", "urina tipo i", "assinado eletronicamente", "material:"]):
+            break
+        
+        match = PATTERNS.get("raw", r"^\s*([a-zA-Z0-9+\s]+?)\s*:\s*" + GAS_NUM_PATTERN).match(line_content)
+        if match:
+            label = match.group(1).strip().lower()
+            value = match.group(2)
+            if label in gas_map:
+                out_key = gas_map[label]
+                if out_key not in results:
+                    results[out_key] = value
+            continue
+
+    if exam_prefix:
+        return {exam_prefix + k: v for k, v in results.items() if v}
+    elif results:
+        return {k: v for k, v in results.items() if v}
+    return {}
+
+
+def extract_sorologias(lines):
+    results = {}
+    tests = [("Anti HIV 1/2","HIV"),("Anti-HAV (IgM)","HAV_IgM"),("HBsAg","HBsAg"),("Anti-HBs","AntiHBs"),
+             ("Anti-HBc Total","AntiHBc_Total"),("Anti-HCV","HCV"),("VDRL","VDRL")]
+    lower_lines = lower_lines_of(lines)
+    for i in find_label_lines(lines, *(srch_k for srch_k, _ in tests)):
+        l_line = lower_lines[i]
+        for srch_k, dict_k in tests:
+            if srch_k.lower() in l_line:
+                res_txt = ""
+                for k_rng in range(i, min(i + 3, len(lines))):
+                    s_line = lower_lines[k_rng]
+                    if any(t in s_line for t in ["não reagente","nao reagente","negativo"]): res_txt = "(-)"; break
+                    elif any(t in s_line for t in ["reagente","positivo"]): res_txt = "(+)"; break
+                    elif srch_k.lower() in s_line:
+                        m = PATTERNS.get("raw", r"(\d+[:/]\d+)").search(lines[k_rng])
+                        if m: res_txt = f"({m.group(1)})"; break
+                if res_txt: results[dict_k] = res_txt; break
+    return results
+
+def extract_urina_tipo_i_tecnolab(lines):
+    results = {}
+    u1_idx = first_label_line(lines, "urina tipo i")
+    if u1_idx == -1: return {}
+
+    search_u1 = lines[u1_idx : min(u1_idx + 25, len(lines))]
+    
+    for line in search_u1:
+        # Regex inclui letras acentuadas maiúsculas (À-Ú) para capturar PROTEÍNA, HEMÁCIAS, LEUCÓCITOS, REAÇÃO etc.
+        match = PATTERNS.get("raw", r"\s*([A-ZÀ-Ú\s-]+)\s*:\s*(.+)").match(line)
+        if match:
+            key, value = match.group(1).strip().lower(), match.group(2).strip()
+            val_num_match = PATTERNS.get("raw", NUM_PATTERN).search(value)
+            if "ph" in key: results["U1_pH"] = val_num_match.group(1) if val_num_match else ""
+            elif "densidade" in key: results["U1_dens"] = value.split()[0]
+            elif "proteína" in key: results["U1_prot"] = "(-)" if "negativo" in value.lower() else "(+)"
+            elif "glicose" in key: results["U1_glic"] = "(-)" if "negativo" in value.lower() else "(+)"
+            elif "nitrito" in key: results["U1_nit"] = "(-)" if "negativo" in value.lower() else "(+)"
+            elif "corpos cetônicos" in key: results["U1_CC"] = "(-)" if "negativo" in value.lower() else "(+)"
+            elif "hemácias" in key:
+                 # Preserva formato brasileiro com ponto como separador de milhar (ex: 3.000)
+                 if val_num_match: results["U1_hem"] = val_num_match.group(1)
+            elif "leucócitos" in key:
+                if "acima de" in value.lower() and val_num_match:
+                    results["U1_leuco"] = ">" + val_num_match.group(1)
+                elif val_num_match:
+                    results["U1_leuco"] = val_num_match.group(1)
+    return results
+
+def extract_urina_tipo_i(lines):
+    results = {}
+    u1_idx = first_label_line(lines, "urina tipo i")
+    if u1_idx == -1: return {}
+
+    search_u1 = lines[u1_idx : min(u1_idx + 25, len(lines))]
+    
+    for line in search_u1:
+        l_line = line.lower()
+        if "assinado eletronicamente" in l_line or ("método:" in l_line and "urina tipo i" not in l_line): break
+        if "nitrito" in l_line: results["U1_nit"] = "(+)" if "positivo" in l_line else "(-)"
+        for k, lbls, terms in [("U1_leuco",["leucócitos"],{"numerosos":"Num","inumeros":"Num","raros":"Raros","campos cobertos":"Cob"}),
+                               ("U1_hem",["hemácias","eritrócitos"],{"numerosas":"Num","inumeras":"Num","raras":"Raras","campos cobertos":"Cob"})]:
+            if any(lbl in l_line for lbl in lbls):
+                search_text = line.split(lbls[0])[-1] if lbls[0] in line else line
+                m = PATTERNS.get("raw", NUM_PATTERN).search(search_text)
+                if m and clean_number_format(m.group(1)).isdigit():
+                    results[k] = clean_number_format(m.group(1)); break
+                for term, abbr in terms.items():
+                    if term in l_line: results[k] = abbr; break
+                if k in results: break
+    return results
+
+def extract_culturas_tecnolab(lines):
+    found_cultures = []
+    lower_lines = lower_lines_of(lines)
+    for i in find_label_lines(lines, "urocultura", "hemocultura"):
+        l_line = lower_lines[i]
+        cult_type, cult_result = None, None
+        if l_line.startswith("urocultura"):
+            cult_type = "URC"
+            if i + 2 < len(lines) and "resultado:" in lower_lines[i+1]:
+                if "não houve crescimento" in lower_lines[i+2]: cult_result = "(-)"
+        elif l_line.startswith("hemocultura"):
+            cult_type = "HMC"
+            if i + 1 < len(lines) and "resultado parcial:" in lower_lines[i+1]:
+                if "parcialmente negativo" in lower_lines[i+1]: cult_result = "PN"
+
+        if cult_type and cult_result:
+            found_cultures.append({"Tipo": cult_type, "Resultado": cult_result})
+
+    unique_cultures = []
+    seen = set()
+    for cult in found_cultures:
+        identifier = cult["Tipo"]
+        if identifier not in seen:
+            unique_cultures.append(cult)
+            seen.add(identifier)
+    return unique_cultures
+
+def extract_culturas(lines):
+    found_cultures = []
+    germe_regex = r"([A-Z][a-z]+\s(?:cf\.\s)?[A-Z]?[a-z]+)"
+    culture_headers = ("cultura de urina", "urocultura", "hemocultura")
+    block_boundaries = find_label_lines(lines, *culture_headers, "hemograma", "coagulograma", "bioquimica",
+                                        "urina tipo i", "assinado eletronicamente")
+    for i in find_label_lines(lines, *culture_headers):
+        next_boundary = bisect_right(block_boundaries, i)
+        j = block_boundaries[next_boundary] if next_boundary < len(block_boundaries) else len(lines)
+        current_culture_block_lines = list(lines[i:j])
+        culture_data = process_single_culture_block(current_culture_block_lines, germe_regex)
+        if culture_data: found_cultures.append(culture_data)
+    final_cultures = []
+    seen_types_and_results = set()
+    for cult in found_cultures:
+        cult_id_tuple = (cult.get("Tipo"), cult.get("Resultado","").split(" / ")[0])
+        is_meaningful_hmc_negative = "HMC" in cult.get("Tipo","") and cult.get("Resultado","") == "(-)"
+        is_positive_result = "(+)" in cult.get("Resultado","")
+        has_antibiogram = any(val for val in cult.get("Antibiograma", {}).values())
+        if is_meaningful_hmc_negative or is_positive_result or has_antibiogram:
+            if cult_id_tuple not in seen_types_and_results or is_meaningful_hmc_negative:
+                final_cultures.append(cult)
+                if not is_meaningful_hmc_negative:
+                    seen_types_and_results.add(cult_id_tuple)
+    return final_cultures
+
+
+def process_single_culture_block(block_lines, germe_regex):
+    current_culture_data = {}
+    culture_type_label, culture_type_detail, sample_info = None, "", ""
+    first_line_lower = block_lines[0].lower()
+    if "cultura de urina" in first_line_lower or "urocultura" in first_line_lower:
+        culture_type_label = "URC"
+    elif "hemocultura" in first_line_lower:
+        culture_type_detail = "Aeróbio" if "aeróbios" in first_line_lower or "aerobio" in first_line_lower else \
+                              "Anaeróbio" if "anaeróbios" in first_line_lower or "anaerobio" in first_line_lower else ""
+        culture_type_label = f"HMC {culture_type_detail}".strip()
+        sample_regex = PATTERNS.get("raw", r"\(Amostra\s*(\d+/\d+)\)", flags=re.IGNORECASE)
+        sample_match = sample_regex.search(block_lines[0]) or \
+                       (1 < len(block_lines) and sample_regex.search(block_lines[1]))
+        if sample_match: culture_type_label += f" Amostra {sample_match.group(1)}"
+    if not culture_type_label: return None
+    current_culture_data["Tipo"] = culture_type_label.strip()
+    result_text_found = "(-)"
+    for r_line in block_lines:
+        lc_r_line = r_line.lower()
+        if lc_r_line.startswith("resultado:") or "resultado da cultura:" in lc_r_line:
+            res_text = PATTERNS.get("raw", r"(?i)(resultado:|resultado da cultura:)").sub("", r_line, count=1).strip()
+            germe_match = PATTERNS.get("raw", germe_regex).search(res_text)
+            if germe_match:
+                result_text_found = f"{germe_match.group(1).strip()} (+)"
+            elif any(neg in res_text.lower() for neg in ["negativo", "negativa", "não houve crescimento", "ausência de crescimento"]):
+                result_text_found = "(-)"
+            elif res_text:
+                result_text_clean = res_text.split("Negativo")[0].strip()
+                if result_text_clean: result_text_found = f"{result_text_clean} (+)"
+            break
+    current_culture_data["Resultado"] = result_text_found
+    antibiogram_results, antibiogram_start_idx_in_block = {"S": [], "I": [], "R": []}, -1
+    for k, abg_line in enumerate(block_lines):
+        if any(term in abg_line.lower() for term in ["antibiograma", "tsa", "teste de sensibilidade"]):
+            antibiogram_start_idx_in_block = k; break
+    if antibiogram_start_idx_in_block != -1:
+        for k_abg in range(antibiogram_start_idx_in_block + 1, len(block_lines)):
+            line_abg = block_lines[k_abg].strip()
+            if not line_abg or "legenda:" in line_abg.lower() or "valor de referência" in line_abg.lower() or \
+               line_abg.lower().startswith("método:") or line_abg.lower().startswith("nota:"): break
+            m = PATTERNS.get("raw", r"^\s*([a-zA-ZÀ-ÿ0-9\s.,()/-]+?)\s+[.,:]*\s*([SIR])\b", flags=re.IGNORECASE).match(line_abg) or \
+                PATTERNS.get("raw", r"^\s*([a-zA-ZÀ-ÿ0-9\s.,()/-]+?)\s+.*?\b([SIR])\s*$", flags=re.IGNORECASE).match(line_abg)
+            if m:
+                name, code = PATTERNS.get("raw", r'\s*\.\s*').sub('', m.group(1).strip()).strip(), m.group(2).upper()
+                if code in antibiogram_results: antibiogram_results[code].append(name)
+    current_culture_data["Antibiograma"] = antibiogram_results
+    return current_culture_data
+
+
+# --- Função Principal de Análise de Exames (parse_lab_report) ---
+def parse_lab_report(text, lab_format=None, range_set=None):
+    return parse_lab_report_structured(text, lab_format=lab_format, range_set=range_set).text
+
+
+# --- Segmentação do Laudo em Blocos ---
+# Títulos que abrem cada bloco tipado (substring, sem diferenciar maiúsculas).
+SECTION_HEADERS = OrderedDict([
+    ("hemograma", ("hemograma", "série vermelha", "eritrograma", "série branca", "leucograma")),
+    ("coagulograma", ("coagulograma", "tempo de protrombina", "tempo de tromboplastina", "tempo tromboplastina")),
+    ("bioquimica", ("bioquimica", "bioquímica")),
+    ("gasometria", ("gasometria",)),
+    ("urina_i", ("urina tipo i",)),
+    ("culturas", ("cultura de urina", "urocultura", "hemocultura")),
+    ("sorologias", ("anti hiv", "anti-hav", "hbsag", "anti-hbs", "anti-hbc", "anti-hcv", "vdrl")),
+])
+ASSINATURA_LAUDO = "assinado eletronicamente"
+SECTION_END_MARKERS = (ASSINATURA_LAUDO,)
+# Blocos cujo título costuma faltar na colagem: sem o bloco, o extrator vê o laudo inteiro em vez de ser pulado.
+OPTIONAL_SECTIONS = {"hemograma", "coagulograma"}
+
+class LabSections:
+    """Typed blocks of one report, found in a single pass over the label index.
+
+    A block starts at a header line of its kind and runs until the next header
+    of another kind or a signature line; consecutive headers of the same kind
+    extend the block, and untyped lines right before a header join it. `view(kind)` returns only the lines
+    of the blocks of that kind (the slice sharing the report's index when there is a single block, the
+    blocks joined into new LabLines otherwise), or None if there is none.
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.spans = OrderedDict()
+        self._digests = {}
+        markers = {}
+        for kind, headers in reversed(SECTION_HEADERS.items()):
+            for i in find_label_lines(lines, *headers): markers[i] = kind
+        for i in find_label_lines(lines, *SECTION_END_MARKERS): markers[i] = None
+        # Linhas sem bloco logo antes de um título (início de colagem cortada, após uma assinatura)
+        # pertencem ao bloco que vem a seguir.
+        current_kind, current_start = None, 0
+        for i in sorted(markers):
+            kind = markers[i]
+            if kind is not None and kind == current_kind: continue
+            if current_kind: self.spans.setdefault(current_kind, []).append((current_start, i))
+            if kind is None: current_start = i + 1
+            elif current_kind: current_start = i
+            current_kind = kind
+        if current_kind: self.spans.setdefault(current_kind, []).append((current_start, len(lines)))
+
+    def __contains__(self, kind):
+        return kind in self.spans
+
+    def view(self, kind):
+        spans = self.spans.get(kind)
+        if not spans: return None
+        if len(spans) == 1: return self.lines[spans[0][0]:spans[0][1]]
+        # Vários blocos (várias coletas): só as linhas deles, sem os blocos de outros tipos entre eles.
+        return LabLines([line for start, end in spans for line in self.lines[start:end]])
+
+    def scope_for(self, kind):
+        """Lines an extractor of `kind` should see, or None to skip it."""
+        if kind is None: return self.lines
+        block = self.view(kind)
+        if block is None and kind in OPTIONAL_SECTIONS: return self.lines
+        return block
+
+    def digest(self, kind):
+        """Content hash of scope_for(kind), computed once per block (None if the scope is skipped)."""
+        if kind not in self.spans and kind in OPTIONAL_SECTIONS: kind = None  # mesmo escopo: o laudo inteiro
+        if kind not in self._digests:
+            scope = self.scope_for(kind)
+            self._digests[kind] = None if scope is None else \
+                hashlib.blake2b("\n".join(scope).encode("utf-8"), digest_size=16).hexdigest()
+        return self._digests[kind]
+
+
+# --- Registro de Formatos de Laudo ---
+class LabFormat:
+    """One lab report layout: a cheap fingerprint plus the extractors that understand it.
+
+    `fingerprint(lowered_text)` should be a plain substring test, since it runs
+    on every paste. `collection_header` is the regex (date, time groups) of the
+    layout's collection header, used to split multi-collection pastes, and
+    `collection_times(lines)` lists every collection of the layout as (line
+    index, "dd/mm hhhmm").
+    `datetime_extractor` and `culturas_extractor` fill the header and the
+    cultures; every function in `extractors` returns a dict merged into the
+    results. `sections` maps an extractor to the block kind it reads (see
+    LabSections); extractors not listed see the whole report.
+    """
+
+    def __init__(self, name, label, fingerprint, datetime_extractor, extractors, culturas_extractor,
+                 collection_header=None, sections=None, collection_times=None):
+        self.name, self.label, self.fingerprint = name, label, fingerprint
+        self.datetime_extractor, self.extractors = datetime_extractor, extractors
+        self.culturas_extractor, self.collection_header = culturas_extractor, collection_header
+        self.collection_times = collection_times
+        self.sections = sections if sections is not None else EXTRACTOR_SECTIONS
+
+    def matches_header(self, text):
+        return bool(self.collection_header) and \
+            PATTERNS.get("raw", self.collection_header, flags=re.IGNORECASE).search(text) is not None
+
+    def __repr__(self):
+        return f"LabFormat({self.name!r})"
+
+
+EXTRACTOR_SECTIONS = {
+    extract_hemograma_completo: "hemograma",
+    extract_coagulograma: "coagulograma", extract_coagulograma_tecnolab: "coagulograma",
+    extract_gasometria: "gasometria",
+    extract_urina_tipo_i: "urina_i", extract_urina_tipo_i_tecnolab: "urina_i",
+    extract_culturas: "culturas", extract_culturas_tecnolab: "culturas",
+    extract_sorologias: "sorologias",
+}
+
+# Resultados numéricos que saem dos extratores como LabNumber (gasometria também com prefixo GA_/GV_).
+NUMERIC_RESULT_KEYS = {
+    "Hb", "Ht", "VCM", "HCM", "CHCM", "RDW", "Leuco", "Plaq", "TP_s", "INR", "TTPA_s", "TTPA_R",
+    "U", "Cr", "eGFR", "Na", "K", "Cl", "Mg", "CaI", "CaT", "P", "Gli",
+    "PCR", "Lac", "Trop", "DD", "NT-proBNP", "Vanco", "TGO", "TGP", "GGT", "FA", "BT", "BD", "BI", "ALB", "AML", "LIP",
+    "pH_gas", "pCO2_gas", "pO2_gas", "HCO3_gas", "BE_gas", "SatO2_gas", "Lac_gas", "cCO2_gas",
+}
+
+def parse_lab_numbers(results):
+    """Replace the numeric results of an extractor's dict by LabNumber ("<key>_unit" gives the scale)."""
+    for key, raw in results.items():
+        if result_key_ref(key) in NUMERIC_RESULT_KEYS and raw and isinstance(raw, str):
+            number = LabNumber.parse(raw, results.get(f"{key}_unit", ""))
+            if number is not None: results[key] = number
+    return results
+
+LAB_FORMATS = OrderedDict()
+DEFAULT_LAB_FORMAT = "nav_dasa"
+
+def register_lab_format(lab_format):
+    """Add a layout to the registry. Detection tries layouts in registration order."""
+    LAB_FORMATS[lab_format.name] = lab_format
+    return lab_format
+
+def detect_lab_format(text, match_headers=False):
+    """Return the first registered LabFormat whose fingerprint matches `text` (default: NAV DASA).
+
+    With ``match_headers=True`` a layout also matches when its collection header
+    appears in the text (used for collections cut out of a larger paste).
+    """
+    lowered = text.lower()
+    for lab_format in LAB_FORMATS.values():
+        if lab_format.fingerprint(lowered) or (match_headers and lab_format.matches_header(text)):
+            return lab_format
+    return LAB_FORMATS[DEFAULT_LAB_FORMAT]
+
+def get_lab_format(lab_format, text=""):
+    """Resolve a LabFormat, a registered name or None (detect from `text`)."""
+    if lab_format is None: return detect_lab_format(text)
+    if isinstance(lab_format, str): return LAB_FORMATS[lab_format]
+    return lab_format
+
+register_lab_format(LabFormat(
+    "tecnolab", "Tecnolab", lambda lowered: "tecnolab.com.br" in lowered,
+    extract_datetime_info_tecnolab,
+    [extract_hemograma_completo, extract_coagulograma_tecnolab, extract_funcao_renal_e_eletrólitos_tecnolab,
+     extract_marcadores_inflamatorios_cardiacos_tecnolab, extract_hepatograma_pancreas_tecnolab,
+     extract_medicamentos, extract_gasometria, extract_sorologias, extract_urina_tipo_i_tecnolab],
+    extract_culturas_tecnolab,
+    collection_header=COLETA_TECNOLAB_PATTERN, collection_times=collection_times_tecnolab,
+))
+register_lab_format(LabFormat(
+    "nav_dasa", "NAV DASA", lambda lowered: "data de coleta/recebimento" in lowered,
+    extract_datetime_info,
+    [extract_hemograma_completo, extract_coagulograma, extract_funcao_renal_e_eletrólitos,
+     extract_marcadores_inflamatorios_cardiacos, extract_hepatograma_pancreas,
+     extract_medicamentos, extract_gasometria, extract_sorologias, extract_urina_tipo_i],
+    extract_culturas,
+    collection_header=COLETA_PADRAO_PATTERN, collection_times=collection_times,
+))
+
+
+def collection_timestamps(lines, lab_format=None):
+    """Every collection in `lines` as (line index, "dd/mm hhhmm", format name), ordered by line.
+
+    With `lab_format` only that layout's headers are looked for; otherwise all
+    registered layouts are.
+    """
+    formats = [get_lab_format(lab_format)] if lab_format is not None else LAB_FORMATS.values()
+    found = [(i, stamp, f.name) for f in formats if f.collection_times for i, stamp in f.collection_times(lines)]
+    return sorted(found, key=lambda item: item[0])
+
+def prepare_lab_lines(text):
+    """Normalize analyte spellings and return the non-blank, stripped lines as LabLines."""
+    text = normalize_lab_terms(text)
+    return LabLines([line.strip() for line in text.splitlines() if line.strip()])
+
+def parse_lab_report_structured(text, lab_format=None, profile=None, range_set=None, block_cache=None):
+    """Parse one report into a LabResult; pass a ParseProfile as `profile` to time each stage.
+
+    `lab_format` is a LabFormat or registered name; by default it is detected
+    once from the text and only that layout's extractors run. `range_set`
+    selects the reference ranges (see REFERENCE_RANGE_SETS). With a ParseCache
+    as `block_cache` each extractor's result is memoized by the hash of the
+    block it reads, so re-parsing an edited report only re-runs the extractors
+    whose block changed.
+    """
+    all_res, lab_format = extract_lab_results(text, lab_format, profile, block_cache)
+    with profile_stage(profile, "format_lab_result"):
+        result = format_lab_result(all_res, get_reference_table(range_set))
+    result.lab_format = lab_format.name
+    return result
+
+def extract_lab_results(text, lab_format=None, profile=None, block_cache=None):
+    """Run the layout's extractors over `text`; returns (merged results dict, LabFormat).
+
+    First half of parse_lab_report_structured, for callers that classify and
+    format several reports together (see lab_batch).
+    """
+    lab_format = get_lab_format(lab_format, text)
+    if profile is not None: profile.parses += 1
+
+    with profile_stage(profile, "prepare_lab_lines") as counter:
+        lines = prepare_lab_lines(text)
+        if counter is not None: counter.lines += len(lines)
+    with profile_stage(profile, "segment_lab_lines"):
+        sections = LabSections(lines)
+
+    def run(ext_func, compute):
+        kind = lab_format.sections.get(ext_func)
+        scope = sections.scope_for(kind)
+        if scope is None: return None
+        with profile_stage(profile, ext_func.__name__):
+            if block_cache is None: return compute(scope)
+            key = f"{ext_func.__module__}.{ext_func.__name__}:{sections.digest(kind)}"
+            return block_cache.get_or_compute(key, lambda: compute(scope))
+
+    all_res = {"datetime": run(lab_format.datetime_extractor, lab_format.datetime_extractor)}
+    for ext_func in lab_format.extractors:
+        extracted = run(ext_func, lambda scope, ext_func=ext_func: parse_lab_numbers(ext_func(scope)))
+        if extracted: all_res.update(extracted)
+    # Cópia: a lista em cache não pode ser compartilhada entre LabResults.
+    all_res["culturas_list"] = list(run(lab_format.culturas_extractor, lab_format.culturas_extractor) or [])
+    return all_res, lab_format
+
+# Ordem das seções no texto formatado.
+OUTPUT_SECTIONS = ["HEADER", "HEMOGRAMA", "COAGULOGRAMA", "FUNCAO_RENAL_ELETRÓLITOS_GLI",
+                   "MARCADORES_INFLAM_CARD", "MEDICAMENTOS", "HEPATOGRAMA_PANCREAS", "GASOMETRIA",
+                   "URINA_I", "SOROLOGIAS", "CULTURAS", "OUTROS"]
+
+def format_lab_result(all_res, table=None, alerts=None):
+    """Build the LabResult (alerts + formatted text) from the merged extractor results.
+
+    Every numeric value is classified up front in one classify_lab_results call,
+    unless its `alerts` dict is passed in (already classified with a whole batch).
+    """
+    out_sections = {s: [] for s in OUTPUT_SECTIONS}
+    values = []
+    if alerts is None: alerts = classify_lab_results([all_res], table)[0]
+
+    def evaluate(section, label, raw_value, key_ref, unit_suffix="", res_key=None):
+        lab_value = evaluate_value(label, raw_value, key_ref, unit_suffix, section, table,
+                                   alerts.get(res_key or key_ref))
+        if lab_value is not None: values.append(lab_value)
+        return lab_value
+
+    def fmt(section, label, raw_value, key_ref, unit_suffix="", res_key=None):
+        lab_value = evaluate(section, label, raw_value, key_ref, unit_suffix, res_key)
+        return lab_value.text if lab_value is not None else ""
+
+    def fmt_display(section, label, raw_value, key_ref):
+        """Value without the label, for compound entries like "TP 14.2 (INR 1.25)"."""
+        lab_value = evaluate(section, label, raw_value, key_ref)
+        return lab_value.display if lab_value is not None else ""
+
+    if all_res.get("datetime"): out_sections["HEADER"].append(all_res["datetime"])
+
+    for k, lbl in [("Hb","Hb"),("Ht","Ht"),("VCM","VCM"),("HCM","HCM"),("CHCM","CHCM"),("RDW","RDW")]:
+        if all_res.get(k): out_sections["HEMOGRAMA"].append(fmt("HEMOGRAMA", lbl, all_res[k], k))
+    
+    l_str = fmt("HEMOGRAMA", "Leuco", all_res.get("Leuco",""), "Leuco", unit_suffix=all_res.get("Leuco_unit", ""))
+    if l_str:
+        diff_str = all_res.get("Leuco_Diff", "")
+        if "Neut" in diff_str or "Linf" in diff_str:
+            l_str += f" {diff_str}"
+        out_sections["HEMOGRAMA"].append(l_str)
+    
+    p_str = fmt("HEMOGRAMA", "Plaq", all_res.get("Plaq", ""), "Plaq", unit_suffix=all_res.get("Plaq_unit", ""))
+    if p_str:
+        out_sections["HEMOGRAMA"].append(p_str)
+
+    tp_raw, inr_raw = all_res.get("TP_s",""), all_res.get("INR","")
+    tp_fmt = fmt_display("COAGULOGRAMA", "TP", tp_raw, "TP_s")
+    inr_fmt = fmt_display("COAGULOGRAMA", "INR", inr_raw, "INR")
+    coag_p = []
+    if tp_fmt:
+        tp_inr_s = f"TP {tp_fmt}"
+        if inr_fmt: tp_inr_s += f" (INR {inr_fmt})"
+        coag_p.append(tp_inr_s)
+    ttpa_s_raw, ttpa_r_raw = all_res.get("TTPA_s",""), all_res.get("TTPA_R","")
+    ttpa_s_fmt = fmt_display("COAGULOGRAMA", "TTPA", ttpa_s_raw, "TTPA_s")
+    ttpa_r_fmt = fmt_display("COAGULOGRAMA", "R", ttpa_r_raw, "TTPA_R")
+    if ttpa_s_fmt:
+        ttpa_s = f"TTPA {ttpa_s_fmt}"
+        if ttpa_r_fmt: ttpa_s += f" (R {ttpa_r_fmt})"
+        coag_p.append(ttpa_s)
+    if coag_p: out_sections["COAGULOGRAMA"].append(" ; ".join(coag_p))
+
+    renal = "FUNCAO_RENAL_ELETRÓLITOS_GLI"
+    if all_res.get("U"): out_sections[renal].append(fmt(renal, "U", all_res["U"], "U"))
+    cr_raw, egfr_raw = all_res.get("Cr",""), all_res.get("eGFR","")
+    cr_fmt = fmt_display(renal, "Cr", cr_raw, "Cr")
+    egfr_fmt = fmt_display(renal, "eGFR", egfr_raw, "eGFR")
+    cr_egfr_s = f"Cr {cr_fmt}" if cr_fmt else ""
+    if egfr_fmt:
+        cr_egfr_s = (cr_egfr_s + f" ({egfr_fmt})") if cr_egfr_s else egfr_fmt
+
+    if cr_egfr_s: out_sections[renal].append(cr_egfr_s)
+
+    for k, lbl in [("Na","Na"),("K","K"),("Cl","Cl"),("Mg","Mg"),("CaI","CaI"), ("CaT","CaT"), ("P","P"),("Gli","Gli")]:
+        if all_res.get(k): out_sections[renal].append(fmt(renal, lbl, all_res[k], k))
+    na, cl = LabNumber.parse(all_res.get("Na")), LabNumber.parse(all_res.get("Cl"))
+    hco3 = LabNumber.parse(next((all_res.get(k) for k in [f"{p}HCO3_gas" for p in ["GA_","GV_",""]] if all_res.get(k)), None))
+    if na and cl and hco3 and na.value and cl.value and hco3.value:
+        agap = na.value - (cl.value + hco3.value)
+        values.append(LabValue("AGap", "AGap", f"{agap:.1f}", agap, "mEq/L", section=renal, text=f"AGap {agap:.1f}",
+                               display=f"{agap:.1f}"))
+        out_sections[renal].append(f"AGap {agap:.1f}")
+
+    for k, lbl in [("PCR","PCR"),("Lac","Lactato"),("Trop","TnT-hs"),("DD","D-Dímero"), ("NT-proBNP", "NT-proBNP")]:
+         if all_res.get(k): out_sections["MARCADORES_INFLAM_CARD"].append(fmt("MARCADORES_INFLAM_CARD", lbl, all_res[k], k))
+    
+    if all_res.get("Vanco"): out_sections["MEDICAMENTOS"].append(fmt("MEDICAMENTOS", "Vanco", all_res["Vanco"], "Vanco"))
+
+    hepato = "HEPATOGRAMA_PANCREAS"
+    for k, lbl in [("TGO","TGO"),("TGP","TGP"),("GGT","GGT"),("FA","FA")]:
+        if all_res.get(k): out_sections[hepato].append(fmt(hepato, lbl, all_res[k], k))
+    bili_p = [fmt(hepato, lbl, all_res[k], k) for k,lbl in [("BT","BT"),("BD","BD"),("BI","BI")] if all_res.get(k)]
+    if bili_p: out_sections[hepato].append(" ".join(bili_p))
+    for k, lbl in [("ALB","ALB"),("AML","AML"),("LIP","LIP")]:
+        if all_res.get(k): out_sections[hepato].append(fmt(hepato, lbl, all_res[k], k))
+
+    gas_pfx = ""
+    if any(k.startswith("GA_") for k in all_res.keys()): gas_pfx = "GA_"
+    elif any(k.startswith("GV_") for k in all_res.keys()): gas_pfx = "GV_"
+    
+    gas_params_output = []
+    if gas_pfx or any("_gas" in k and all_res[k] for k in all_res.keys()):
+        gas_order_map = {"pH": "pH_gas", "pCO2": "pCO2_gas", "pO2": "pO2_gas", "HCO3": "HCO3_gas", "BE": "BE_gas", "SatO2": "SatO2_gas", "Lac": "Lac_gas", "cCO2": "cCO2_gas"}
+        for display_label, dict_key_suffix in gas_order_map.items():
+            full_key_to_check = (gas_pfx + dict_key_suffix) if gas_pfx else dict_key_suffix
+            if full_key_to_check in all_res and all_res[full_key_to_check]:
+                gas_params_output.append(fmt("GASOMETRIA", display_label, all_res[full_key_to_check], dict_key_suffix,
+                                             res_key=full_key_to_check))
+
+    if gas_params_output:
+        gas_header = "Gasometria Arterial: " if gas_pfx == "GA_" else "Gasometria Venosa: " if gas_pfx == "GV_" else "Gasometria: "
+        out_sections["GASOMETRIA"].append(gas_header + "; ".join(gas_params_output))
+
+    u1_parts = []
+    for k, lbl in [("U1_pH", "U1_pH"),("U1_dens", "U1_dens"), ("U1_prot", "U1_prot"), ("U1_glic", "U1_glic"),
+                   ("U1_nit", "U1_nit"), ("U1_CC", "U1_CC"), ("U1_hem", "U1_hem"), ("U1_leuco", "U1_leuco")]:
+        if all_res.get(k):
+             u1_parts.append(f"{lbl} {all_res[k]}")
+             values.append(LabValue(k, lbl, all_res[k], section="URINA_I", text=f"{lbl} {all_res[k]}"))
+    if u1_parts:
+        out_sections["URINA_I"].append(" ; ".join(u1_parts))
+
+    soro_map = {"HIV":"Anti HIV 1/2","HAV_IgM":"Anti-HAV IgM","HBsAg":"HBsAg","AntiHBs":"Anti-HBs",
+                "AntiHBc_Total":"Anti-HBc Total","HCV":"Anti-HCV","VDRL":"VDRL"}
+    for k, lbl in soro_map.items():
+        if all_res.get(k):
+            out_sections["SOROLOGIAS"].append(f"{lbl} {all_res[k]}")
+            values.append(LabValue(k, lbl, all_res[k], section="SOROLOGIAS", text=f"{lbl} {all_res[k]}"))
+
+    if all_res.get("culturas_list"):
+        for cult_info in all_res["culturas_list"]:
+            c_str = f"{cult_info.get('Tipo','')} {cult_info.get('Resultado','')}"
+            abg = cult_info.get("Antibiograma",{})
+            abg_p = [f"{s[0]}: {', '.join(abg[s[0]])}" for s in ["S","I","R"] if abg.get(s[0])]
+            if abg_p: c_str += " / "+" | ".join(abg_p)
+            out_sections["CULTURAS"].append(c_str.strip())
+
+    final_out = [" ; ".join(out_sections[s_k]) for s_k in OUTPUT_SECTIONS if out_sections[s_k]]
+    final_text = " ; ".join(filter(None, final_out)) + (";" if any(final_out) else "")
+    return LabResult(all_res.get("datetime", ""), values, all_res.get("culturas_list", []), final_text,
+                     leuco_diff=OrderedDict(all_res.get("Leuco_Diff_Tabela") or ()))
+
+
+# --- Modo Streaming (impressões com várias coletas) ---
+
+def collection_stamp(line):
+    """Return (date, time, lab format name) if `line` is a collection header, else None."""
+    lowered = line.lower()
+    if "coleta" not in lowered:
+        return None
+    for lab_format in LAB_FORMATS.values():
+        if not lab_format.collection_header: continue
+        m = PATTERNS.get("raw", lab_format.collection_header, flags=re.IGNORECASE).search(line)
+        if m: return m.group(1), m.group(2), lab_format.name
+    return None
+
+def iter_lab_collections(source):
+    """Split a multi-collection paste into one text per collection, reading line by line.
+
+    `source` is a string or any iterable of lines (e.g. an open file). A new
+    collection starts when a collection header carries a different date/time
+    than the current one; the cut is placed right after the last "Assinado
+    eletronicamente" seen, so exam titles printed above the header travel with
+    it. Only the current collection is held in memory; a string is split in
+    one indexed pass instead (see _split_collections).
+    """
+    if isinstance(source, str):
+        yield from _split_collections(source)
+        return
+    current, current_stamp, signed_upto = [], None, 0
+    for raw_line in source:
+        line = raw_line.rstrip("\r\n")
+        stamp = collection_stamp(line)
+        if stamp and current_stamp and stamp[:2] != current_stamp[:2]:
+            cut = signed_upto or len(current)
+            yield "\n".join(current[:cut])
+            current, signed_upto = current[cut:], 0
+        if stamp: current_stamp = stamp
+        current.append(line)
+        if ASSINATURA_LAUDO in line.lower(): signed_upto = len(current)
+    if current:
+        yield "\n".join(current)
+
+def _split_collections(text):
+    """iter_lab_collections for a whole string: the cuts come from collection_timestamps and the label index."""
+    lines = text.split("\n")
+    if lines[-1] == "": lines.pop()
+    if "\r" in text: lines = [line.rstrip("\r") for line in lines]
+    lines = LabLines(lines)
+
+    signatures = find_label_lines(lines, ASSINATURA_LAUDO)
+    start, current_stamp = 0, None
+    for i, stamp, _ in collection_timestamps(lines):
+        if current_stamp and stamp != current_stamp:
+            k = bisect_left(signatures, i) - 1
+            cut = signatures[k] + 1 if k >= 0 and signatures[k] >= start else i
+            yield "\n".join(lines[start:cut])
+            start = cut
+        current_stamp = stamp
+    if start < len(lines):
+        yield "\n".join(lines[start:])
+
+def parse_lab_report_stream(source, structured=False, profile=None, range_set=None, block_cache=None):
+    """Yield one parse_lab_report result per collection found in `source`.
+
+    With ``structured=True`` each item is the LabResult instead of its text; a
+    ParseProfile passed as `profile` accumulates the stages of every collection.
+    A non-default layout is sticky: once a collection is recognized as e.g.
+    Tecnolab (by fingerprint or collection header), later collections are
+    parsed with it as well. `block_cache` is passed to parse_lab_report_structured.
+    """
+    lab_format = None
+    for collection_text in iter_lab_collections(source):
+        detected = detect_lab_format(collection_text, match_headers=True)
+        if lab_format is None or detected.name != DEFAULT_LAB_FORMAT: lab_format = detected
+        result = parse_lab_report_structured(collection_text, lab_format=lab_format, profile=profile,
+                                             range_set=range_set, block_cache=block_cache)
+        if result.text:
+            yield result if structured else result.text
+
+
+# --- Modo Tendência (séries por analito) ---
+def collection_sort_key(stamp):
+    """(month, day, hour, minute) of a "dd/mm HHhMM" collection stamp, or None without a date."""
+    m = PATTERNS.get("raw", r"(\d{1,2})/(\d{1,2})(?:\s+(\d{1,2})h(\d{2}))?").match(stamp or "")
+    if not m: return None
+    day, month, hour, minute = (int(g) if g else 0 for g in m.groups())
+    return (month, day, hour, minute)
+
+def collection_sort_keys(stamps):
+    """collection_sort_key of each stamp, prefixed by a year offset inferred from the input order.
+
+    The stamps carry no year, so a stay crossing New Year would sort "02/01"
+    before "30/12". Each dated stamp is placed in the year that keeps it within
+    six months of the previous dated stamp, whichever order the collections
+    were given in (oldest or newest first). Undated stamps get None.
+    """
+    keys, year, last_month = [], 0, None
+    for stamp in stamps:
+        key = collection_sort_key(stamp)
+        if key is not None:
+            if last_month is not None and key[0] - last_month > 6: year -= 1
+            elif last_month is not None and last_month - key[0] > 6: year += 1
+            last_month = key[0]
+            key = (year,) + key
+        keys.append(key)
+    return keys
+
+
+class LabTrendStore:
+    """Analytes of several collections aligned by collection time, stored column-wise per analyte.
+
+    `stamps` lists the collections in chronological order (undated ones keep
+    their input order at the end; collections with the same stamp are merged;
+    the year is inferred across New Year, see collection_sort_keys).
+    For each analyte key, `values[key]` is an array('d') with one slot per
+    collection (NaN where it was not measured or is not numeric), `alerts[key]`
+    an array('b') of alert levels and `display[key]` the display strings
+    ("9.8 *", None where missing). `labels` keeps the analytes in output
+    section order (OUTPUT_SECTIONS), first-seen order within a section.
+    """
+
+    def __init__(self, results):
+        merged = OrderedDict()
+        for n, result in enumerate(results):
+            _, lab_values = merged.setdefault(result.datetime or n, (result.datetime, OrderedDict()))
+            lab_values.update((v.key, v) for v in result.values)
+        sort_keys = collection_sort_keys(stamp for stamp, _ in merged.values())
+        order = [c for _, c in sorted(zip(sort_keys, merged.values()), key=lambda item: (item[0] is None, item[0] or ()))]
+        size = len(order)
+        self.stamps = [stamp for stamp, _ in order]
+        section_rank = {section: i for i, section in enumerate(OUTPUT_SECTIONS)}
+        first_seen = OrderedDict()
+        for _, lab_values in order:
+            for key, lab_value in lab_values.items():
+                first_seen.setdefault(key, section_rank.get(lab_value.section, len(section_rank)))
+        self.labels = OrderedDict((key, None) for key in sorted(first_seen, key=first_seen.get))
+        self.values, self.alerts, self.display = {}, {}, {}
+        for col, (_, lab_values) in enumerate(order):
+            for key, lab_value in lab_values.items():
+                if key not in self.values:
+                    self.labels[key] = lab_value.label
+                    self.values[key] = array("d", [float("nan")]) * size
+                    self.alerts[key] = array("b", [ALERTA_NORMAL]) * size
+                    self.display[key] = [None] * size
+                if lab_value.value is not None: self.values[key][col] = lab_value.value
+                self.alerts[key][col] = lab_value.alert
+                self.display[key][col] = lab_value.display
+
+    def __len__(self):
+        return len(self.stamps)
+
+    def keys(self):
+        return list(self.labels)
+
+    def series(self, key):
+        """[(stamp, display, alert)] of the collections where `key` was measured."""
+        display, alerts = self.display.get(key, ()), self.alerts.get(key)
+        return [(self.stamps[i], d, alerts[i]) for i, d in enumerate(display) if d is not None]
+
+    def trend_line(self, key, sep=" → "):
+        """ClipDoc compact trend, e.g. "Hb 10.2 → 9.1 * → 8.7 *"; "" if never measured."""
+        points = [d for _, d, _ in self.series(key)]
+        return f"{self.labels[key]} {sep.join(points)}" if points else ""
+
+    def render(self, keys=None, sep=" → "):
+        """Header with the collection stamps, then one trend line per analyte."""
+        lines = [sep.join(stamp or "?" for stamp in self.stamps)] if self.stamps else []
+        lines.extend(line for line in (self.trend_line(k, sep) for k in (keys or self.labels)) if line)
+        return "\n".join(lines)
+
+    def to_html(self, sep=" → "):
+        """render() as HTML with the same alert classes as colorize_output_html."""
+        import html as html_module
+        css = {ALERTA_ALTERADO: "cd-val-alert", ALERTA_CRITICO: "cd-val-crit"}
+        lines = [sep.join(f'<span class="cd-datetime">{html_module.escape(stamp or "?")}</span>'
+                          for stamp in self.stamps)] if self.stamps else []
+        for key, label in self.labels.items():
+            points = [f'<span class="{css[alert]}">{html_module.escape(d)}</span>' if alert in css
+                      else html_module.escape(d) for _, d, alert in self.series(key)]
+            if points: lines.append(f"{html_module.escape(label)} {sep.join(points)}")
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {"coletas": self.stamps,
+                "series": {key: {"label": label,
+                                 "values": [None if v != v else v for v in self.values[key]],
+                                 "display": self.display[key], "alerts": list(self.alerts[key])}
+                           for key, label in self.labels.items()}}
+
+
+# --- Cache de Análises ---
+class ParseCache:
+    """Bounded LRU cache with TTL for lab analyses, keyed by a hash of the normalized input.
+
+    agent.py keeps its instances in `st.cache_resource`, so every session served
+    by the same process shares them and they survive Streamlit reruns.
+    """
+
+    def __init__(self, maxsize=256, ttl_s=6 * 3600):
+        self.maxsize, self.ttl_s = maxsize, ttl_s
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def key_for(text, *variant):
+        # Linhas são aparadas e linhas em branco descartadas: o parser faz o mesmo.
+        normalized = "\n".join(line.strip() for line in text.splitlines() if line.strip())
+        digest = hashlib.sha256(normalized.encode("utf-8"))
+        for part in variant: digest.update(f"\x00{part}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_or_compute(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl_s:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"entries": len(self._entries), "maxsize": self.maxsize, "ttl_s": self.ttl_s,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
@@ -0,0 +1,312 @@
+"""Substituto local do SDK do Gemini para testes de carga sem rede.
+
+Implementa a superfície do google.generativeai usada pelo agent.py: configure(),
+GenerativeModel.generate_content (inclusive stream=True), generate_content_async e
+count_tokens (estimado em CHARS_PER_TOKEN caracteres por token), system_instruction,
+caching.CachedContent / GenerativeModel.from_cached_content (recusado abaixo de
+cache_min_tokens, como o tamanho mínimo da API por modelo) e `exceptions`
+com as mesmas classes do google.api_core. Cada chamada dorme uma latência sorteada
+de uma distribuição, pode falhar com ResourceExhausted ou ServiceUnavailable numa
+taxa configurada e devolve uma resposta pronta escolhida pelo tipo de tarefa do prompt.
+
+No app, é ativado com CLIPDOC_GEMINI_BACKEND=fake; os parâmetros vêm de
+CLIPDOC_FAKE_GEMINI, pares chave=valor separados por ";", com prefixo opcional
+"pro." ou "flash." para valer só para um modelo. Exemplo:
+
+    CLIPDOC_FAKE_GEMINI="latency=lognormal:20,0.4;flash.latency=lognormal:6,0.3;pro.quota_error_rate=0.2"
+
+Chaves: latency (fixed:S, uniform:A,B, normal:M,DP, lognormal:MEDIANA,SIGMA,
+exp:MEDIA), first_chunk_fraction, chunk_chars, quota_error_rate,
+transient_error_rate, cache_min_tokens, responses (JSON {trecho do prompt: resposta}),
+seed.
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import threading
+import time
+import types
+
+try:
+    from google.api_core import exceptions
+except ImportError:
+    # Sem o SDK instalado: mesmas classes e nomes, para o roteador tratar igual.
+    class GoogleAPICallError(Exception):
+        code = None
+
+    class ResourceExhausted(GoogleAPICallError):
+        code = 429
+
+    class InvalidArgument(GoogleAPICallError):
+        code = 400
+
+    class InternalServerError(GoogleAPICallError):
+        code = 500
+
+    class ServiceUnavailable(GoogleAPICallError):
+        code = 503
+
+    class DeadlineExceeded(GoogleAPICallError):
+        code = 504
+
+    exceptions = types.SimpleNamespace(GoogleAPICallError=GoogleAPICallError, ResourceExhausted=ResourceExhausted,
+                                       InvalidArgument=InvalidArgument, InternalServerError=InternalServerError,
+                                       ServiceUnavailable=ServiceUnavailable, DeadlineExceeded=DeadlineExceeded)
+
+DEFAULTS = {"latency": "lognormal:2.0,0.4", "first_chunk_fraction": "0.15", "chunk_chars": "120",
+            "quota_error_rate": "0", "transient_error_rate": "0", "cache_min_tokens": "4096", "responses": "",
+            "seed": ""}
+# Valores padrão por modelo (mesmo formato de escopo de CLIPDOC_FAKE_GEMINI): mínimo de cache da API.
+MODEL_DEFAULTS = {"flash": {"cache_min_tokens": "1024"}}
+CHARS_PER_TOKEN = 4
+
+# Respostas prontas: o primeiro trecho encontrado no prompt decide a tarefa.
+CANNED_RESPONSES = [
+    ("formato SBAR", """**S — Situação**
+Paciente de 72 anos, D+5 de internação por pneumonia comunitária, estável.
+
+**B — Background**
+- Hipertensão arterial e diabetes tipo 2.
+- Ceftriaxona D+5, afebril há 48 horas.
+
+**A — Avaliação**
+- Estável hemodinamicamente, em ar ambiente.
+1. Pneumonia comunitária em resolução.
+
+**R — Recomendação**
+- Chamar se FC>120, PAS<90, SpO2<92% em ar ambiente.
+- Código de reanimação: pleno."""),
+    ("nota de EVOLUÇÃO MÉDICA", """#ID: Paciente de 72 anos
+#HD:
+1. Pneumonia comunitária [IA: critérios de gravidade revisados]
+#AP:
+Hipertensão arterial, diabetes tipo 2
+#ATB:
+Ceftriaxona D5
+#EXAMES:
+Hb 11,2 ; Leuco 9800 ; PCR 4,1
+#EVOLUÇÃO:
+Paciente evolui afebril, sem dispneia.
+#EXAME FÍSICO:
+BEG, eupneico, MV presente com estertores em base direita.
+#PLANO TERAPÊUTICO:
+Completar 7 dias de antibiótico.
+#CONDUTA:
+- Manter ceftriaxona
+- Programar alta em 48h
+#DATA PROVÁVEL DA ALTA: 2 dias"""),
+    ("ADMISSÃO", """# UNIDADE DE INTERNAÇÃO - ADMISSÃO #
+#ID: Paciente de 68 anos
+#HD:
+1. Insuficiência cardíaca descompensada [IA: perfil B]
+#HDA:
+Dispneia progressiva há 5 dias.
+#PLANO TERAPÊUTICO:
+Diurético endovenoso, restrição hídrica.
+#CONDUTA:
+- Furosemida 40 mg EV 12/12h
+#DATA PROVÁVEL DA ALTA: SEM PREVISÃO"""),
+    ("Resumo de Alta", """Paciente internado por pneumonia comunitária, diagnosticada por quadro clínico e radiografia de tórax.
+
+Tratado com ceftriaxona por 7 dias, com boa resposta clínica e queda de PCR.
+
+Recebe alta estável, em ar ambiente, com seguimento ambulatorial."""),
+    ("Sinais de Alerta", """- Falta de ar que piora ou não melhora com repouso.
+
+- Febre acima de 38 °C por mais de 48 horas.
+
+- Dor no peito, confusão ou desmaio."""),
+    ("Evolução do paciente:", """Resumo da evolução anterior: pneumonia comunitária em tratamento, D+4 de ceftriaxona.
+Pontos para hoje:
+1. Reavaliar critérios para transição para via oral.
+2. Checar culturas pendentes."""),
+]
+GENERIC_RESPONSE = "Resposta simulada pelo backend local do Gemini."
+
+
+def latency_sampler(spec, rng):
+    """Zero-argument function drawing a latency in seconds from `spec` (e.g. "lognormal:2,0.4")."""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v.strip()]
+    if kind == "fixed": return lambda: values[0]
+    if kind == "uniform": return lambda: rng.uniform(values[0], values[1])
+    if kind == "normal": return lambda: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal": return lambda: rng.lognormvariate(math.log(values[0]), values[1])
+    if kind == "exp": return lambda: rng.expovariate(1.0 / values[0])
+    raise ValueError(f"Distribuição de latência desconhecida: {spec!r}")
+
+
+def parse_config(spec):
+    """{"": {...}, "pro": {...}, "flash": {...}} from a "key=value;pro.key=value" string."""
+    config = {"": {}}
+    for item in filter(None, (part.strip() for part in (spec or "").split(";"))):
+        key, _, value = item.partition("=")
+        scope, _, name = key.strip().rpartition(".")
+        if name not in DEFAULTS: raise ValueError(f"Parâmetro desconhecido em CLIPDOC_FAKE_GEMINI: {key!r}")
+        config.setdefault(scope, {})[name] = value.strip()
+    return config
+
+
+def model_settings(model_name, config=None):
+    """Settings for `model_name`: defaults, per-model defaults, global keys, then keys scoped to a part of its name."""
+    config = parse_config(os.environ.get("CLIPDOC_FAKE_GEMINI", "")) if config is None else config
+    settings = dict(DEFAULTS)
+    for scope, values in MODEL_DEFAULTS.items():
+        if scope in model_name: settings.update(values)
+    settings.update(config[""])
+    for scope, values in config.items():
+        if scope and scope in model_name: settings.update(values)
+    return settings
+
+
+def count_tokens_estimate(text):
+    return max(1, round(len(text or "") / CHARS_PER_TOKEN))
+
+
+class FakeStats:
+    """Process-wide counters, so a load test can subtract the simulated model time from its measurements."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.per_model = {}
+
+    def record(self, model, latency_s=0.0, error=None, stream=False):
+        with self._lock:
+            row = self.per_model.setdefault(model, {"calls": 0, "streams": 0, "quota_errors": 0,
+                                                    "transient_errors": 0, "simulated_s": 0.0})
+            row["calls"] += 1
+            row["streams"] += stream
+            row["simulated_s"] += latency_s
+            if error: row[error] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {model: dict(row) for model, row in self.per_model.items()}
+
+
+STATS = FakeStats()
+
+
+class FakeResponse:
+    """Response or stream chunk with the `.text` / `.parts` / `.candidates[0].finish_reason` the agent reads.
+
+    Only the last chunk of a stream (and every whole response) carries the "STOP" finish reason.
+    """
+
+    def __init__(self, text, finish_reason="STOP"):
+        self.text = text
+        self.parts = [text] if text else []
+        self.candidates = [types.SimpleNamespace(
+            finish_reason=types.SimpleNamespace(name=finish_reason) if finish_reason else None)]
+
+
+class FakeStream:
+    """Iterable of chunks; the first chunk was already "received" when generate_content returned."""
+
+    def __init__(self, chunks, delay_s):
+        self._chunks, self._delay_s = chunks, delay_s
+
+    def __iter__(self):
+        for i, chunk in enumerate(self._chunks):
+            if i: time.sleep(self._delay_s)
+            yield FakeResponse(chunk, "STOP" if i == len(self._chunks) - 1 else None)
+
+
+def configure(api_key=None, **kwargs):
+    """Accepted for compatibility with google.generativeai; nothing to configure."""
+
+
+class CachedContent:
+    """Stand-in for caching.CachedContent: holds the system instruction of a cached context."""
+
+    def __init__(self, model, system_instruction, ttl=None, display_name=None):
+        self.model, self.system_instruction, self.ttl, self.display_name = model, system_instruction, ttl, display_name
+
+    @classmethod
+    def create(cls, model, system_instruction=None, ttl=None, display_name=None, **kwargs):
+        minimo, tokens = int(model_settings(model)["cache_min_tokens"]), count_tokens_estimate(system_instruction)
+        if tokens < minimo:
+            raise exceptions.InvalidArgument(f"Cached content is too small. total_token_count={tokens}, "
+                                             f"min_total_token_count={minimo} (simulado).")
+        return cls(model, system_instruction, ttl, display_name)
+
+
+caching = types.SimpleNamespace(CachedContent=CachedContent)
+
+
+class GenerativeModel:
+    """Stand-in for google.generativeai.GenerativeModel with the same call signatures."""
+
+    def __init__(self, model_name, config=None, system_instruction=None, **kwargs):
+        self.model_name, self.system_instruction = model_name, system_instruction
+        settings = model_settings(model_name, config)
+        self._rng = random.Random(settings["seed"] or None)
+        self._rng_lock = threading.Lock()
+        self._sample_latency = latency_sampler(settings["latency"], self._rng)
+        self.first_chunk_fraction = float(settings["first_chunk_fraction"])
+        self.chunk_chars = int(settings["chunk_chars"])
+        self.quota_error_rate = float(settings["quota_error_rate"])
+        self.transient_error_rate = float(settings["transient_error_rate"])
+        self.responses = list(CANNED_RESPONSES)
+        if settings["responses"]:
+            with open(settings["responses"], encoding="utf-8") as f:
+                self.responses = list(json.load(f).items()) + self.responses
+
+    @classmethod
+    def from_cached_content(cls, cached_content, **kwargs):
+        return cls(cached_content.model, system_instruction=cached_content.system_instruction, **kwargs)
+
+    def count_tokens(self, contents, **kwargs):
+        text = contents if isinstance(contents, str) else "".join(c for c in contents if isinstance(c, str))
+        return types.SimpleNamespace(total_tokens=count_tokens_estimate(text))
+
+    def _draw(self):
+        """(latency_s, error or None) for one call."""
+        with self._rng_lock:
+            latency, roll = self._sample_latency(), self._rng.random()
+        if roll < self.quota_error_rate:
+            return latency * 0.05, exceptions.ResourceExhausted(
+                f"Quota exceeded for {self.model_name} (simulado). Please retry in 30s.")
+        if roll < self.quota_error_rate + self.transient_error_rate:
+            return latency * 0.5, exceptions.ServiceUnavailable("The model is overloaded (simulado).")
+        return latency, None
+
+    def _answer(self, contents):
+        prompt = contents if isinstance(contents, str) else next((c for c in contents if isinstance(c, str)), "")
+        prompt = (self.system_instruction or "") + prompt
+        return next((text for marker, text in self.responses if marker in prompt), GENERIC_RESPONSE)
+
+    def _chunks(self, text):
+        return [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+
+    def _fail(self, latency, error, stream=False):
+        STATS.record(self.model_name, latency, "quota_errors" if isinstance(error, exceptions.ResourceExhausted)
+                     else "transient_errors", stream)
+        raise error
+
+    def generate_content(self, contents, safety_settings=None, stream=False, **kwargs):
+        latency, error = self._draw()
+        if not stream:
+            time.sleep(latency)
+            if error: self._fail(latency, error)
+            STATS.record(self.model_name, latency)
+            return FakeResponse(self._answer(contents))
+        first = latency * self.first_chunk_fraction
+        time.sleep(latency if error else first)
+        if error: self._fail(latency, error, stream=True)
+        chunks = self._chunks(self._answer(contents))
+        STATS.record(self.model_name, latency, stream=True)
+        return FakeStream(chunks, (latency - first) / max(1, len(chunks) - 1))
+
+    async def generate_content_async(self, contents, safety_settings=None, **kwargs):
+        latency, error = self._draw()
+        await asyncio.sleep(latency)
+        if error: self._fail(latency, error)
+        STATS.record(self.model_name, latency)
+        return FakeResponse(self._answer(contents))
@@ -0,0 +1,159 @@
+"""Processamento em lote de laudos laboratoriais com o pipeline de parse_lab_report.
+
+Distribui os laudos por um pool de processos e devolve os resultados na ordem de
+entrada. Erros de um laudo são registrados no próprio resultado e não interrompem
+o lote.
+
+Uso:
+    python lab_batch.py laudos/ --workers 8 --output resultados.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from clipdoc_core import (REFERENCE_RANGE_SETS, anonimizar_texto, classify_lab_results, extract_lab_results,
+                          format_lab_result, get_reference_table)
+
+
+def _error(e):
+    return f"{type(e).__name__}: {e}"
+
+
+def _parse_chunk(texts, range_set=None):
+    """Same pipeline as the "Analisar Exame" button (anonymize, then parse) for a chunk of reports.
+
+    The values of every report in the chunk are classified in a single
+    classify_lab_results call between extraction and formatting.
+    """
+    table = get_reference_table(range_set)
+    extracted = []
+    for text in texts:
+        try:
+            extracted.append((extract_lab_results(anonimizar_texto(text))[0], None))
+        except Exception as e:
+            extracted.append((None, _error(e)))
+    alerts = iter(classify_lab_results([all_res for all_res, error in extracted if error is None], table))
+    results = []
+    for all_res, error in extracted:
+        if error is None:
+            try:
+                result = format_lab_result(all_res, table, next(alerts))
+                results.append(((result.text, result.to_dict()["leucograma_diferencial"]), None))
+            except Exception as e:
+                results.append((None, _error(e)))
+        else:
+            results.append((None, error))
+    return results
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk: return
+        yield chunk
+
+
+def iter_parse_lab_reports(texts, workers=None, chunksize=8, progress=None, range_set=None):
+    """Parse `texts` over a process pool, yielding one result dict per report in input order.
+
+    Each result is {"index", "output", "leucograma_diferencial", "error"}; `error` is None on success
+    and the differential is the leukocyte table of LabResult.leuco_diff (% and absolute counts).
+    At most ``2 * workers`` chunks are in flight, so memory stays bounded for
+    arbitrarily long inputs. `progress(done, errors, elapsed_s)` is called after
+    every chunk. `range_set` selects the reference ranges (see REFERENCE_RANGE_SETS).
+    """
+    workers = workers or os.cpu_count() or 1
+    start, done, errors = time.perf_counter(), 0, 0
+
+    def _emit(chunk_results):
+        nonlocal done, errors
+        for output, error in chunk_results:
+            if error: errors += 1
+            text, leuco_diff = output or (None, None)
+            yield {"index": done, "output": text, "leucograma_diferencial": leuco_diff, "error": error}
+            done += 1
+        if progress: progress(done, errors, time.perf_counter() - start)
+
+    if workers == 1:
+        for chunk in _chunks(texts, chunksize):
+            yield from _emit(_parse_chunk(chunk, range_set))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for chunk in _chunks(texts, chunksize):
+            in_flight.append(pool.submit(_parse_chunk, chunk, range_set))
+            if len(in_flight) >= 2 * workers:
+                yield from _emit(in_flight.popleft().result())
+        while in_flight:
+            yield from _emit(in_flight.popleft().result())
+
+
+def parse_lab_reports(texts, workers=None, chunksize=8, progress=None, range_set=None):
+    """List version of iter_parse_lab_reports."""
+    return list(iter_parse_lab_reports(texts, workers=workers, chunksize=chunksize, progress=progress,
+                                       range_set=range_set))
+
+
+def _collect_paths(paths, pattern):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                found.extend(os.path.join(root, f) for f in sorted(files) if f.endswith(pattern))
+        else:
+            found.append(path)
+    return found
+
+
+def _read_text(path, encoding):
+    with open(path, encoding=encoding, errors="replace") as f:
+        return f.read()
+
+
+def _print_progress(done, errors, elapsed):
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"\r{done} laudos | {rate:.1f} laudos/s | {errors} erro(s)", end="", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Processa laudos laboratoriais em lote com parse_lab_report.")
+    parser.add_argument("paths", nargs="+", help="Arquivos de laudo ou diretórios contendo laudos.")
+    parser.add_argument("--workers", type=int, default=None, help="Processos no pool (padrão: número de CPUs).")
+    parser.add_argument("--chunksize", type=int, default=8, help="Laudos enviados por tarefa ao pool.")
+    parser.add_argument("--suffix", default=".txt", help="Extensão dos arquivos lidos em diretórios.")
+    parser.add_argument("--encoding", default="utf-8")
+    parser.add_argument("--output", default="-", help="Arquivo JSONL de saída (padrão: stdout).")
+    parser.add_argument("--range-set", default=None, choices=list(REFERENCE_RANGE_SETS),
+                        help="Conjunto de valores de referência (padrão: VALORES_REFERENCIA).")
+    args = parser.parse_args(argv)
+
+    paths = _collect_paths(args.paths, args.suffix)
+    texts = (_read_text(p, args.encoding) for p in paths)
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    start, errors = time.perf_counter(), 0
+    try:
+        for result in iter_parse_lab_reports(texts, workers=args.workers, chunksize=args.chunksize,
+                                             progress=_print_progress, range_set=args.range_set):
+            result["source"] = paths[result["index"]]
+            if result["error"]:
+                errors += 1
+                print(f"\nERRO {result['source']}: {result['error']}", file=sys.stderr)
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout: out.close()
+
+    elapsed = time.perf_counter() - start
+    rate = len(paths) / elapsed if elapsed > 0 else 0.0
+    print(f"\nConcluído: {len(paths)} laudos em {elapsed:.2f}s ({rate:.1f} laudos/s), {errors} erro(s).", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
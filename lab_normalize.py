@@ -0,0 +1,66 @@
+"""Normalização de grafias de analitos em uma única passada sobre o texto.
+
+Todas as regras de uma tabela viram uma única alternância regex com grupos
+nomeados; a substituição é escolhida por `match.lastgroup` em um dicionário, de
+modo que o texto é percorrido uma vez só, qualquer que seja o número de regras.
+A tabela LAB_TERM_RULES é compartilhada pelas interfaces (clipdoc_core/agent.py,
+app Gemini.py; app.py e HSM - Lab.py usam as mesmas regras com abreviações, via remap).
+"""
+import re
+
+
+def _leading_chars(patterns):
+    """Character-class body with every possible first character, or "" if some pattern is not simple."""
+    chars = []
+    for pattern in patterns:
+        if pattern[:1] == "[" and "]" in pattern[1:]:
+            chars.append(pattern[1:pattern.index("]", 1)])
+        elif pattern[:1].isalnum():
+            chars.append(pattern[0])
+        else:
+            return ""
+    return "".join(chars)
+
+
+class Normalizer:
+    """Apply a table of (regex, replacement) rules in one pass over the text.
+
+    Rules are tried left to right at each position, so a more specific rule must
+    come before a rule that matches a prefix of it. Replacements are plain
+    strings (no backreferences); an output is never re-scanned by other rules.
+    """
+
+    def __init__(self, rules, flags=re.IGNORECASE):
+        self.rules = list(rules)
+        self._replacements = {f"r{i}": replacement for i, (_, replacement) in enumerate(self.rules)}
+        alternation = "|".join(f"(?P<r{i}>{pattern})" for i, (pattern, _) in enumerate(self.rules))
+        leading = _leading_chars(pattern for pattern, _ in self.rules)
+        # A alternância sozinha é testada em cada posição do texto; o lookahead com os
+        # primeiros caracteres possíveis deixa o motor descartar as demais posições de uma vez.
+        if leading: alternation = f"(?=[{leading}])(?:{alternation})"
+        self._regex = re.compile(alternation, flags)
+
+    def _dispatch(self, match):
+        return self._replacements[match.lastgroup]
+
+    def __call__(self, text):
+        if not self.rules: return text
+        return self._regex.sub(self._dispatch, text)
+
+
+# Grafias canônicas usadas pelos extratores de exames.
+LAB_TERM_RULES = [
+    (r"Creatinina(?!\s*Kinase|\s*quinase)", "Creatinina "),
+    (r"ur[eé]ia", "Ureia"),
+    (r"pot[aá]ssio", "Potássio"),
+    (r"s[oó]dio", "Sódio"),
+    (r"c[aá]lcio i[oô]nico", "Cálcio Iônico"),
+    (r"magn[eé]sio", "Magnésio"),
+]
+
+normalize_lab_terms = Normalizer(LAB_TERM_RULES)
+
+
+def remap(rules, replacements):
+    """The rules whose replacement is a key of `replacements`, rewritten to its value (e.g. "Ureia" -> "U")."""
+    return [(pattern, replacements[replacement]) for pattern, replacement in rules if replacement in replacements]
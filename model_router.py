@@ -0,0 +1,312 @@
+"""Roteamento de chamadas entre modelos com cota, disjuntor, backoff e latência medida.
+
+Cada rota (modelo) tem um balde de tokens com a cota de requisições por minuto e
+um disjuntor: um erro de cota abre o disjuntor até a janela da cota reabrir (o
+tempo sugerido pela API, quando vem na mensagem), e falhas transitórias seguidas
+o abrem por um intervalo curto. As rotas são tentadas em ordem de preferência,
+pulando as bloqueadas; uma rota cuja latência média passa do orçamento vai para
+o fim da fila por um intervalo, depois do qual volta a ser testada (em streaming
+vale a duração do stream inteiro; o tempo até o primeiro chunk fica numa média à
+parte). Se nenhuma rota serviu numa rodada, espera-se um backoff exponencial com
+jitter antes da próxima. Só depende da biblioteca padrão; as classes de erro do
+SDK são passadas por quem cria o roteador.
+
+`python model_router.py` simula os dois casos com latências curtas: o modelo
+rebaixado por lentidão volta a ser o preferido depois da janela, e um erro no
+meio do stream abre o disjuntor da rota.
+"""
+import asyncio
+import random
+import re
+import threading
+import time
+
+_RETRY_AFTER_PATTERNS = [
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+    re.compile(r"retry in\s*([\d.]+)\s*s", re.IGNORECASE),
+]
+
+
+def retry_after_s(error, default):
+    """Seconds the API asked us to wait in `error`'s message, or `default`."""
+    message = str(error)
+    for pattern in _RETRY_AFTER_PATTERNS:
+        m = pattern.search(message)
+        if m: return float(m.group(1))
+    return default
+
+
+class TokenBucket:
+    """`rate_per_min` requests per minute with bursts of up to `capacity`."""
+
+    def __init__(self, rate_per_min, capacity=None):
+        self.rate_s = rate_per_min / 60.0
+        self.capacity = float(capacity or rate_per_min)
+        self.tokens, self._updated = self.capacity, time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate_s)
+        self._updated = now
+
+    def try_acquire(self, now):
+        self._refill(now)
+        if self.tokens < 1: return False
+        self.tokens -= 1
+        return True
+
+    def wait_s(self, now):
+        """Seconds until one token is available."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate_s
+
+
+class ModelRoute:
+    """One model behind the router: its bucket, circuit breaker state and latency EWMAs.
+
+    `latency_ewma_s` is the time to the complete answer (the one compared with the
+    budget); `first_chunk_ewma_s` the time to the first chunk of streamed calls.
+    A route whose average goes over the budget is demoted for `slow_cooldown_s`
+    (`slow_until`); the first answer measured after that window is a probe that
+    restarts the average, so the route is preferred again once it is fast again.
+    """
+
+    def __init__(self, name, model, rate_per_min, latency_budget_s=None, ewma_alpha=0.3, slow_cooldown_s=300.0):
+        self.name, self.model, self.latency_budget_s, self.ewma_alpha = name, model, latency_budget_s, ewma_alpha
+        self.slow_cooldown_s = slow_cooldown_s
+        self.bucket = TokenBucket(rate_per_min)
+        self.open_until = self.slow_until = 0.0
+        self.open_reason = None
+        self.consecutive_failures = 0
+        self.latency_ewma_s = self.first_chunk_ewma_s = None
+        self.calls = self.successes = self.quota_errors = self.transient_errors = self.throttled = 0
+
+    def is_open(self, now):
+        return now < self.open_until
+
+    def over_budget(self, now):
+        return now < self.slow_until
+
+    def record_latency(self, seconds, now):
+        if self.latency_budget_s is None:
+            self.latency_ewma_s = self._ewma(self.latency_ewma_s, seconds)
+            return
+        # Depois da janela de rebaixamento, a primeira medida recomeça a média em vez de ser diluída nela.
+        probe = self.latency_ewma_s is not None and self.latency_ewma_s > self.latency_budget_s \
+            and now >= self.slow_until
+        self.latency_ewma_s = seconds if probe else self._ewma(self.latency_ewma_s, seconds)
+        if self.latency_ewma_s > self.latency_budget_s: self.slow_until = now + self.slow_cooldown_s
+
+    def record_first_chunk(self, seconds):
+        self.first_chunk_ewma_s = self._ewma(self.first_chunk_ewma_s, seconds)
+
+    def _ewma(self, current, seconds):
+        return seconds if current is None else current + self.ewma_alpha * (seconds - current)
+
+    def stats(self, now):
+        return {"model": self.name, "state": f"aberto ({self.open_reason})" if self.is_open(now) else "fechado",
+                "open_for_s": round(max(0.0, self.open_until - now), 1), "tokens": round(self.bucket.tokens, 1),
+                "slow_for_s": round(max(0.0, self.slow_until - now), 1),
+                "latency_ewma_s": round(self.latency_ewma_s, 2) if self.latency_ewma_s is not None else None,
+                "first_chunk_ewma_s": round(self.first_chunk_ewma_s, 2) if self.first_chunk_ewma_s is not None else None,
+                "calls": self.calls, "successes": self.successes, "quota_errors": self.quota_errors,
+                "transient_errors": self.transient_errors, "throttled": self.throttled}
+
+
+class TimedStream:
+    """Iterable over a streamed response that reports back to the router while it is read.
+
+    An error raised mid-stream goes to `on_error(error)` (breaker and failure count)
+    before propagating; otherwise `on_done()` records the latency when the stream
+    ends or the reader abandons it.
+    """
+
+    def __init__(self, stream, on_done, on_error):
+        self._stream, self._on_done, self._on_error = stream, on_done, on_error
+
+    def __iter__(self):
+        failed = False
+        try:
+            yield from self._stream
+        except Exception as e:
+            failed = True
+            self._on_error(e)
+            raise
+        finally:
+            if not failed: self._on_done()
+
+
+class NoRouteAvailable(Exception):
+    """Every route is open or out of tokens and no call could be made."""
+
+
+class ModelRouter:
+    """Call `fn(model)` on the best available route; returns (result, route name).
+
+    `quota_errors` open the route's breaker until the quota window resets;
+    `transient_errors` count towards `failure_threshold` consecutive failures and
+    trigger the jittered backoff between rounds. Any other error propagates at once.
+    With ``stream=True`` the result is wrapped in a TimedStream: the call counts as
+    served when `fn` returns (the first chunk), its latency is recorded when the
+    caller finishes reading the stream, and errors while reading it update the
+    route like errors of the call itself (the caller still sees them).
+    """
+
+    def __init__(self, routes, quota_errors=(), transient_errors=(), max_rounds=4, base_delay_s=1.0,
+                 max_delay_s=20.0, quota_cooldown_s=60.0, failure_threshold=3, failure_cooldown_s=30.0,
+                 max_wait_s=10.0):
+        self.routes = list(routes)
+        self.quota_errors, self.transient_errors = tuple(quota_errors), tuple(transient_errors)
+        self.max_rounds, self.base_delay_s, self.max_delay_s = max_rounds, base_delay_s, max_delay_s
+        self.quota_cooldown_s, self.failure_threshold, self.failure_cooldown_s = \
+            quota_cooldown_s, failure_threshold, failure_cooldown_s
+        self.max_wait_s = max_wait_s
+        self._lock = threading.Lock()
+
+    def _candidates(self):
+        """Routes to try this round, in preference order, with over-budget routes moved to the end."""
+        now = time.monotonic()
+        with self._lock:
+            ready = [r for r in self.routes if not r.is_open(now)]
+            return [r for r in ready if not r.over_budget(now)] + [r for r in ready if r.over_budget(now)]
+
+    def _acquire(self, route):
+        with self._lock:
+            if route.bucket.try_acquire(time.monotonic()):
+                route.calls += 1
+                return True
+            route.throttled += 1
+            return False
+
+    def _on_success(self, route, elapsed_s, stream=False):
+        with self._lock:
+            route.successes += 1
+            route.consecutive_failures = 0
+            if stream: route.record_first_chunk(elapsed_s)
+            else: route.record_latency(elapsed_s, time.monotonic())
+
+    def _on_stream_done(self, route, elapsed_s):
+        with self._lock:
+            route.record_latency(elapsed_s, time.monotonic())
+
+    def _on_error(self, route, error):
+        """Update the route after a failed call; returns False if the error must propagate."""
+        now = time.monotonic()
+        with self._lock:
+            if isinstance(error, self.quota_errors):
+                route.quota_errors += 1
+                route.open_until = now + retry_after_s(error, self.quota_cooldown_s)
+                route.open_reason = "cota"
+                print(f"LOG: Cota do modelo {route.name} excedida; rota suspensa por "
+                      f"{route.open_until - now:.0f}s.")
+                return True
+            if isinstance(error, self.transient_errors):
+                route.transient_errors += 1
+                route.consecutive_failures += 1
+                if route.consecutive_failures >= self.failure_threshold:
+                    route.open_until, route.open_reason = now + self.failure_cooldown_s, "falhas"
+                    route.consecutive_failures = 0
+                return True
+            return False
+
+    def _delay_s(self, round_index):
+        """Full-jitter exponential backoff before round `round_index` (1-based)."""
+        return random.uniform(0, min(self.max_delay_s, self.base_delay_s * 2 ** (round_index - 1)))
+
+    def _idle_wait_s(self):
+        """How long to wait when no route could even be tried, or None if waiting is pointless."""
+        now = time.monotonic()
+        with self._lock:
+            waits = [max(r.open_until - now, r.bucket.wait_s(now)) for r in self.routes]
+        wait = min(waits) if waits else None
+        return wait if wait is not None and wait <= self.max_wait_s else None
+
+    def call(self, fn, stream=False):
+        last_error = None
+        for round_index in range(self.max_rounds):
+            tried = False
+            for route in self._candidates():
+                if not self._acquire(route): continue
+                tried, t0 = True, time.perf_counter()
+                try:
+                    result = fn(route.model)
+                except Exception as e:
+                    if not self._on_error(route, e): raise
+                    last_error = e
+                    continue
+                self._on_success(route, time.perf_counter() - t0, stream)
+                if stream:
+                    result = TimedStream(result,
+                                         lambda route=route, t0=t0: self._on_stream_done(route, time.perf_counter() - t0),
+                                         lambda error, route=route: self._on_error(route, error))
+                return result, route.name
+            wait = self._delay_s(round_index + 1) if tried else self._idle_wait_s()
+            if wait is None or round_index + 1 == self.max_rounds: break
+            time.sleep(wait)
+        raise last_error or NoRouteAvailable("Nenhum modelo disponível no momento (cota ou falhas recentes).")
+
+    async def call_async(self, fn):
+        """`call` for a coroutine function `fn(model)`; waits with asyncio.sleep."""
+        last_error = None
+        for round_index in range(self.max_rounds):
+            tried = False
+            for route in self._candidates():
+                if not self._acquire(route): continue
+                tried, t0 = True, time.perf_counter()
+                try:
+                    result = await fn(route.model)
+                except Exception as e:
+                    if not self._on_error(route, e): raise
+                    last_error = e
+                    continue
+                self._on_success(route, time.perf_counter() - t0)
+                return result, route.name
+            wait = self._delay_s(round_index + 1) if tried else self._idle_wait_s()
+            if wait is None or round_index + 1 == self.max_rounds: break
+            await asyncio.sleep(wait)
+        raise last_error or NoRouteAvailable("Nenhum modelo disponível no momento (cota ou falhas recentes).")
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [route.stats(now) for route in self.routes]
+
+
+def _demo():
+    """Rebaixamento que expira e erro no meio do stream, com tempos curtos."""
+    class Overloaded(Exception):
+        pass
+
+    pro = ModelRoute("pro", "pro", 600, latency_budget_s=0.05, slow_cooldown_s=0.3)
+    router = ModelRouter([pro, ModelRoute("flash", "flash", 600)], transient_errors=(Overloaded,),
+                         failure_threshold=1, base_delay_s=0.01)
+    order = lambda: [r.name for r in router._candidates()]
+
+    def answer(delay_s):
+        def fn(model):
+            time.sleep(delay_s if model == "pro" else 0.0)
+            return model
+        return fn
+
+    print("início:", order())
+    print("chamada lenta servida por", router.call(answer(0.1))[1], "->", order())
+    print("durante a janela:", router.call(answer(0.0))[1], "->", order())
+    time.sleep(0.35)
+    print("após a janela (sonda rápida):", router.call(answer(0.0))[1], "->", order())
+    assert order()[0] == "pro"
+
+    def broken(model):
+        def chunks():
+            yield "primeiro"
+            raise Overloaded("503 no meio do stream")
+        return chunks()
+
+    stream, name = router.call(broken, stream=True)
+    try:
+        list(stream)
+    except Overloaded as e:
+        print(f"erro no stream de {name}: {e} -> rotas disponíveis: {order()}")
+    assert order() == ["flash"]
+
+
+if __name__ == "__main__":
+    _demo()
@@ -0,0 +1,114 @@
+"""Cache persistente das respostas da IA em SQLite (arquivo local, sem servidor).
+
+A chave é o hash do modelo, do prompt completo e do conteúdo de cada anexo
+(file_parts), então clicar de novo com as mesmas entradas devolve a resposta
+gravada em vez de pagar outra chamada. Entradas expiram por TTL e, acima do
+limite de entradas ou de bytes, as menos usadas recentemente são descartadas.
+O arquivo é compartilhado por todas as sessões e processos que apontam para ele.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def _part_digest(part):
+    """Bytes identifying one file part, or None if its type is not known (the call is then not cached)."""
+    if isinstance(part, str): return b"text\x00" + part.encode("utf-8")
+    if isinstance(part, (bytes, bytearray)): return b"bytes\x00" + bytes(part)
+    if isinstance(part, dict) and "data" in part:
+        data = part["data"]
+        data = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+        return f"blob\x00{part.get('mime_type', '')}\x00".encode("utf-8") + data
+    if hasattr(part, "tobytes") and hasattr(part, "mode") and hasattr(part, "size"):
+        # Imagens PIL: modo e dimensões entram na chave junto com os pixels.
+        return f"image\x00{part.mode}\x00{part.size}\x00".encode("utf-8") + part.tobytes()
+    return None
+
+
+class ResponseCache:
+    """SQLite-backed response cache with TTL, LRU eviction by entry count and total size, and hit metrics.
+
+    Counters are per process; `stats()` adds the entries and bytes stored in the file.
+    """
+
+    def __init__(self, path, ttl_s=7 * 24 * 3600, max_entries=2000, max_bytes=50 * 1024 * 1024):
+        self.path, self.ttl_s, self.max_entries, self.max_bytes = path, ttl_s, max_entries, max_bytes
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT NOT NULL, "
+                               "created REAL NOT NULL, accessed REAL NOT NULL, size INTEGER NOT NULL, "
+                               "response TEXT NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.hits = self.misses = self.bypassed = self.uncacheable = self.writes = self.evictions = 0
+
+    @staticmethod
+    def key_for(model, prompt_text, file_parts=None):
+        """Hex key for a call, or None when some file part cannot be hashed."""
+        digest = hashlib.sha256(f"{model}\x00{prompt_text}".encode("utf-8"))
+        for part in file_parts or ():
+            part_bytes = _part_digest(part)
+            if part_bytes is None: return None
+            digest.update(b"\x00" + hashlib.sha256(part_bytes).digest())
+        return digest.hexdigest()
+
+    def get(self, key, bypass=False):
+        """(response, model) stored for `key`, or None if absent, expired, uncacheable (key None) or bypassed."""
+        now = time.time()
+        with self._lock, self._conn:
+            if key is None:
+                self.uncacheable += 1
+                return None
+            if bypass:
+                self.bypassed += 1
+                return None
+            row = self._conn.execute("SELECT created, response, model FROM responses WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is not None and now - row[0] <= self.ttl_s:
+                self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return row[1], row[2]
+            if row is not None:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.evictions += 1
+            self.misses += 1
+        return None
+
+    def put(self, key, model, response):
+        """Store `response` (served by `model`), then enforce TTL and the size limits."""
+        if key is None: return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                               (key, model, now, now, len(response.encode("utf-8")), response))
+            self.writes += 1
+            self._evict(now)
+
+    def _evict(self, now):
+        removed = self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_s,)).rowcount
+        entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if entries > self.max_entries or total > self.max_bytes:
+            # Mais antigas por último acesso primeiro, até caber nos dois limites.
+            for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+                if entries <= self.max_entries and total <= self.max_bytes: break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                entries, total, removed = entries - 1, total - size, removed + 1
+        self.evictions += removed
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {"path": self.path, "entries": entries, "bytes": total, "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes, "ttl_s": self.ttl_s, "hits": self.hits, "misses": self.misses,
+                "bypassed": self.bypassed, "uncacheable": self.uncacheable, "writes": self.writes,
+                "evictions": self.evictions, "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}